@@ -0,0 +1,12 @@
+import os
+import sys
+
+# Modules in this package import each other by their top-level names
+# (`models`, `wabinary`, `utils`...), so this directory has to be on the path.
+# It is appended rather than prepended: src/socket and src/types would
+# otherwise shadow the stdlib modules of the same name. This lets the
+# socket package be run from the repository root, e.g.
+# `python -m src.socket.benchmark`.
+_SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SRC_DIR not in sys.path:
+    sys.path.append(_SRC_DIR)
@@ -1,174 +1,761 @@
-from typing import List, Union, Dict, TypedDict
+import zlib
+from collections import OrderedDict
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Iterable, Iterator, List, Optional, Tuple, Union, Dict, TypedDict
+from cachetools import LRUCache
 from wabinary.constants import BinaryNodeCodingOptions
-from wabinary.jid import FullJid, jid_decode
+from wabinary.jid import FullJid, jid_decode, jid_encode
 
 class BinaryNode(TypedDict):
     tag: str
     attrs: Dict[str, str]
-    content: Union[List["BinaryNode"], str, bytes]
+    content: Union[List["BinaryNode"], str, bytes, memoryview]
 
-def encode_binary_node(node: BinaryNode, opts: BinaryNodeCodingOptions = BinaryNodeCodingOptions, buffer: bytearray = bytearray()) -> bytes:
-    encoded = encode_binary_node_inner(node, opts, buffer)
-    return bytes(encoded)
+class CompactBinaryNode(MutableMapping):
+    """
+    `__slots__` based node, interchangeable with the `BinaryNode` dict.
 
-def encode_binary_node_inner(node: BinaryNode, opts: BinaryNodeCodingOptions, buffer: bytearray) -> bytearray:
-    TAGS = opts.TAGS
-    TOKEN_MAP = opts.TOKEN_MAP
+    It supports both `node['tag']` style access, as used by the encoder and the
+    `wabinary.generic` helpers, and `node.tag` attribute access, while taking a
+    fraction of the memory of a dict. Missing content is stored as None and is
+    not reported as a key, matching a dict without a `content` entry.
+    """
+
+    __slots__ = ('tag', 'attrs', 'content')
+
+    _KEYS = ('tag', 'attrs', 'content')
+
+    def __init__(self, tag: str, attrs: Optional[Dict[str, str]] = None, content: Optional[Union[List[BinaryNode], str, bytes, memoryview]] = None) -> None:
+        self.tag = tag
+        self.attrs = {} if attrs is None else attrs
+        self.content = content
+
+    @classmethod
+    def from_node(cls, node: BinaryNode) -> "CompactBinaryNode":
+        """Convert a node, and all of its children, to the compact form."""
+        content = node.get('content')
+        if isinstance(content, list):
+            content = [cls.from_node(item) for item in content]
+        return cls(node['tag'], dict(node['attrs']), content)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._KEYS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        # overridden so a missing `content` doesn't cost a raised KeyError
+        if key in self._KEYS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        return default
 
-    def push_byte(value: int) -> None:
-        buffer.append(value & 0xff)
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in self._KEYS:
+            raise KeyError(key)
+        setattr(self, key, value)
 
-    def push_int(value: int, n: int, little_endian: bool = False) -> None:
-        for i in range(n):
-            cur_shift = i if little_endian else n - 1 - i
-            buffer.append((value >> (cur_shift * 8)) & 0xff)
+    def __delitem__(self, key: str) -> None:
+        if key != 'content' or self.content is None:
+            raise KeyError(key)
+        self.content = None
 
-    def push_bytes(bytes_: Union[bytearray, bytes, List[int]]) -> None:
-        buffer.extend(bytes_)
+    def __iter__(self):
+        yield 'tag'
+        yield 'attrs'
+        if self.content is not None:
+            yield 'content'
 
-    def push_int16(value: int) -> None:
-        push_bytes([(value >> 8) & 0xff, value & 0xff])
+    def __len__(self) -> int:
+        return 2 if self.content is None else 3
+
+    def __repr__(self) -> str:
+        return f'CompactBinaryNode(tag={self.tag!r}, attrs={self.attrs!r}, content={self.content!r})'
+
+# Packed strings are converted through their hex representation: translating
+# each character to the hex digit of its nibble lets `bytes.fromhex` validate
+# and pack the whole string in C. Characters outside the alphabet map to '!',
+# which `bytes.fromhex` rejects.
+_INVALID_PACKED_CHAR = '!'
+_NIBBLE_PACK_TABLE = ''.join(
+    c if '0' <= c <= '9' else {'-': 'a', '.': 'b'}.get(c, _INVALID_PACKED_CHAR)
+    for c in map(chr, range(128))
+)
+_HEX_PACK_TABLE = ''.join(
+    c if c in '0123456789ABCDEFabcdef' else ('f' if c == '\0' else _INVALID_PACKED_CHAR)
+    for c in map(chr, range(128))
+)
+_NIBBLE_UNPACK_TABLE = str.maketrans({'a': '-', 'b': '.', 'c': _INVALID_PACKED_CHAR, 'd': _INVALID_PACKED_CHAR, 'e': _INVALID_PACKED_CHAR, 'f': '\0'})
+# Both alphabets in one table, for classifying a string with a single translate:
+# '-' and '.' become lowercase digits and the hex letters uppercase ones (and
+# `bytes.fromhex` reads both cases), so the case of the result tells which
+# packing, if any, the string allows.
+_CLASSIFY_PACK_TABLE = ''.join(
+    c if '0' <= c <= '9' else
+    {'-': 'a', '.': 'b', '\0': 'F'}.get(c, c.upper() if c in 'ABCDEFabcdef' else _INVALID_PACKED_CHAR)
+    for c in map(chr, range(128))
+)
+
+def _pack(s: str, table: str) -> Optional[bytes]:
+    digits = s.translate(table)
+    if len(s) % 2:
+        digits += 'f'
+    try:
+        return bytes.fromhex(digits)
+    except ValueError:
+        return None
+
+def pack_nibbles(s: str) -> Optional[bytes]:
+    """Pack a string of digits, '-' and '.' two characters per byte, or return None if it has other characters."""
+    return _pack(s, _NIBBLE_PACK_TABLE)
+
+def pack_hex(s: str) -> Optional[bytes]:
+    """Pack a hex string two characters per byte, or return None if it is not valid hex."""
+    return _pack(s, _HEX_PACK_TABLE)
+
+def classify_packed(s: str) -> Tuple[Optional[str], Optional[bytes]]:
+    """
+    Return ('nibble' or 'hex', packed bytes) for a string that can be packed,
+    nibble first as the encoder prefers it, or (None, None). The length limit
+    is up to the caller.
+    """
+    # characters past the table are left as they are, so non-ASCII strings are ruled out first
+    if not s.isascii():
+        return None, None
+    digits = s.translate(_CLASSIFY_PACK_TABLE)
+    if _INVALID_PACKED_CHAR in digits:
+        return None, None
+    if digits.isupper():
+        type_ = 'hex'
+    elif not digits or digits.isdigit() or digits.islower():
+        type_ = 'nibble'
+    else:
+        # '-' or '.' mixed with hex letters
+        return None, None
+    return type_, bytes.fromhex(digits + 'f' if len(s) % 2 else digits)
 
-    def push_int20(value: int) -> None:
-        push_bytes([(value >> 16) & 0x0f, (value >> 8) & 0xff, value & 0xff])
+def unpack_nibbles(packed: Union[bytes, bytearray, memoryview], odd: bool = False) -> str:
+    value = packed.hex().translate(_NIBBLE_UNPACK_TABLE)
+    if _INVALID_PACKED_CHAR in value:
+        raise ValueError(f'invalid nibble to unpack: {packed.hex()}')
+    return value[:-1] if odd else value
 
-    def write_byte_length(length: int) -> None:
+def unpack_hex(packed: Union[bytes, bytearray, memoryview], odd: bool = False) -> str:
+    value = packed.hex().upper()
+    return value[:-1] if odd else value
+
+# Attribute values repeat a lot (message ids echoed in receipts, our own JID,
+# 'to'/'from' servers), so the encoded form of short strings is memoized rather
+# than classified again on every write. There is one cache per coding options,
+# and when it is full the least recently used entry goes.
+STRING_CACHE_MAX_LENGTH = 64
+STRING_CACHE_SIZE = 8192
+_string_caches: Dict[Any, OrderedDict] = {}
+
+class BinaryNodeEncoder:
+    """
+    Writes binary nodes into a single `bytearray`.
+
+    One encoder is created per frame and every child node is written through
+    the same instance, so no per-node state is rebuilt while walking the tree.
+    Passing an existing `buffer` appends the encoded frame to it in place.
+    """
+
+    def __init__(self, opts: BinaryNodeCodingOptions = BinaryNodeCodingOptions, buffer: Optional[bytearray] = None) -> None:
+        self.opts = opts
+        self.tags = opts.TAGS
+        self.token_bytes = opts.TOKEN_BYTES
+        self.string_cache = _string_caches.setdefault(opts, OrderedDict())
+        self.buffer = bytearray() if buffer is None else buffer
+
+    def push_byte(self, value: int) -> None:
+        self.buffer.append(value & 0xff)
+
+    def push_int(self, value: int, n: int, little_endian: bool = False) -> None:
+        self.buffer += value.to_bytes(n, 'little' if little_endian else 'big')
+
+    def push_bytes(self, bytes_: Union[bytearray, bytes, memoryview, List[int]]) -> None:
+        self.buffer += bytes_
+
+    def push_int16(self, value: int) -> None:
+        self.buffer.extend(((value >> 8) & 0xff, value & 0xff))
+
+    def push_int20(self, value: int) -> None:
+        self.buffer.extend(((value >> 16) & 0x0f, (value >> 8) & 0xff, value & 0xff))
+
+    def write_byte_length(self, length: int) -> None:
         if length >= 4294967296:
             raise ValueError('string too large to encode: ' + str(length))
 
         if length >= 1 << 20:
-            push_byte(TAGS['BINARY_32'])
-            push_int(length, 4)  # 32 bit integer
+            self.push_byte(self.tags['BINARY_32'])
+            self.push_int(length, 4)  # 32 bit integer
         elif length >= 256:
-            push_byte(TAGS['BINARY_20'])
-            push_int20(length)
+            self.push_byte(self.tags['BINARY_20'])
+            self.push_int20(length)
         else:
-            push_byte(TAGS['BINARY_8'])
-            push_byte(length)
+            self.buffer.extend((self.tags['BINARY_8'], length))
 
-    def write_string_raw(s: str) -> None:
+    def write_string_raw(self, s: str) -> None:
         bytes_ = s.encode('utf-8')
-        write_byte_length(len(bytes_))
-        push_bytes(bytes_)
-
-    def write_jid(jid: FullJid) -> None:
-        if jid.get('device') is not None:
-            push_byte(TAGS['AD_JID'])
-            push_byte(jid.get('domainType', 0))
-            push_byte(jid.get('device', 0))
-            write_string(jid['user'])
+        self.write_byte_length(len(bytes_))
+        self.buffer += bytes_
+
+    def write_jid(self, jid: FullJid) -> None:
+        tags = self.tags
+        if jid.device is not None:
+            self.buffer.extend((tags['AD_JID'], jid.domainType & 0xff, jid.device & 0xff))
+            self.write_string(jid.user)
         else:
-            push_byte(TAGS['JID_PAIR'])
-            if jid['user']:
-                write_string(jid['user'])
+            self.push_byte(tags['JID_PAIR'])
+            if jid.user:
+                self.write_string(jid.user)
             else:
-                push_byte(TAGS['LIST_EMPTY'])
-            write_string(jid['server'])
-
-    def pack_nibble(char: str) -> int:
-        if char == '-':
-            return 10
-        elif char == '.':
-            return 11
-        elif char == '\0':
-            return 15
-        elif '0' <= char <= '9':
-            return ord(char) - ord('0')
-        else:
-            raise ValueError(f'invalid byte for nibble "{char}"')
-
-    def pack_hex(char: str) -> int:
-        if '0' <= char <= '9':
-            return ord(char) - ord('0')
-        elif 'A' <= char <= 'F':
-            return 10 + ord(char) - ord('A')
-        elif 'a' <= char <= 'f':
-            return 10 + ord(char) - ord('a')
-        elif char == '\0':
-            return 15
-        else:
-            raise ValueError(f'Invalid hex char "{char}"')
+                self.push_byte(tags['LIST_EMPTY'])
+            self.write_string(jid.server)
 
-    def write_packed_bytes(s: str, type_: str) -> None:
-        if len(s) > TAGS['PACKED_MAX']:
+    def write_packed(self, tag: int, length: int, packed: bytes) -> None:
+        self.buffer.extend((tag, len(packed) | (128 if length % 2 else 0)))
+        self.buffer += packed
+
+    def write_packed_bytes(self, s: str, type_: str) -> None:
+        if len(s) > self.tags['PACKED_MAX']:
             raise ValueError('Too many bytes to pack')
 
-        push_byte(TAGS['NIBBLE_8'] if type_ == 'nibble' else TAGS['HEX_8'])
+        packed = pack_nibbles(s) if type_ == 'nibble' else pack_hex(s)
+        if packed is None:
+            raise ValueError(f'invalid string for {type_} packing "{s}"')
+        self.write_packed(self.tags['NIBBLE_8'] if type_ == 'nibble' else self.tags['HEX_8'], len(s), packed)
 
-        rounded_length = -(-len(s) // 2)
-        if len(s) % 2 != 0:
-            rounded_length |= 128
+    def write_string(self, s: str) -> None:
+        token = self.token_bytes.get(s)
+        if token is not None:
+            self.buffer += token
+        elif len(s) <= STRING_CACHE_MAX_LENGTH:
+            cache = self.string_cache
+            encoded = cache.get(s)
+            if encoded is not None:
+                cache.move_to_end(s)
+                self.buffer += encoded
+                return
+            # a miss is written in place and the written bytes are kept, so it costs no more than an uncached write
+            start = len(self.buffer)
+            self.write_string_uncached(s)
+            if len(self.string_cache) >= STRING_CACHE_SIZE:
+                self.string_cache.popitem(last=False)
+            self.string_cache[s] = bytes(self.buffer[start:])
+        else:
+            self.write_string_uncached(s)
 
-        push_byte(rounded_length)
-        pack_function = pack_nibble if type_ == 'nibble' else pack_hex
+    def write_string_uncached(self, s: str) -> None:
+        """Classify `s` as nibble, hex, JID or raw and write it; tokens are handled by `write_string`."""
+        if len(s) <= self.tags['PACKED_MAX']:
+            type_, packed = classify_packed(s)
+            if type_ is not None:
+                self.write_packed(self.tags['NIBBLE_8'] if type_ == 'nibble' else self.tags['HEX_8'], len(s), packed)
+                return
 
-        def pack_byte_pair(v1: str, v2: str) -> int:
-            return (pack_function(v1) << 4) | pack_function(v2)
+        decoded_jid = jid_decode(s)
+        if decoded_jid:
+            self.write_jid(decoded_jid)
+        else:
+            self.write_string_raw(s)
 
-        for i in range(len(s) // 2):
-            push_byte(pack_byte_pair(s[2 * i], s[2 * i + 1]))
+    def write_list_start(self, list_size: int) -> None:
+        tags = self.tags
+        if list_size == 0:
+            self.push_byte(tags['LIST_EMPTY'])
+        elif list_size < 256:
+            self.buffer.extend((tags['LIST_8'], list_size))
+        else:
+            self.push_byte(tags['LIST_16'])
+            self.push_int16(list_size)
 
-        if len(s) % 2 != 0:
-            push_byte(pack_byte_pair(s[-1], '\x00'))
+    def write_node(self, node: BinaryNode) -> bytearray:
+        valid_attributes = [(k, v) for k, v in node['attrs'].items() if v is not None]
+        content = node.get('content')
 
-    def is_nibble(s: str) -> bool:
-        if len(s) > TAGS['PACKED_MAX']:
-            return False
-        return all(char in '0123456789-.' for char in s)
+        self.write_list_start(2 * len(valid_attributes) + 1 + (1 if content is not None else 0))
+        self.write_string(node['tag'])
 
-    def is_hex(s: str) -> bool:
-        if len(s) > TAGS['PACKED_MAX']:
-            return False
-        return all(char in '0123456789ABCDEFabcdef' or char == '\0' for char in s)
+        for key, value in valid_attributes:
+            self.write_string(key)
+            self.write_string(value)
 
-    def write_string(s: str) -> None:
-        token_index = TOKEN_MAP.get(s)
-        if token_index:
-            if 'dict' in token_index:
-                push_byte(TAGS['DICTIONARY_0'] + token_index['dict'])
-            push_byte(token_index['index'])
-        elif is_nibble(s):
-            write_packed_bytes(s, 'nibble')
-        elif is_hex(s):
-            write_packed_bytes(s, 'hex')
+        if isinstance(content, str):
+            self.write_string(content)
+        elif isinstance(content, (bytes, bytearray, memoryview)):
+            self.write_byte_length(len(content))
+            self.buffer += content
+        elif isinstance(content, list):
+            self.write_list_start(len(content))
+            for item in content:
+                self.write_node(item)
+        elif content is None:
+            pass
         else:
-            decoded_jid = jid_decode(s)
-            if decoded_jid:
-                write_jid(decoded_jid)
-            else:
-                write_string_raw(s)
+            raise ValueError(f'invalid children for header "{node["tag"]}": {content} ({type(content)})')
 
-    def write_list_start(list_size: int) -> None:
-        if list_size == 0:
-            push_byte(TAGS['LIST_EMPTY'])
-        elif list_size < 256:
-            push_bytes([TAGS['LIST_8'], list_size])
+        return self.buffer
+
+def encode_string(s: str, opts: BinaryNodeCodingOptions = BinaryNodeCodingOptions) -> bytes:
+    """Encoded bytes of a single string, exactly as `BinaryNodeEncoder.write_string` writes it."""
+    encoder = BinaryNodeEncoder(opts)
+    encoder.write_string(s)
+    return bytes(encoder.buffer)
+
+def encode_binary_node(node: BinaryNode, opts: BinaryNodeCodingOptions = BinaryNodeCodingOptions, buffer: Optional[bytearray] = None) -> bytes:
+    return bytes(BinaryNodeEncoder(opts, buffer).write_node(node))
+
+def encode_binary_node_into(node: BinaryNode, buffer: bytearray, opts: BinaryNodeCodingOptions = BinaryNodeCodingOptions) -> bytearray:
+    """Append the encoded node to a caller supplied buffer and return that same buffer."""
+    return BinaryNodeEncoder(opts, buffer).write_node(node)
+
+def encode_binary_node_inner(node: BinaryNode, opts: BinaryNodeCodingOptions, buffer: bytearray) -> bytearray:
+    return encode_binary_node_into(node, buffer, opts)
+
+class _TemplateSlot:
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+class _TemplateEncoder(BinaryNodeEncoder):
+    """Encoder that cuts the output into segments wherever a template slot is written."""
+
+    def __init__(self, opts: BinaryNodeCodingOptions) -> None:
+        super().__init__(opts)
+        self.segments: List[bytes] = []
+        self.slots: List[str] = []
+
+    def write_string(self, s: Union[str, _TemplateSlot]) -> None:
+        if isinstance(s, _TemplateSlot):
+            self.segments.append(bytes(self.buffer))
+            self.slots.append(s.name)
+            self.buffer.clear()
         else:
-            push_byte(TAGS['LIST_16'])
-            push_int16(list_size)
+            super().write_string(s)
+
+class BinaryNodeTemplate:
+    """
+    A node encoded once with some attributes of its root left open.
 
-    valid_attributes = {k: v for k, v in node['attrs'].items() if v is not None}
+    The encoded bytes around each open attribute value are kept as segments, and
+    `render` only encodes the slot values and splices them in, so stanzas that
+    differ only in e.g. their `id` skip the full tree walk.
+    """
 
-    write_list_start(2 * len(valid_attributes) + 1 + (1 if node.get('content') is not None else 0))
-    write_string(node['tag'])
+    def __init__(self, node: BinaryNode, slots: Iterable[str] = ('id',), opts: BinaryNodeCodingOptions = BinaryNodeCodingOptions) -> None:
+        self.opts = opts
+        attrs = {
+            key: _TemplateSlot(key) if key in slots and value is not None else value
+            for key, value in node['attrs'].items()
+        }
+        encoder = _TemplateEncoder(opts)
+        encoder.write_node({**node, 'attrs': attrs})
+        self.segments = tuple(encoder.segments) + (bytes(encoder.buffer),)
+        self.slots = tuple(encoder.slots)
 
-    for key, value in valid_attributes.items():
-        write_string(key)
-        write_string(value)
+    def render(self, values: Mapping[str, str], buffer: Optional[bytearray] = None) -> bytearray:
+        encoder = BinaryNodeEncoder(self.opts, buffer)
+        for segment, slot in zip(self.segments, self.slots):
+            encoder.buffer += segment
+            encoder.write_string(values[slot])
+        encoder.buffer += self.segments[-1]
+        return encoder.buffer
 
+def binary_node_structure_key(node: BinaryNode, slots: Iterable[str] = ()) -> Tuple[Any, ...]:
+    """Hashable key for a node's structure, ignoring the values of the given root attributes."""
     content = node.get('content')
-    if isinstance(content, str):
-        write_string(content)
-    elif isinstance(content, (bytes, bytearray)):
-        write_byte_length(len(content))
-        push_bytes(content)
-    elif isinstance(content, list):
-        write_list_start(len(content))
-        for item in content:
-            encode_binary_node_inner(item, opts, buffer)
-    elif content is None:
-        pass
-    else:
-        raise ValueError(f'invalid children for header "{node["tag"]}": {content} ({type(content)})')
+    if isinstance(content, list):
+        content = tuple(binary_node_structure_key(item) for item in content)
+    elif isinstance(content, (bytearray, memoryview)):
+        content = bytes(content)
+    # a slot only matters by whether it has a value: None attributes are not encoded, so they get no slot
+    attrs = tuple((key, value is not None) if key in slots else (key, value) for key, value in node['attrs'].items())
+    return (node['tag'], attrs, content)
+
+class BinaryNodeTemplateCache:
+    """
+    Bounded LRU cache of `BinaryNodeTemplate`s keyed on node structure.
+
+    Meant for stanzas that are sent over and over with only a few root
+    attributes changing (pings, logout, pre-key uploads). Nodes with dynamic
+    content still work but simply evict each other.
+    """
+
+    def __init__(self, maxsize: int = 64, slots: Iterable[str] = ('id',), opts: BinaryNodeCodingOptions = BinaryNodeCodingOptions) -> None:
+        self.slots = tuple(slots)
+        self.opts = opts
+        self.templates: LRUCache = LRUCache(maxsize=maxsize)
+
+    def get_template(self, node: BinaryNode) -> BinaryNodeTemplate:
+        key = binary_node_structure_key(node, self.slots)
+        template = self.templates.get(key)
+        if template is None:
+            template = BinaryNodeTemplate(node, self.slots, self.opts)
+            self.templates[key] = template
+        return template
+
+    def encode(self, node: BinaryNode) -> bytes:
+        return bytes(self.get_template(node).render(node['attrs']))
+
+class BinaryNodeDecoder:
+    """
+    Reads binary nodes out of a buffer, the inverse of `encode_binary_node`.
+
+    The buffer is wrapped in a `memoryview` and consumed through the `offset`
+    cursor, so byte content is returned as a slice of the original buffer
+    rather than a copy. Several nodes written back to back can be read by
+    calling `read_node` repeatedly.
+    """
+
+    def __init__(self, buffer: Union[bytes, bytearray, memoryview], opts: BinaryNodeCodingOptions = BinaryNodeCodingOptions, offset: int = 0, compact: bool = False) -> None:
+        self.buffer = memoryview(buffer)
+        self.offset = offset
+        self.opts = opts
+        self.compact = compact
+        self.tags = opts.TAGS
+        self.token_table = opts.TOKEN_TABLE
+        self.single_byte_count = len(opts.SINGLE_BYTE_TOKENS)
+
+    def check_eos(self, length: int) -> None:
+        if self.offset + length > len(self.buffer):
+            raise ValueError('end of stream')
+
+    def read_byte(self) -> int:
+        self.check_eos(1)
+        value = self.buffer[self.offset]
+        self.offset += 1
+        return value
+
+    def read_bytes(self, n: int) -> memoryview:
+        self.check_eos(n)
+        value = self.buffer[self.offset:self.offset + n]
+        self.offset += n
+        return value
+
+    def read_string_from_chars(self, length: int) -> str:
+        return str(self.read_bytes(length), 'utf-8')
+
+    def read_int(self, n: int, little_endian: bool = False) -> int:
+        return int.from_bytes(self.read_bytes(n), 'little' if little_endian else 'big')
+
+    def read_int20(self) -> int:
+        value = self.read_bytes(3)
+        return ((value[0] & 0x0f) << 16) | (value[1] << 8) | value[2]
+
+    def read_packed8(self, tag: int) -> str:
+        start_byte = self.read_byte()
+        unpack = unpack_nibbles if tag == self.tags['NIBBLE_8'] else unpack_hex
+        return unpack(self.read_bytes(start_byte & 127), bool(start_byte >> 7))
+
+    def is_list_tag(self, tag: int) -> bool:
+        return tag in (self.tags['LIST_EMPTY'], self.tags['LIST_8'], self.tags['LIST_16'])
+
+    def read_list_size(self, tag: int) -> int:
+        if tag == self.tags['LIST_EMPTY']:
+            return 0
+        elif tag == self.tags['LIST_8']:
+            return self.read_byte()
+        elif tag == self.tags['LIST_16']:
+            return self.read_int(2)
+        raise ValueError(f'invalid tag for list size: {tag}')
+
+    def read_jid_pair(self) -> str:
+        user = self.read_string(self.read_byte())
+        server = self.read_string(self.read_byte())
+        if server:
+            return jid_encode(user or '', server)
+        raise ValueError(f'invalid jid pair: {user}, {server}')
+
+    def read_ad_jid(self) -> str:
+        domain_type = self.read_byte()
+        device = self.read_byte()
+        user = self.read_string(self.read_byte())
+        return jid_encode(user, 's.whatsapp.net' if domain_type == 0 else 'lid', device)
+
+    def get_token_double(self, index1: int, index2: int) -> str:
+        position = ((index1 + 1) << 8) | index2
+        token = self.token_table[position] if position < len(self.token_table) else None
+        if token is None:
+            raise ValueError(f'invalid double token index ({index1}, {index2})')
+        return token
+
+    def read_string(self, tag: int) -> str:
+        tags = self.tags
+        if 1 <= tag < self.single_byte_count:
+            return self.token_table[tag] or ''
+
+        if tags['DICTIONARY_0'] <= tag <= tags['DICTIONARY_3']:
+            return self.get_token_double(tag - tags['DICTIONARY_0'], self.read_byte())
+        elif tag == tags['LIST_EMPTY']:
+            return ''
+        elif tag == tags['BINARY_8']:
+            return self.read_string_from_chars(self.read_byte())
+        elif tag == tags['BINARY_20']:
+            return self.read_string_from_chars(self.read_int20())
+        elif tag == tags['BINARY_32']:
+            return self.read_string_from_chars(self.read_int(4))
+        elif tag == tags['JID_PAIR']:
+            return self.read_jid_pair()
+        elif tag == tags['AD_JID']:
+            return self.read_ad_jid()
+        elif tag == tags['HEX_8'] or tag == tags['NIBBLE_8']:
+            return self.read_packed8(tag)
+        raise ValueError(f'invalid string with tag: {tag}')
+
+    def read_content(self, content_tag: int) -> Union[List[BinaryNode], str, memoryview]:
+        tags = self.tags
+        if self.is_list_tag(content_tag):
+            return [self.read_node() for _ in range(self.read_list_size(content_tag))]
+        elif content_tag == tags['BINARY_8']:
+            return self.read_bytes(self.read_byte())
+        elif content_tag == tags['BINARY_20']:
+            return self.read_bytes(self.read_int20())
+        elif content_tag == tags['BINARY_32']:
+            return self.read_bytes(self.read_int(4))
+        return self.read_string(content_tag)
+
+    def read_node(self) -> BinaryNode:
+        list_size = self.read_list_size(self.read_byte())
+        if not list_size:
+            raise ValueError('invalid node')
+
+        tag = self.read_string(self.read_byte())
+        attrs = {}
+        for _ in range((list_size - 1) >> 1):
+            key = self.read_string(self.read_byte())
+            attrs[key] = self.read_string(self.read_byte())
+
+        if self.compact:
+            content = self.read_content(self.read_byte()) if list_size % 2 == 0 else None
+            return CompactBinaryNode(tag, attrs, content)
+
+        node: BinaryNode = {'tag': tag, 'attrs': attrs}
+        if list_size % 2 == 0:
+            node['content'] = self.read_content(self.read_byte())
+
+        return node
+
+    def skip_string_at(self, offset: int, tag: int) -> int:
+        """Return the offset just past a string whose tag was read, without building it."""
+        buffer = self.buffer
+        tags = self.tags
+        while True:
+            if 1 <= tag < self.single_byte_count or tag == tags['LIST_EMPTY']:
+                return offset
+            elif tags['DICTIONARY_0'] <= tag <= tags['DICTIONARY_3']:
+                return offset + 1
+            elif tag == tags['BINARY_8']:
+                return offset + 1 + buffer[offset]
+            elif tag == tags['BINARY_20']:
+                return offset + 3 + (((buffer[offset] & 0x0f) << 16) | (buffer[offset + 1] << 8) | buffer[offset + 2])
+            elif tag == tags['BINARY_32']:
+                return offset + 4 + int.from_bytes(buffer[offset:offset + 4], 'big')
+            elif tag == tags['HEX_8'] or tag == tags['NIBBLE_8']:
+                return offset + 1 + (buffer[offset] & 127)
+            elif tag == tags['JID_PAIR']:
+                offset = self.skip_string_at(offset + 1, buffer[offset])
+            elif tag == tags['AD_JID']:
+                offset += 2
+            else:
+                raise ValueError(f'invalid string with tag: {tag}')
+            # the last string of a jid is skipped by looping rather than recursing
+            tag = buffer[offset]
+            offset += 1
+
+    def skip_string(self, tag: int) -> None:
+        """Move past a string without building it."""
+        try:
+            offset = self.skip_string_at(self.offset, tag)
+        except IndexError:
+            raise ValueError('end of stream')
+        if offset > len(self.buffer):
+            raise ValueError('end of stream')
+        self.offset = offset
+
+    def skip_node(self) -> None:
+        """Move past a whole node, children included, without building it."""
+        # children are written depth first, so skipping a node's children is
+        # just skipping that many more nodes
+        buffer = self.buffer
+        tags = self.tags
+        offset = self.offset
+        pending = 1
+        try:
+            while pending:
+                pending -= 1
+                self.offset = offset + 1
+                list_size = self.read_list_size(buffer[offset])
+                if not list_size:
+                    raise ValueError('invalid node')
+                offset = self.offset
+
+                for _ in range(list_size - (list_size % 2 == 0)):
+                    offset = self.skip_string_at(offset + 1, buffer[offset])
+
+                if list_size % 2 == 0:
+                    content_tag = buffer[offset]
+                    if content_tag == tags['LIST_8']:
+                        pending += buffer[offset + 1]
+                        offset += 2
+                    elif content_tag == tags['LIST_16']:
+                        pending += (buffer[offset + 1] << 8) | buffer[offset + 2]
+                        offset += 3
+                    elif content_tag == tags['LIST_EMPTY']:
+                        offset += 1
+                    else:
+                        offset = self.skip_string_at(offset + 1, content_tag)
+        except IndexError:
+            raise ValueError('end of stream')
+
+        if offset > len(buffer):
+            raise ValueError('end of stream')
+        self.offset = offset
+
+class LazyBinaryNode(Mapping):
+    """
+    Read-only view of an encoded node that decodes on first access.
+
+    It behaves like the `BinaryNode` dict (`tag`, `attrs` and, when present,
+    `content`), so it can be passed to the encoder and the `wabinary.generic`
+    helpers. The tag is read when the node is first touched, attributes when
+    `attrs` is first read, and children are only located (not decoded) when
+    `content` is first read; each child is itself a `LazyBinaryNode`.
+    """
+
+    __slots__ = ('_buffer', '_offset', '_opts', '_tag', '_list_size', '_attrs_offset', '_attrs', '_content')
+
+    _UNSET = object()
+
+    def __init__(self, buffer: Union[bytes, bytearray, memoryview], offset: int = 0, opts: BinaryNodeCodingOptions = BinaryNodeCodingOptions) -> None:
+        self._buffer = buffer if isinstance(buffer, memoryview) else memoryview(buffer)
+        self._offset = offset
+        self._opts = opts
+        self._tag = None
+        self._list_size = 0
+        self._attrs_offset = 0
+        self._attrs = None
+        self._content = self._UNSET
+
+    def _decoder(self, offset: int) -> BinaryNodeDecoder:
+        return BinaryNodeDecoder(self._buffer, self._opts, offset)
+
+    def _load_header(self) -> None:
+        if self._tag is not None:
+            return
+        decoder = self._decoder(self._offset)
+        list_size = decoder.read_list_size(decoder.read_byte())
+        if not list_size:
+            raise ValueError('invalid node')
+        self._tag = decoder.read_string(decoder.read_byte())
+        self._list_size = list_size
+        self._attrs_offset = decoder.offset
+
+    @property
+    def tag(self) -> str:
+        self._load_header()
+        return self._tag
+
+    @property
+    def attrs(self) -> Dict[str, str]:
+        if self._attrs is None:
+            self._load_header()
+            decoder = self._decoder(self._attrs_offset)
+            attrs = {}
+            for _ in range((self._list_size - 1) >> 1):
+                key = decoder.read_string(decoder.read_byte())
+                attrs[key] = decoder.read_string(decoder.read_byte())
+            self._attrs = attrs
+        return self._attrs
+
+    @property
+    def has_content(self) -> bool:
+        self._load_header()
+        return self._list_size % 2 == 0
+
+    @property
+    def content(self) -> Optional[Union[List["LazyBinaryNode"], str, memoryview]]:
+        if self._content is self._UNSET:
+            if not self.has_content:
+                self._content = None
+                return None
+
+            decoder, content_tag = self._read_content_tag()
+            if decoder.is_list_tag(content_tag):
+                self._content = list(self._locate_children(decoder, content_tag))
+            else:
+                self._content = decoder.read_content(content_tag)
+        return self._content
+
+    def iter_children(self) -> Iterator["LazyBinaryNode"]:
+        """
+        The children, each located only once the previous one has been
+        handled, so a lookup that stops at its match never scans the rest.
+        Until `content` is read, every call locates them afresh.
+        """
+        if self._content is not self._UNSET or not self.has_content:
+            content = self.content
+            return iter(content if isinstance(content, list) else ())
+        decoder, content_tag = self._read_content_tag()
+        if not decoder.is_list_tag(content_tag):
+            return iter(())
+        return self._locate_children(decoder, content_tag)
+
+    def _read_content_tag(self) -> Tuple[BinaryNodeDecoder, int]:
+        decoder = self._decoder(self._attrs_offset)
+        for _ in range(self._list_size - 2):
+            decoder.skip_string(decoder.read_byte())
+        return decoder, decoder.read_byte()
+
+    def _locate_children(self, decoder: BinaryNodeDecoder, content_tag: int) -> Iterator["LazyBinaryNode"]:
+        count = decoder.read_list_size(content_tag)
+        for i in range(count):
+            yield LazyBinaryNode(self._buffer, decoder.offset, self._opts)
+            # the last child's end is never needed, so don't scan it
+            if i < count - 1:
+                decoder.skip_node()
+
+    def __getitem__(self, key: str) -> Any:
+        if key == 'tag':
+            return self.tag
+        elif key == 'attrs':
+            return self.attrs
+        elif key == 'content' and self.has_content:
+            return self.content
+        raise KeyError(key)
+
+    def __iter__(self):
+        yield 'tag'
+        yield 'attrs'
+        if self.has_content:
+            yield 'content'
+
+    def __len__(self) -> int:
+        return 3 if self.has_content else 2
+
+    def __repr__(self) -> str:
+        return f'LazyBinaryNode(tag={self.tag!r}, offset={self._offset})'
+
+    def materialize(self) -> BinaryNode:
+        """Fully decode this node into a plain `BinaryNode` dict."""
+        return self._decoder(self._offset).read_node()
+
+def decode_binary_node(buffer: Union[bytes, bytearray, memoryview], opts: BinaryNodeCodingOptions = BinaryNodeCodingOptions, offset: int = 0, compact: bool = False) -> BinaryNode:
+    """Decode a node; with `compact` the tree is built from `CompactBinaryNode`s instead of dicts."""
+    return BinaryNodeDecoder(buffer, opts, offset, compact).read_node()
+
+def decode_binary_node_lazy(buffer: Union[bytes, bytearray, memoryview], opts: BinaryNodeCodingOptions = BinaryNodeCodingOptions, offset: int = 0) -> LazyBinaryNode:
+    return LazyBinaryNode(buffer, offset, opts)
+
+def decompressing_if_required(buffer: Union[bytes, bytearray, memoryview]) -> memoryview:
+    """Strip the leading frame flags byte and inflate the payload if it was zlib compressed."""
+    buffer = memoryview(buffer)
+    if buffer[0] & 2:
+        return memoryview(zlib.decompress(buffer[1:]))
+    return buffer[1:]
 
-    return buffer
+def decode_frame(buffer: Union[bytes, bytearray, memoryview], opts: BinaryNodeCodingOptions = BinaryNodeCodingOptions) -> BinaryNode:
+    return decode_binary_node(decompressing_if_required(buffer), opts)
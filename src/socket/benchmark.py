@@ -0,0 +1,438 @@
+import argparse
+import asyncio
+import dataclasses
+import json
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+from defaults.defaults import DEFAULT_CONNECTION_CONFIG, SocketConfig
+from models.other_models import BinaryNode, encode_binary_node
+from proto.waproto_pb2 import ClientPayload
+from utils.crypto_utils import GCM_TAG_SIZE, AesGcmContext, aes_encrypt_gcm
+from wabinary.jid import S_WHATSAPP_NET
+from tests.noise_peer import NoiseResponder, noise_handshake
+from .client.framing import FrameReassembler, FrameWriter
+from .client.mobile_socket_client import MobileSocketClient
+from .liveness import percentiles
+from .noise_handler import generate_iv
+from .session_manager import SessionManager
+from .socket import Socket
+
+# Socket benchmarks against a local stand-in server. Run from the repository
+# root, which has the tests directory the noise responder comes from:
+#
+#   python -m src.socket.benchmark --queries 500 --rtt-ms 50 --concurrency 64 --sessions 1000 --fuzz-rounds 200
+#
+# The stand-in runs the noise handshake, then answers every iq with an empty
+# result `rtt_ms` after receiving it. The run times sequential `Socket.query` calls against `Socket.query_many`
+# and counts the transport writes each one needs. It then opens `--sessions`
+# sockets through a `SessionManager` and reports the memory each one costs.
+# Finally it measures the TCP transport (`MobileSocketClient`) against a
+# local echo server: bulk throughput, and the round trip of small writes.
+# The frame reassembler is fuzzed with streams cut at random points and
+# timed in frames per second, both for whole websocket messages and for a
+# TCP stream read in chunks. Last, a `NoiseHandler` completes the XX
+# handshake with the test suite's stand-in responder (tests/noise_peer.py)
+# and the encrypted frames per second are measured in each direction, for
+# frames encoded one at a time and in batches. The AES-GCM per-frame latency
+# is compared for a new `Cipher` per call against a reused `AesGcmContext`.
+
+class LoopbackTransport:
+    """
+    In-process stand-in for the socket clients. Bytes sent go to a
+    `NoiseResponder`, and its replies come back `rtt_ms` later through
+    `on_frame`, reassembled and still encrypted, as from the real clients.
+    The responder's own buffers count towards `bench_sessions`' bytes per
+    session.
+    """
+
+    def __init__(self, rtt_ms: float = 0) -> None:
+        self._event_listeners: Dict[str, List[Callable[..., None]]] = {}
+        self.rtt_ms = rtt_ms
+        self.server = NoiseResponder()
+        self.frames = FrameReassembler()
+        self.on_frame: Optional[Callable[[memoryview], None]] = None
+        self.writes = 0
+
+    is_open = True
+    is_closed = False
+    is_closing = False
+    is_connecting = False
+
+    def on(self, event: str, listener: Callable[..., None]) -> None:
+        self._event_listeners.setdefault(event, []).append(listener)
+
+    def emit(self, event: str, *args: Any) -> None:
+        for listener in self._event_listeners.get(event, ()):
+            listener(*args)
+
+    def remove_listener(self, event: str, listener: Callable[..., None]) -> None:
+        self._event_listeners.get(event, []).remove(listener)
+
+    def _deliver(self, data: bytes) -> None:
+        if self.on_frame is not None:
+            for frame in self.frames.feed(data):
+                self.on_frame(frame)
+
+    def _receive(self, data: bytes) -> None:
+        for reply in self.server.receive(data):
+            asyncio.get_running_loop().call_later(self.rtt_ms / 1000, self._deliver, reply)
+
+    async def connect(self) -> None:
+        pass
+
+    async def send(self, data: bytes) -> bool:
+        self.writes += 1
+        self._receive(data)
+        return True
+
+    async def send_many(self, frames: List[bytes]) -> bool:
+        self.writes += 1
+        for data in frames:
+            self._receive(data)
+        return True
+
+    async def close(self) -> None:
+        pass
+
+
+class LoopbackSocket(Socket):
+    def _create_socket(self):
+        return LoopbackTransport()
+
+    def _client_payload(self):
+        # the stand-in doesn't check the login payload
+        return ClientPayload()
+
+
+def ping_node() -> BinaryNode:
+    return {
+        'tag': 'iq',
+        'attrs': {'to': S_WHATSAPP_NET, 'type': 'get', 'xmlns': 'w:p'},
+        'content': [{'tag': 'ping', 'attrs': {}}],
+    }
+
+async def connect_loopback_socket(rtt_ms: float, config: Optional[SocketConfig] = None) -> LoopbackSocket:
+    sock = LoopbackSocket(config or dataclasses.replace(DEFAULT_CONNECTION_CONFIG, auth=None))
+    sock.ws.rtt_ms = rtt_ms
+    await sock.connect()
+    # count only the writes of the queries that follow, not the handshake's
+    sock.ws.writes = 0
+    return sock
+
+async def bench_sequential(queries: int, rtt_ms: float) -> Dict[str, Any]:
+    sock = await connect_loopback_socket(rtt_ms)
+    start = time.perf_counter()
+    for _ in range(queries):
+        await sock.query(ping_node())
+    elapsed = time.perf_counter() - start
+    return {'seconds': elapsed, 'queries_per_sec': queries / elapsed, 'writes': sock.ws.writes}
+
+async def bench_query_many(queries: int, rtt_ms: float, concurrency: int) -> Dict[str, Any]:
+    sock = await connect_loopback_socket(rtt_ms)
+    start = time.perf_counter()
+    results = await sock.query_many([ping_node() for _ in range(queries)], concurrency=concurrency)
+    elapsed = time.perf_counter() - start
+    return {
+        'seconds': elapsed,
+        'queries_per_sec': queries / elapsed,
+        'writes': sock.ws.writes,
+        'errors': sum(isinstance(result, BaseException) for result in results),
+    }
+
+async def bench_sessions(sessions: int, rtt_ms: float) -> Dict[str, Any]:
+    config = dataclasses.replace(DEFAULT_CONNECTION_CONFIG, auth=None)
+    manager = SessionManager(config, max_concurrent_connects=sessions, connect_interval_ms=0, socket_factory=LoopbackSocket)
+
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        for i in range(sessions):
+            manager.add_session(f'account-{i}').ws.rtt_ms = rtt_ms
+        errors = await manager.connect_all()
+        elapsed = time.perf_counter() - start
+        allocated = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+
+    metrics = manager.metrics()
+    await manager.close()
+    return {
+        'sessions': sessions,
+        'connect_seconds': elapsed,
+        'bytes_per_session': allocated / sessions,
+        'connect_errors': sum(error is not None for error in errors.values()),
+        'timers': metrics['liveness']['timers'],
+    }
+
+async def _start_echo_server() -> tuple:
+    """Start a local echo server; returns it with the set of its running connection handler tasks."""
+    handlers = set()
+
+    async def echo(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        handlers.add(asyncio.current_task())
+        try:
+            while True:
+                data = await reader.read(256 * 1024)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        finally:
+            handlers.discard(asyncio.current_task())
+            writer.close()
+    return await asyncio.start_server(echo, '127.0.0.1', 0), handlers
+
+async def _stop_echo_server(server: asyncio.AbstractServer, handlers: set, timeout: float = 1.0) -> None:
+    server.close()
+    # once the client has closed, each handler reads EOF and returns; one that doesn't is cancelled
+    if handlers:
+        _, pending = await asyncio.wait(set(handlers), timeout=timeout)
+        for handler in pending:
+            handler.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    await server.wait_closed()
+
+async def bench_tcp_transport(megabytes: int = 64, frame_size: int = 16 * 1024, pings: int = 2000) -> Dict[str, Any]:
+    server, handlers = await _start_echo_server()
+    port = server.sockets[0].getsockname()[1]
+    client = MobileSocketClient(f'tcp://127.0.0.1:{port}')
+    await client.connect()
+
+    loop = asyncio.get_running_loop()
+    received = 0
+    target = 0
+    waiter = loop.create_future()
+
+    def on_data(view: memoryview) -> None:
+        nonlocal received
+        received += len(view)
+        if received >= target and not waiter.done():
+            waiter.set_result(None)
+    client.on_data = on_data
+
+    try:
+        frame = bytes(frame_size)
+        frames = megabytes * 1024 * 1024 // frame_size
+        target = frames * frame_size
+        start = time.perf_counter()
+        for _ in range(frames):
+            await client.send(frame)
+        await waiter
+        elapsed = time.perf_counter() - start
+
+        rtts = []
+        small = bytes(64)
+        for _ in range(pings):
+            target = received + len(small)
+            waiter = loop.create_future()
+            sent_at = time.perf_counter()
+            await client.send(small)
+            await waiter
+            rtts.append((time.perf_counter() - sent_at) * 1e6)
+    finally:
+        # the client goes first, then the handlers still serving it, so nothing is left pending
+        await client.close()
+        await _stop_echo_server(server, handlers)
+
+    return {
+        'megabytes': megabytes,
+        'frame_size': frame_size,
+        'throughput_mb_per_sec': target / elapsed / (1024 * 1024) if elapsed else 0.0,
+        'rtt_us': percentiles(rtts),
+    }
+
+def _random_frames(rng: random.Random, count: int) -> List[bytes]:
+    # mostly small frames, with the odd one larger than a single read
+    sizes = [rng.choice((0, 1, 2, 3, 17, 300)) if rng.random() < 0.3 else rng.randint(0, 2048) for _ in range(count)]
+    sizes[rng.randrange(count)] = rng.randint(64 * 1024, 300 * 1024)
+    return [rng.randbytes(size) for size in sizes]
+
+def check_reassembly(rounds: int = 200, seed: int = 0) -> Dict[str, Any]:
+    """Cut encoded streams at random points and check the reassembler returns exactly the frames that went in."""
+    rng = random.Random(seed)
+    failures = []
+    for round_ in range(rounds):
+        frames = _random_frames(rng, rng.randint(1, 60))
+        intro = rng.choice((None, b'WA\x06\x02'))
+        writer = FrameWriter(intro)
+        stream = b''.join(writer.encode(frame) for frame in frames)
+
+        cuts = sorted(rng.sample(range(1, len(stream)), min(len(stream) - 1, rng.randint(0, 40))))
+        reassembler = FrameReassembler(intro, initial_size=rng.choice((64, 4096, 64 * 1024)))
+        received = []
+        for start, end in zip([0] + cuts, cuts + [len(stream)]):
+            chunk = stream[start:end]
+            if rng.random() < 0.5:
+                # views are only valid until the next call, so copy them straight away
+                received += [bytes(frame) for frame in reassembler.feed(chunk)]
+                continue
+            # the protocol path: read straight into the reassembler's buffer
+            while chunk:
+                buffer = reassembler.get_buffer(-1)
+                n = min(len(buffer), len(chunk))
+                buffer[:n] = chunk[:n]
+                chunk = chunk[n:]
+                received += [bytes(frame) for frame in reassembler.advance(n)]
+
+        if received != frames or reassembler.pending:
+            failures.append(round_)
+    return {'rounds': rounds, 'failures': failures}
+
+def bench_reassembler(frames: int = 200_000, frame_size: int = 512, read_size: int = 64 * 1024) -> Dict[str, Any]:
+    writer = FrameWriter()
+    encoded = [writer.encode(bytes(frame_size)) for _ in range(1000)]
+    stream = b''.join(encoded) * (frames // 1000)
+    total = len(encoded) * (frames // 1000)
+
+    # one frame per websocket message
+    reassembler = FrameReassembler()
+    start = time.perf_counter()
+    count = 0
+    for _ in range(frames // 1000):
+        for message in encoded:
+            count += len(reassembler.feed(message))
+    messages_elapsed = time.perf_counter() - start
+
+    # a TCP stream read `read_size` bytes at a time, frames split across reads
+    reassembler = FrameReassembler(initial_size=4 * read_size)
+    view = memoryview(stream)
+    start = time.perf_counter()
+    for offset in range(0, len(stream), read_size):
+        chunk = view[offset:offset + read_size]
+        buffer = reassembler.get_buffer(len(chunk))
+        buffer[:len(chunk)] = chunk
+        count += len(reassembler.advance(len(chunk)))
+    stream_elapsed = time.perf_counter() - start
+
+    return {
+        'frames': total,
+        'frame_size': frame_size,
+        'frames_lost': 2 * total - count,
+        'messages_frames_per_sec': total / messages_elapsed,
+        'stream_frames_per_sec': total / stream_elapsed,
+        'stream_mb_per_sec': len(stream) / stream_elapsed / (1024 * 1024),
+    }
+
+def bench_noise(frames: int = 50_000, large_frame_size: int = 64 * 1024) -> Dict[str, Any]:
+    client, responder = noise_handshake(b'client payload')
+    node = ping_node()
+    node['attrs']['id'] = 'bench.1'
+    payload = b'\x00' + encode_binary_node(node)
+
+    start = time.perf_counter()
+    encoded = [client.encode_frame(payload) for _ in range(frames)]
+    encrypt_elapsed = time.perf_counter() - start
+
+    # the writer's path: batches of 64 frames encrypted into one buffer each
+    batch = [payload] * 64
+    start = time.perf_counter()
+    batches = [client.encode_frames(batch) for _ in range(frames // 64)]
+    batch_elapsed = time.perf_counter() - start
+
+    stream = b''.join(encoded) + b''.join(batches)
+    frames += len(batches) * 64
+    start = time.perf_counter()
+    decrypted = 0
+    noise = responder.noise
+    for offset in range(0, len(stream), 64 * 1024):
+        for frame in responder.frames.feed(stream[offset:offset + 64 * 1024]):
+            noise.decrypt(frame)
+            decrypted += 1
+    decrypt_elapsed = time.perf_counter() - start
+
+    # and one round trip through the node layer
+    [reply] = responder.receive(client.encode_frame(payload))
+    [frame] = FrameReassembler().feed(reply)
+    response = client.decode_frame(frame)
+
+    # media-sized frames, where the batch is encrypted in place instead of joined from per-frame ciphertexts
+    large = [b'\x00' + bytes(large_frame_size)] * 16
+    rounds = max(1, frames // 1000)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        b''.join(map(client.encode_frame, large))
+    joined_elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(rounds):
+        client.encode_frames(large)
+    large_batch_elapsed = time.perf_counter() - start
+
+    return {
+        'frames': frames,
+        'payload_size': len(payload),
+        'encrypt_frames_per_sec': len(encoded) / encrypt_elapsed,
+        'encrypt_batched_frames_per_sec': len(batches) * 64 / batch_elapsed,
+        'decrypt_frames_per_sec': decrypted / decrypt_elapsed,
+        'frames_lost': frames - decrypted,
+        'round_trip_ok': response['attrs'].get('type') == 'result',
+        'large_frame_size': large_frame_size,
+        'large_encrypt_joined_frames_per_sec': rounds * len(large) / joined_elapsed,
+        'large_encrypt_batched_frames_per_sec': rounds * len(large) / large_batch_elapsed,
+    }
+
+def bench_aead(frames: int = 20_000, payload_sizes: tuple = (64, 64 * 1024)) -> Dict[str, Any]:
+    """Mean AES-GCM encryption latency per frame, in microseconds."""
+    key = bytes(range(32))
+    aad = bytes(32)
+    context = AesGcmContext(key)
+    report = {}
+    for size in payload_sizes:
+        payload = bytes(size)
+        count = frames if size <= 4096 else max(100, frames // 20)
+        ivs = [generate_iv(i) for i in range(count)]
+        out = bytearray(size + GCM_TAG_SIZE)
+        plaintexts = [payload] * count
+        batch_out = bytearray(count * (size + GCM_TAG_SIZE))
+
+        def timed(run: Callable[[], None]) -> float:
+            start = time.perf_counter()
+            run()
+            return (time.perf_counter() - start) / count * 1e6
+
+        report[size] = {
+            'frames': count,
+            'cipher_per_call_us': timed(lambda: [aes_encrypt_gcm(payload, key, iv, aad) for iv in ivs]),
+            'context_us': timed(lambda: [context.encrypt(iv, payload, aad) for iv in ivs]),
+            'encrypt_into_us': timed(lambda: [context.encrypt_into(iv, payload, aad, out) for iv in ivs]),
+            'encrypt_many_us': timed(lambda: context.encrypt_many(ivs, plaintexts, aad, batch_out)),
+        }
+    return report
+
+async def run_benchmarks(queries: int = 500, rtt_ms: float = 50, concurrency: int = 64, sessions: int = 1000, fuzz_rounds: int = 200) -> Dict[str, Any]:
+    return {
+        'queries': queries,
+        'rtt_ms': rtt_ms,
+        'concurrency': concurrency,
+        'sequential': await bench_sequential(queries, rtt_ms),
+        'query_many': await bench_query_many(queries, rtt_ms, concurrency),
+        'sessions': await bench_sessions(sessions, rtt_ms),
+        'tcp_transport': await bench_tcp_transport(),
+        'reassembly_fuzz': check_reassembly(fuzz_rounds),
+        'reassembler': bench_reassembler(),
+        'noise': bench_noise(),
+        'aead': bench_aead(),
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Socket benchmarks against a loopback stand-in server')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--rtt-ms', type=float, default=50)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--fuzz-rounds', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_benchmarks(args.queries, args.rtt_ms, args.concurrency, args.sessions, args.fuzz_rounds))
+    print(json.dumps(report, indent=2))
+    failed = (
+        report['query_many']['errors'] or report['sessions']['connect_errors'] or report['reassembly_fuzz']['failures']
+        or report['noise']['frames_lost'] or not report['noise']['round_trip_ok']
+    )
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+from typing import List, Optional, Union
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# Every WA frame is prefixed with its length as a 3 byte big-endian integer.
+FRAME_HEADER_SIZE = 3
+MAX_FRAME_SIZE = (1 << 24) - 1
+
+# Free space requested from the buffer for each transport read.
+MIN_READ_SIZE = 16 * 1024
+
+
+class FrameReassembler:
+    """
+    Splits a byte stream into WA frames, shared by the websocket and TCP
+    transports.
+
+    Bytes accumulate in a linear ring buffer: it is written at the tail and
+    consumed from the head. Only when the tail runs out of room does the
+    unconsumed part (at most one partial frame) move back to the front.
+    Complete frames come out as memoryviews into that buffer, or into the
+    caller's data when nothing is pending. Several frames in one read and
+    frames split across reads both work. The views are only valid until
+    the next `feed`/`get_buffer` call, so consumers must process or copy
+    them first.
+
+    With `intro`, the stream must start with that header (NOISE_WA_HEADER or
+    MOBILE_NOISE_HEADER, as a responder sees it). It is checked and stripped
+    once.
+    """
+
+    def __init__(self, intro: Optional[bytes] = None, initial_size: int = 64 * 1024) -> None:
+        self.initial_size = initial_size
+        self._buffer = bytearray(initial_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self._intro = intro or b''
+
+    @property
+    def pending(self) -> int:
+        """Bytes received that don't form a complete frame yet."""
+        return self._end - self._start
+
+    def get_buffer(self, sizehint: int = -1) -> memoryview:
+        """Writable space at the tail, for reading straight into (see `BufferedProtocol.get_buffer`)."""
+        need = max(sizehint, MIN_READ_SIZE)
+        if len(self._buffer) - self._end < need:
+            self._make_room(need)
+        return self._view[self._end:]
+
+    def advance(self, nbytes: int) -> List[memoryview]:
+        """Account for `nbytes` written into the last `get_buffer` and return the frames now complete."""
+        self._end += nbytes
+        return self._parse()
+
+    def feed(self, data: Buffer) -> List[memoryview]:
+        """Add received bytes and return the frames now complete."""
+        if self._start == self._end and not self._intro:
+            # nothing pending: frames are sliced straight out of `data`, only a trailing partial frame is copied
+            view = memoryview(data)
+            if len(view) >= FRAME_HEADER_SIZE and ((view[0] << 16) | (view[1] << 8) | view[2]) == len(view) - FRAME_HEADER_SIZE:
+                # the usual websocket message: exactly one frame
+                return [view[FRAME_HEADER_SIZE:]]
+            frames, consumed = self._split(view, 0, len(view))
+            if consumed < len(view):
+                self._start = self._end = 0
+                self._store(view[consumed:])
+            return frames
+
+        self._store(memoryview(data))
+        return self._parse()
+
+    def _store(self, data: memoryview) -> None:
+        size = len(data)
+        if len(self._buffer) - self._end < size:
+            self._make_room(size)
+        self._view[self._end:self._end + size] = data
+        self._end += size
+
+    def _parse(self) -> List[memoryview]:
+        if self._intro:
+            if self._end - self._start < len(self._intro):
+                return []
+            if self._view[self._start:self._start + len(self._intro)] != self._intro:
+                raise ValueError('stream does not start with the expected intro header')
+            self._start += len(self._intro)
+            self._intro = b''
+
+        frames, self._start = self._split(self._view, self._start, self._end)
+        if self._start == self._end:
+            self._start = self._end = 0
+            if len(self._buffer) > 4 * self.initial_size:
+                # give back the room a very large frame needed
+                self._buffer = bytearray(self.initial_size)
+                self._view = memoryview(self._buffer)
+        return frames
+
+    @staticmethod
+    def _split(view: memoryview, start: int, end: int) -> tuple:
+        frames = []
+        while end - start >= FRAME_HEADER_SIZE:
+            size = (view[start] << 16) | (view[start + 1] << 8) | view[start + 2]
+            frame_end = start + FRAME_HEADER_SIZE + size
+            if frame_end > end:
+                break
+            frames.append(view[start + FRAME_HEADER_SIZE:frame_end])
+            start = frame_end
+        return frames, start
+
+    def _make_room(self, need: int) -> None:
+        pending = self._end - self._start
+        if pending + need <= len(self._buffer):
+            # move the unconsumed bytes to the front
+            self._view[:pending] = self._view[self._start:self._end]
+        else:
+            # grow; frames handed out earlier keep pointing into the old buffer
+            buffer = bytearray(max(2 * len(self._buffer), pending + need))
+            buffer[:pending] = self._view[self._start:self._end]
+            self._buffer = buffer
+            self._view = memoryview(buffer)
+        self._start = 0
+        self._end = pending
+
+
+class FrameWriter:
+    """Adds the 3 byte length prefix to outgoing frames, and the intro header before the first one."""
+
+    def __init__(self, intro: Optional[bytes] = None) -> None:
+        self._intro = intro or b''
+
+    def encode(self, data: Buffer) -> bytes:
+        size = len(data)
+        if size > MAX_FRAME_SIZE:
+            raise ValueError(f'frame too large: {size} bytes')
+        intro, self._intro = self._intro, b''
+        return b''.join((intro, size.to_bytes(FRAME_HEADER_SIZE, 'big'), data))
@@ -1,15 +1,18 @@
-import socket
 from urllib.parse import urlparse
-from typing import Optional, Callable, Union, Any
+from typing import Optional, Callable, Iterable, Union, Any
 import asyncio
 import logging
-import select
+from .framing import FrameReassembler
 
 logger = logging.getLogger(__name__)
 
+# Initial size of the receive buffer; the kernel hands over at most this much per read.
+RECEIVE_BUFFER_SIZE = 256 * 1024
+
 class AbstractSocketClient:
     def __init__(self, url: str):
-        self.url = urlparse(url)
+        # Socket passes the url already parsed
+        self.url = urlparse(url) if isinstance(url, str) else url
         self.event_handlers = {}
 
     def on(self, event: str, callback: Callable):
@@ -31,71 +34,145 @@ class AbstractSocketClient:
         except Exception as e:
             logger.error(f"Error in event callback: {e}")
 
+class _StreamProtocol(asyncio.BufferedProtocol):
+    """Reads straight into the client's frame buffer and tracks write flow control."""
+
+    def __init__(self, client: 'MobileSocketClient') -> None:
+        self.client = client
+        self.transport: Optional[asyncio.Transport] = None
+        self.paused = False
+        self.drain_waiters = []
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self.client._get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes: int) -> None:
+        self.client._on_read(nbytes)
+
+    def eof_received(self) -> bool:
+        # returning False lets the transport close itself, which ends in connection_lost
+        return False
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.paused = False
+        self._wake_drain_waiters(exc or ConnectionResetError('Connection lost'))
+        self.client._on_connection_lost(exc)
+
+    def pause_writing(self) -> None:
+        self.paused = True
+
+    def resume_writing(self) -> None:
+        self.paused = False
+        self._wake_drain_waiters(None)
+
+    async def drain(self) -> None:
+        if self.transport is None or self.transport.is_closing():
+            raise ConnectionResetError('Connection lost')
+        if not self.paused:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.drain_waiters.append(waiter)
+        await waiter
+
+    def _wake_drain_waiters(self, exc: Optional[Exception]) -> None:
+        waiters, self.drain_waiters = self.drain_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                if exc is None:
+                    waiter.set_result(None)
+                else:
+                    waiter.set_exception(exc)
+
 class MobileSocketClient(AbstractSocketClient):
-    def __init__(self, url: str):
+    """
+    Raw TCP transport for the mobile (non-websocket) endpoint, on an asyncio
+    `BufferedProtocol`.
+
+    Incoming bytes are read straight into a `FrameReassembler`. A synchronous
+    `on_frame` sink, when set, gets each complete frame as a memoryview, and
+    `on_data` gets each raw read the same way; both views are only valid
+    during the call. Without `on_data`, a copy of each read is emitted as
+    'data'/'message'. `send` writes to the transport and then waits in
+    `drain()` while the transport's write buffer is above its high-water mark.
+    """
+
+    def __init__(self, url: str, config: Any = None):
         super().__init__(url)
-        self.socket: Optional[socket.socket] = None
+        self.config = config
+        self.protocol: Optional[_StreamProtocol] = None
+        self.on_data: Optional[Callable[[memoryview], None]] = None
+        self.on_frame: Optional[Callable[[memoryview], None]] = None
+        self.frames = FrameReassembler(initial_size=RECEIVE_BUFFER_SIZE)
+        self._read_view: Optional[memoryview] = None
+        self._connecting = False
+
+    @property
+    def transport(self) -> Optional[asyncio.Transport]:
+        return self.protocol.transport if self.protocol else None
 
     @property
     def is_open(self) -> bool:
-        return self.socket is not None and self.socket.fileno() != -1
+        return self.transport is not None and not self.transport.is_closing()
 
     @property
     def is_closed(self) -> bool:
-        return self.socket is None or self.socket.fileno() == -1
+        return self.transport is None
 
     @property
     def is_closing(self) -> bool:
-        return self.is_closed
+        return self.transport is not None and self.transport.is_closing()
 
     @property
     def is_connecting(self) -> bool:
-        return self.socket is not None and not self.is_open
+        return self._connecting
 
     async def connect(self):
-        if self.socket:
+        if self.protocol or self._connecting:
             return
 
+        self._connecting = True
         try:
-            self.socket = socket.create_connection((self.url.hostname, int(self.url.port or 443)))
-            self.socket.setblocking(False)
-            
+            _, self.protocol = await asyncio.get_running_loop().create_connection(
+                lambda: _StreamProtocol(self),
+                self.url.hostname,
+                int(self.url.port or 443),
+            )
+
             # Emit 'connect' event
             self.emit('connect')
-            
+
             # Emit 'ready' and 'open' events
             self.emit('ready')
             self.emit('open')
 
-            # Start the message handler
-            asyncio.create_task(self._handle_socket_events())
-
         except Exception as e:
             logger.error(f"Failed to connect: {e}")
             self.emit('error', e)
+        finally:
+            self._connecting = False
 
     async def close(self):
-        if not self.socket:
+        if not self.protocol:
             return
 
         try:
-            self.socket.close()
-            self.emit('close')
+            self.protocol.transport.close()
         except Exception as e:
             logger.error(f"Error closing socket: {e}")
             self.emit('error', e)
-        finally:
-            self.socket = None
 
-    def send(self, data: Union[str, bytes], cb: Optional[Callable[[Optional[Exception]], None]] = None) -> bool:
-        if self.socket is None:
+    async def send(self, data: Union[str, bytes], cb: Optional[Callable[[Optional[Exception]], None]] = None) -> bool:
+        if not self.is_open:
             return False
 
         try:
             if isinstance(data, str):
                 data = data.encode()
-            self.socket.sendall(data)
-            self.emit('drain')
+            self.protocol.transport.write(data)
+            await self.drain()
             if cb:
                 cb(None)
             return True
@@ -106,35 +183,66 @@ class MobileSocketClient(AbstractSocketClient):
                 cb(e)
             return False
 
-    async def _handle_socket_events(self):
-        while self.is_open:
-            try:
-                # Use select to wait for the socket to be readable
-                readable, _, exceptional = await asyncio.get_event_loop().run_in_executor(
-                    None, lambda: select.select([self.socket], [], [self.socket], 0.1)
-                )
-
-                if self.socket in readable:
-                    data = self.socket.recv(4096)
-                    if data:
-                        self.emit('data', data)
-                        self.emit('message', data)
-                    else:
-                        # Empty data means the connection was closed
-                        await self.close()
-                        break
-
-                if self.socket in exceptional:
-                    # Handle exceptional condition
-                    self.emit('error', Exception("Socket in exceptional condition"))
-                    await self.close()
-                    break
+    async def send_many(self, frames: Iterable[Union[bytes, bytearray, memoryview]]) -> bool:
+        """Send several frames with a single write."""
+        if not self.is_open:
+            return False
+
+        try:
+            self.protocol.transport.writelines(frames)
+            await self.drain()
+            return True
+        except Exception as e:
+            logger.error(f"Error sending data: {e}")
+            self.emit('error', e)
+            return False
+
+    async def drain(self) -> None:
+        """Wait until the transport's write buffer is below its high-water mark."""
+        if self.protocol is None:
+            raise ConnectionResetError('Connection lost')
+        await self.protocol.drain()
+        self.emit('drain')
 
+    def _get_buffer(self, sizehint: int) -> memoryview:
+        self._read_view = self.frames.get_buffer(sizehint)
+        return self._read_view
+
+    def _on_read(self, nbytes: int) -> None:
+        view = self._read_view[:nbytes]
+        if self.on_data is not None:
+            try:
+                self.on_data(view)
+            except Exception as e:
+                logger.error(f"Error in data handler: {e}")
+                self.emit('error', e)
+        elif 'data' in self.event_handlers or 'message' in self.event_handlers:
+            # listeners run later, after the buffer has been reused, so they get a copy
+            data = bytes(view)
+            self.emit('data', data)
+            self.emit('message', data)
+
+        if self.on_frame is None:
+            # nobody consumes frames: leave the bytes unaccounted so the space is read into again
+            return
+        try:
+            frames = self.frames.advance(nbytes)
+        except ValueError as e:
+            self.emit('error', e)
+            self.protocol.transport.close()
+            return
+        for frame in frames:
+            try:
+                self.on_frame(frame)
             except Exception as e:
-                logger.error(f"Error in socket event handler: {e}")
+                logger.error(f"Error in frame handler: {e}")
                 self.emit('error', e)
-                await self.close()
-                break
 
-        # Emit 'end' event when the loop ends
+    def _on_connection_lost(self, exc: Optional[Exception]) -> None:
+        self.protocol = None
+        if exc is not None:
+            self.emit('error', exc)
+        self.emit('close')
+
+        # Emit 'end' event when the connection is gone
         self.emit('end')
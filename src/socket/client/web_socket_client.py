@@ -7,6 +7,8 @@ import websockets
 from websockets.exceptions import WebSocketException
 
 from .abstract_socket_client import AbstractSocketClient
+from .framing import FrameReassembler
+from ..reconnect import DEFAULT_RECONNECT_POLICY, ReconnectPolicy
 from defaults.defaults import DEFAULT_ORIGIN, SocketConfig
 
 logger = logging.getLogger(__name__)
@@ -15,16 +17,22 @@ class WebSocketClient(AbstractSocketClient):
     def __init__(self, url: str, config: SocketConfig):
         super().__init__(url, config)
         self.socket: Optional[websockets.WebSocketClientProtocol] = None
-        self.ping_interval: float = config.ping_interval or 20.0
+        # liveness normally comes from the Socket's keep-alive scheduler; a transport-level
+        # ping loop only runs when `ws_ping_interval` is set explicitly
+        self.ping_interval: Optional[float] = config.options.get('ws_ping_interval')
         self.ping_timeout: float = config.ping_timeout or 10.0
         self.pong_timeout: float = config.pong_timeout or 10.0
-        self.reconnect_interval: float = config.reconnect_interval or 5.0
-        self.max_reconnect_attempts: int = config.max_reconnect_attempts or 5
+        self.reconnect_policy: ReconnectPolicy = config.options.get('reconnect_policy') or DEFAULT_RECONNECT_POLICY
+        # switched off by Socket, which reconnects itself so it can redo the handshake
+        self.reconnect_on_failure = True
         self.ping_task: Optional[asyncio.Task] = None
         self.reconnect_task: Optional[asyncio.Task] = None
         self.event_handlers: Dict[str, list] = {}
         self.close_code: Optional[int] = None
         self.close_reason: Optional[str] = None
+        # synchronous sink for complete frames; the memoryview is only valid during the call
+        self.on_frame: Optional[Callable[[memoryview], None]] = None
+        self.frames = FrameReassembler()
 
     @property
     def is_open(self) -> bool:
@@ -49,8 +57,20 @@ class WebSocketClient(AbstractSocketClient):
         parsed_url = urlparse(self.url)
         ssl_context = None
         if parsed_url.scheme == "wss":
-            import ssl
-            ssl_context = ssl.create_default_context()
+            # a SessionManager hands every session the same context instead of loading the CA store per connect
+            ssl_context = self.config.options.get('ssl_context')
+            if ssl_context is None:
+                import ssl
+                ssl_context = ssl.create_default_context()
+
+        # with a shared resolver, connect to the cached address and keep the hostname for TLS
+        address = {}
+        resolver = self.config.options.get('resolver')
+        if resolver is not None:
+            port = parsed_url.port or (443 if parsed_url.scheme == "wss" else 80)
+            address = {'host': await resolver.resolve(parsed_url.hostname, port), 'port': port}
+            if ssl_context is not None:
+                address['server_hostname'] = parsed_url.hostname
 
         try:
             self.socket = await websockets.connect(
@@ -61,7 +81,8 @@ class WebSocketClient(AbstractSocketClient):
                 close_timeout=self.config.connect_timeout_ms / 1000,
                 ping_interval=None,  # We'll handle pings manually
                 ping_timeout=None,
-                ssl=ssl_context
+                ssl=ssl_context,
+                **address
             )
 
             logger.info(f"Connected to WebSocket at {self.url}")
@@ -71,15 +92,18 @@ class WebSocketClient(AbstractSocketClient):
             self.emit('upgrade', self.socket.response_headers)
 
             # Start the ping task
-            self.ping_task = asyncio.create_task(self._ping_loop())
+            if self.ping_interval:
+                self.ping_task = asyncio.create_task(self._ping_loop())
 
-            # Start the message handler
+            # Start the message handler on a fresh stream
+            self.frames = FrameReassembler()
             asyncio.create_task(self._message_handler())
 
         except WebSocketException as e:
             logger.error(f"Failed to connect to WebSocket: {e}")
             self.emit('error', e)
-            await self._handle_connection_failure()
+            if self.reconnect_on_failure:
+                await self._handle_connection_failure()
 
     async def close(self) -> None:
         if not self.socket:
@@ -156,6 +180,9 @@ class WebSocketClient(AbstractSocketClient):
             try:
                 message = await self.socket.recv()
                 self.emit('message', message)
+                if self.on_frame is not None and not isinstance(message, str):
+                    for frame in self.frames.feed(message):
+                        self.on_frame(frame)
             except websockets.ConnectionClosed as e:
                 self.close_code = e.code
                 self.close_reason = e.reason
@@ -175,10 +202,11 @@ class WebSocketClient(AbstractSocketClient):
         self.reconnect_task = asyncio.create_task(self._reconnect_loop())
 
     async def _reconnect_loop(self) -> None:
+        host = urlparse(self.url).hostname
         attempts = 0
-        while attempts < self.max_reconnect_attempts:
-            logger.info(f"Attempting to reconnect (attempt {attempts + 1}/{self.max_reconnect_attempts})")
-            await asyncio.sleep(self.reconnect_interval)
+        while self.reconnect_policy.should_retry(attempts):
+            logger.info(f"Attempting to reconnect (attempt {attempts + 1})")
+            await self.reconnect_policy.wait(host, attempts)
             try:
                 await self.connect()
                 if self.is_open:
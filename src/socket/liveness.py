@@ -0,0 +1,262 @@
+import asyncio
+import math
+import time
+import weakref
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Set
+
+# Number of recent ping round trips kept for percentiles, per session and per scheduler.
+RTT_SAMPLE_SIZE = 64
+SCHEDULER_RTT_SAMPLE_SIZE = 4096
+
+
+class WheelTimer:
+    __slots__ = ('callback', 'args', 'rounds', 'slot', 'cancelled')
+
+    def __init__(self, callback: Callable[..., Any], args: tuple, rounds: int, slot: int) -> None:
+        self.callback = callback
+        self.args = args
+        self.rounds = rounds
+        self.slot = slot
+        self.cancelled = False
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel: one loop timer advances the wheel by one slot every
+    `resolution` seconds, firing every due timer in that slot.
+
+    Any number of timers costs a single pending loop callback, and scheduling
+    or cancelling is O(1). A timer fires at most `resolution` late and never
+    early. The wheel stops ticking while empty.
+    """
+
+    def __init__(self, resolution: float = 0.5, size: int = 512) -> None:
+        self.resolution = resolution
+        self.size = size
+        self._slots: List[Set[WheelTimer]] = [set() for _ in range(size)]
+        self._cursor = 0
+        self._count = 0
+        self._next_tick = 0.0
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def schedule(self, delay: float, callback: Callable[..., Any], *args: Any) -> WheelTimer:
+        loop = asyncio.get_running_loop()
+        if self._handle is None:
+            self._loop = loop
+            self._next_tick = loop.time() + self.resolution
+            self._handle = loop.call_at(self._next_tick, self._tick)
+
+        # the k-th tick from now runs at _next_tick + (k - 1) * resolution
+        ticks = max(1, math.ceil((loop.time() + delay - self._next_tick) / self.resolution) + 1)
+        rounds, offset = divmod(ticks - 1, self.size)
+        slot = (self._cursor + offset + 1) % self.size
+        timer = WheelTimer(callback, args, rounds, slot)
+        self._slots[slot].add(timer)
+        self._count += 1
+        return timer
+
+    def cancel(self, timer: WheelTimer) -> None:
+        if timer.cancelled:
+            return
+        timer.cancelled = True
+        slot = self._slots[timer.slot]
+        if timer in slot:
+            slot.discard(timer)
+            self._count -= 1
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        for slot in self._slots:
+            for timer in slot:
+                timer.cancelled = True
+            slot.clear()
+        self._count = 0
+
+    def _tick(self) -> None:
+        self._cursor = (self._cursor + 1) % self.size
+        slot = self._slots[self._cursor]
+        due = [timer for timer in slot if timer.rounds == 0]
+        for timer in slot:
+            timer.rounds -= 1
+        for timer in due:
+            slot.discard(timer)
+        self._count -= len(due)
+
+        for timer in due:
+            if not timer.cancelled:
+                timer.cancelled = True
+                try:
+                    timer.callback(*timer.args)
+                except Exception as e:
+                    self._loop.call_exception_handler({'message': 'timer wheel callback failed', 'exception': e})
+
+        if self._count:
+            # scheduled from the previous tick rather than from now, so the wheel doesn't drift
+            self._next_tick += self.resolution
+            self._handle = self._loop.call_at(self._next_tick, self._tick)
+        else:
+            self._handle = None
+
+
+def percentiles(samples: Iterable[float], points: Iterable[float] = (50, 90, 99)) -> Dict[str, Optional[float]]:
+    ordered = sorted(samples)
+    result: Dict[str, Optional[float]] = {}
+    for point in points:
+        key = f'p{point:g}'
+        if not ordered:
+            result[key] = None
+            continue
+        # nearest-rank percentile
+        rank = max(1, math.ceil(point / 100 * len(ordered)))
+        result[key] = ordered[rank - 1]
+    return result
+
+
+class KeepAlive:
+    """
+    Liveness state of one session, driven by a `LivenessScheduler`.
+
+    `received` only stores a timestamp. When the wheel timer fires, it checks
+    how long the session has been idle. If something arrived within the
+    interval, it re-arms for the remaining time and sends nothing. Only a
+    session that has been silent for a full interval gets pinged.
+    """
+
+    def __init__(
+        self,
+        scheduler: 'LivenessScheduler',
+        ping: Callable[[], Awaitable[Any]],
+        interval: float,
+        on_failure: Optional[Callable[[BaseException], None]] = None,
+    ) -> None:
+        self.scheduler = scheduler
+        self.ping = ping
+        self.interval = interval
+        self.on_failure = on_failure
+        self.last_received = time.monotonic()
+        self.rtts: Deque[float] = deque(maxlen=RTT_SAMPLE_SIZE)
+        self.pings_sent = 0
+        self.pings_skipped = 0
+        self.stopped = False
+        self._timer: Optional[WheelTimer] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def received(self) -> None:
+        """Note that a frame just arrived from the peer."""
+        self.last_received = time.monotonic()
+
+    @property
+    def idle_for(self) -> float:
+        return time.monotonic() - self.last_received
+
+    def rtt_percentiles(self, points: Iterable[float] = (50, 90, 99)) -> Dict[str, Optional[float]]:
+        return percentiles(self.rtts, points)
+
+    def stop(self) -> None:
+        self.stopped = True
+        if self._timer is not None:
+            self.scheduler.wheel.cancel(self._timer)
+            self._timer = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.scheduler._sessions.discard(self)
+
+    def _arm(self, delay: float) -> None:
+        if not self.stopped:
+            self._timer = self.scheduler.wheel.schedule(delay, self._check)
+
+    def _check(self) -> None:
+        self._timer = None
+        idle = self.idle_for
+        if idle < self.interval:
+            self.pings_skipped += 1
+            self._arm(self.interval - idle)
+            return
+        self._task = asyncio.ensure_future(self._send_ping())
+
+    async def _send_ping(self) -> None:
+        start = time.monotonic()
+        try:
+            sent = await self.ping()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._task = None
+            self.stop()
+            if self.on_failure is not None:
+                self.on_failure(e)
+            return
+
+        self._task = None
+        # False: the session had nothing to ping over, so there is no round trip to record
+        if sent is not False:
+            rtt = time.monotonic() - start
+            self.pings_sent += 1
+            self.rtts.append(rtt)
+            self.scheduler.rtts.append(rtt)
+        self._arm(self.interval)
+
+
+class LivenessScheduler:
+    """
+    Keep-alive for any number of sessions, driven by one shared `TimerWheel`
+    instead of a sleeping task per socket. Sessions are only pinged after
+    they have been idle for their interval. Round trip times of the pings are
+    kept for percentiles.
+    """
+
+    _shared: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, LivenessScheduler]' = weakref.WeakKeyDictionary()
+
+    def __init__(self, wheel: Optional[TimerWheel] = None) -> None:
+        # an empty wheel is falsy (it has a length), so test for None
+        self.wheel = wheel if wheel is not None else TimerWheel()
+        self.rtts: Deque[float] = deque(maxlen=SCHEDULER_RTT_SAMPLE_SIZE)
+        self._sessions: Set[KeepAlive] = set()
+
+    @classmethod
+    def shared(cls) -> 'LivenessScheduler':
+        """The scheduler shared by every socket on the running event loop."""
+        loop = asyncio.get_running_loop()
+        scheduler = cls._shared.get(loop)
+        if scheduler is None:
+            scheduler = cls._shared[loop] = cls()
+        return scheduler
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def register(
+        self,
+        ping: Callable[[], Awaitable[Any]],
+        interval: float,
+        on_failure: Optional[Callable[[BaseException], None]] = None,
+    ) -> KeepAlive:
+        """
+        Start watching a session; `ping` is awaited whenever it has been idle for
+        `interval` seconds. A ping that returns False sent nothing and gives no
+        RTT sample; one that raises stops the session and calls `on_failure`.
+        """
+        keep_alive = KeepAlive(self, ping, interval, on_failure)
+        self._sessions.add(keep_alive)
+        keep_alive._arm(interval)
+        return keep_alive
+
+    def rtt_percentiles(self, points: Iterable[float] = (50, 90, 99)) -> Dict[str, Optional[float]]:
+        return percentiles(self.rtts, points)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            'sessions': len(self._sessions),
+            'timers': len(self.wheel),
+            'pings_sent': sum(session.pings_sent for session in self._sessions),
+            'pings_skipped': sum(session.pings_skipped for session in self._sessions),
+            'rtt': self.rtt_percentiles(),
+        }
@@ -0,0 +1,41 @@
+import os
+import threading
+from typing import List, Optional
+
+
+def generate_tag_prefix() -> str:
+    """`<a>.<b>-`, from two random 16 bit numbers; the same format as `generate_md_tag_prefix`."""
+    bytes_val = os.urandom(4)
+    return f"{int.from_bytes(bytes_val[:2], 'big')}.{int.from_bytes(bytes_val[2:], 'big')}-"
+
+
+class MessageTagAllocator:
+    """
+    Hands out the message tags (`<prefix><n>`) of one socket. Every tag is unique
+    for the allocator's lifetime, including across threads, and `reserve` takes
+    a contiguous block for a pipelined batch in a single step. The counter never
+    wraps, so a long-lived socket doesn't reuse old tags.
+    """
+
+    def __init__(self, prefix: Optional[str] = None, start: int = 1):
+        self.prefix = prefix or generate_tag_prefix()
+        self._next = start
+        self._lock = threading.Lock()
+
+    def next(self) -> str:
+        with self._lock:
+            epoch = self._next
+            self._next += 1
+        return f"{self.prefix}{epoch}"
+
+    def reserve(self, count: int) -> List[str]:
+        with self._lock:
+            start = self._next
+            self._next += count
+        prefix = self.prefix
+        return [f"{prefix}{epoch}" for epoch in range(start, start + count)]
+
+    @property
+    def epoch(self) -> int:
+        """The counter value the next tag will use."""
+        return self._next
@@ -0,0 +1,115 @@
+import asyncio
+import traceback
+from typing import Any, Dict, List, Optional
+
+
+class PendingQuery:
+    def __init__(self, msg_id: str, future: asyncio.Future, timer: Optional[asyncio.TimerHandle], origin: Optional[str] = None, node: Any = None) -> None:
+        self.msg_id = msg_id
+        self.future = future
+        self.timer = timer
+        self.origin = origin
+        self.node = node
+
+
+class PendingQueryRegistry:
+    """
+    In-flight request table for `Socket.query`, keyed by message id.
+
+    The frame dispatcher resolves a query's future directly through `resolve`,
+    so no per-query event listener has to be added to and removed from the
+    transport. An entry leaves the table as soon as its future is done:
+    answered, timed out, failed, or cancelled because the caller stopped waiting.
+    Because of that, abandoned queries can't pile up.
+
+    Registering an id that is already in flight raises ValueError. With `debug`,
+    every entry also records the stack that registered it, and the error shows
+    both call sites.
+    """
+
+    def __init__(self, debug: bool = False) -> None:
+        self.debug = debug
+        self._pending: Dict[str, PendingQuery] = {}
+        self.resolved = 0
+        self.timed_out = 0
+        self.unmatched = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def __contains__(self, msg_id: str) -> bool:
+        return msg_id in self._pending
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def register(self, msg_id: str, timeout_ms: Optional[int] = None, node: Any = None) -> asyncio.Future:
+        """
+        Add a query and return the future its response will be delivered to.
+        `node` is the request itself, kept so it can be re-sent after a reconnect.
+        """
+        origin = ''.join(traceback.format_stack(limit=8)[:-1]) if self.debug else None
+        existing = self._pending.get(msg_id)
+        if existing is not None:
+            message = f'query with id "{msg_id}" is already in flight'
+            if self.debug:
+                message += f'\nfirst registered at:\n{existing.origin}registered again at:\n{origin}'
+            raise ValueError(message)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        timer = loop.call_later(timeout_ms / 1000, self._expire, msg_id, future) if timeout_ms else None
+        self._pending[msg_id] = PendingQuery(msg_id, future, timer, origin, node)
+        future.add_done_callback(lambda _: self._discard(msg_id, future))
+        return future
+
+    def resolve(self, msg_id: str, frame: Any) -> bool:
+        """Deliver a response; returns False if no query with that id is waiting."""
+        query = self._pending.get(msg_id)
+        if query is None or query.future.done():
+            self.unmatched += 1
+            return False
+        query.future.set_result(frame)
+        self.resolved += 1
+        return True
+
+    def reject(self, msg_id: str, error: BaseException) -> bool:
+        query = self._pending.get(msg_id)
+        if query is None or query.future.done():
+            return False
+        query.future.set_exception(error)
+        return True
+
+    def reject_all(self, error: BaseException) -> int:
+        """Fail every waiting query, e.g. because the connection closed."""
+        count = 0
+        for query in list(self._pending.values()):
+            if not query.future.done():
+                query.future.set_exception(error)
+                count += 1
+        return count
+
+    def in_flight_nodes(self) -> List[Any]:
+        """Requests still waiting for a response, in the order they were registered."""
+        return [query.node for query in self._pending.values() if query.node is not None and not query.future.done()]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'pending': len(self._pending),
+            'resolved': self.resolved,
+            'timed_out': self.timed_out,
+            'unmatched': self.unmatched,
+        }
+
+    def _expire(self, msg_id: str, future: asyncio.Future) -> None:
+        if not future.done():
+            self.timed_out += 1
+            future.set_exception(asyncio.TimeoutError(f'query "{msg_id}" timed out'))
+
+    def _discard(self, msg_id: str, future: asyncio.Future) -> None:
+        query = self._pending.get(msg_id)
+        if query is not None and query.future is future:
+            del self._pending[msg_id]
+            if query.timer is not None:
+                query.timer.cancel()
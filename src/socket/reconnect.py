@@ -0,0 +1,88 @@
+import asyncio
+import random
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """
+    Token bucket that allows `rate` acquisitions per second with bursts of
+    up to `capacity`. Waiters reserve their token up front, so the bucket
+    can go negative. Each waiter then sleeps until its own slot instead of
+    all of them waking to compete for the next token.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Take a token and return how many seconds to wait before using it."""
+        self._refill()
+        self.tokens -= 1
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    async def acquire(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class ReconnectPolicy:
+    """
+    When and how fast connections are re-established.
+
+    Attempt n waits a random time between 0 and `min(max_delay, base_delay * multiplier ** n)`
+    ("full jitter"). That spreads out sessions that dropped at the same
+    moment. On top of that, every connect to a host takes a token from that
+    host's bucket, which is shared by every socket using the policy. So
+    a whole fleet reconnecting after a server restart is paced at `host_rate`
+    connects per second.
+    """
+
+    def __init__(
+        self,
+        base_delay_ms: int = 1000,
+        max_delay_ms: int = 60_000,
+        multiplier: float = 2.0,
+        max_attempts: Optional[int] = 10,
+        host_rate: float = 10.0,
+        host_burst: int = 20,
+    ) -> None:
+        self.base_delay_ms = base_delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.multiplier = multiplier
+        self.max_attempts = max_attempts
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def backoff(self, attempt: int) -> float:
+        """Seconds to wait before attempt number `attempt` (0 based)."""
+        cap = min(self.max_delay_ms, self.base_delay_ms * self.multiplier ** attempt)
+        return random.uniform(0, cap) / 1000
+
+    def should_retry(self, attempt: int) -> bool:
+        return self.max_attempts is None or attempt < self.max_attempts
+
+    def bucket(self, host: Optional[str]) -> TokenBucket:
+        bucket = self._buckets.get(host or '')
+        if bucket is None:
+            bucket = self._buckets[host or ''] = TokenBucket(self.host_rate, self.host_burst)
+        return bucket
+
+    async def wait(self, host: Optional[str], attempt: int) -> None:
+        """Sleep out the backoff for `attempt`, then wait for the host's connect budget."""
+        await asyncio.sleep(self.backoff(attempt))
+        await self.bucket(host).acquire()
+
+
+# Shared by every socket that isn't given its own policy, so they all draw on the same per-host buckets.
+DEFAULT_RECONNECT_POLICY = ReconnectPolicy()
@@ -0,0 +1,178 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Union
+
+Frame = Union[bytes, bytearray, memoryview]
+
+
+class _Batch:
+    __slots__ = ('frames', 'nbytes', 'future', 'queued_at')
+
+    def __init__(self, future: asyncio.Future) -> None:
+        self.frames: List[Frame] = []
+        self.nbytes = 0
+        self.future = future
+        self.queued_at = time.perf_counter()
+
+
+class SendQueue:
+    """
+    Outgoing frame queue of one connection.
+
+    Frames queued while a write is pending, or within the same event loop tick,
+    are grouped into batches of up to `max_batch_bytes`. One writer task hands
+    each batch to `write` in a single call, so a burst of small frames costs a
+    few writes instead of a task and a transport call per frame.
+
+    `send` waits until its frame has been written. If more than
+    `high_watermark` bytes are queued, it first waits for the backlog to fall
+    to `low_watermark`.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[List[Frame]], Awaitable[None]],
+        high_watermark: int = 1024 * 1024,
+        low_watermark: int = 256 * 1024,
+        max_batch_bytes: int = 64 * 1024,
+    ) -> None:
+        if low_watermark > high_watermark:
+            raise ValueError('low_watermark must not exceed high_watermark')
+
+        self.write = write
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.max_batch_bytes = max_batch_bytes
+
+        self._batches: Deque[_Batch] = deque()
+        self._queued_bytes = 0
+        self._writer: Optional[asyncio.Task] = None
+        self._writing: Optional[_Batch] = None
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._error: Optional[BaseException] = None
+
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.flushes = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self._total_flush_latency = 0.0
+
+    @property
+    def depth(self) -> int:
+        """Number of frames waiting to be written, not counting a write in progress."""
+        return sum(len(batch.frames) for batch in self._batches)
+
+    @property
+    def queued_bytes(self) -> int:
+        """Bytes not yet written, including a write in progress."""
+        return self._queued_bytes
+
+    def enqueue(self, data: Frame) -> asyncio.Future:
+        """Queue a frame without waiting for room; returns the future of the write that carries it."""
+        if self._error is not None:
+            raise self._error
+
+        batch = self._batches[-1] if self._batches else None
+        if batch is None or (batch.frames and batch.nbytes + len(data) > self.max_batch_bytes):
+            batch = _Batch(asyncio.get_running_loop().create_future())
+            self._batches.append(batch)
+
+        batch.frames.append(data)
+        batch.nbytes += len(data)
+        self._queued_bytes += len(data)
+        if self._queued_bytes >= self.high_watermark:
+            self._writable.clear()
+
+        self._idle.clear()
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_loop())
+        return batch.future
+
+    async def send(self, data: Frame) -> None:
+        """Queue a frame, waiting for room above the high watermark, and wait until it is written."""
+        # every waiter wakes at once; re-check so they don't all pile in past the high watermark
+        while not self._writable.is_set():
+            await self._writable.wait()
+        await self.enqueue(data)
+
+    async def send_many(self, frames: Iterable[Frame]) -> None:
+        while not self._writable.is_set():
+            await self._writable.wait()
+        futures = {id(future): future for future in map(self.enqueue, frames)}
+        await asyncio.gather(*futures.values())
+
+    async def drain(self) -> None:
+        """Wait until everything queued so far has been written."""
+        await self._idle.wait()
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        """Fail all queued frames and refuse new ones."""
+        self._error = error or Exception("Connection Closed")
+        batches = list(self._batches)
+        if self._writing is not None:
+            batches.append(self._writing)
+        self._batches.clear()
+        for batch in batches:
+            if not batch.future.done():
+                batch.future.set_exception(self._error)
+        self._queued_bytes = 0
+        self._writable.set()
+        self._idle.set()
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+
+    def metrics(self) -> Dict[str, float]:
+        return {
+            'depth': self.depth,
+            'queued_bytes': self._queued_bytes,
+            'frames_sent': self.frames_sent,
+            'bytes_sent': self.bytes_sent,
+            'flushes': self.flushes,
+            'last_flush_latency_ms': self.last_flush_latency * 1000,
+            'max_flush_latency_ms': self.max_flush_latency * 1000,
+            'avg_flush_latency_ms': self._total_flush_latency * 1000 / self.flushes if self.flushes else 0.0,
+        }
+
+    async def _write_loop(self) -> None:
+        # yield once so everything queued in the current tick joins the first batch
+        await asyncio.sleep(0)
+        try:
+            while self._batches:
+                # taken off the queue first, so frames queued during the write start a new batch
+                batch = self._writing = self._batches.popleft()
+                try:
+                    await self.write(batch.frames)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if not batch.future.done():
+                        batch.future.set_exception(e)
+                    continue
+                finally:
+                    # after close() the accounting was already reset
+                    if self._error is None:
+                        self._writing = None
+                        self._queued_bytes -= batch.nbytes
+                        if self._queued_bytes <= self.low_watermark:
+                            self._writable.set()
+
+                latency = time.perf_counter() - batch.queued_at
+                self.frames_sent += len(batch.frames)
+                self.bytes_sent += batch.nbytes
+                self.flushes += 1
+                self.last_flush_latency = latency
+                self.max_flush_latency = max(self.max_flush_latency, latency)
+                self._total_flush_latency += latency
+                if not batch.future.done():
+                    batch.future.set_result(None)
+        finally:
+            if self._writer is asyncio.current_task():
+                self._writer = None
+            if not self._batches:
+                self._idle.set()
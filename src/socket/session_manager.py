@@ -0,0 +1,164 @@
+import asyncio
+import dataclasses
+import random
+import socket as _socket
+import ssl
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from defaults.defaults import DEFAULT_CONNECTION_CONFIG, SocketConfig
+from models.other_models import BinaryNodeTemplateCache
+from .liveness import LivenessScheduler
+from .socket import Socket
+
+
+class DnsCache:
+    """
+    Resolves each host at most once per `ttl` seconds for all sessions.
+    Concurrent lookups of the same host share one query, and successive
+    connects rotate through the returned addresses.
+    """
+
+    def __init__(self, ttl: float = 300.0) -> None:
+        self.ttl = ttl
+        self._entries: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+        self._lookups: Dict[Tuple[str, int], asyncio.Future] = {}
+        self._rotation: Dict[Tuple[str, int], int] = {}
+        self.lookups = 0
+
+    async def resolve(self, host: str, port: int) -> str:
+        key = (host, port)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            lookup = self._lookups.get(key)
+            if lookup is None:
+                lookup = self._lookups[key] = asyncio.ensure_future(self._lookup(host, port))
+                lookup.add_done_callback(lambda _: self._lookups.pop(key, None))
+            addresses = await asyncio.shield(lookup)
+        else:
+            addresses = entry[1]
+
+        index = self._rotation.get(key, 0)
+        self._rotation[key] = index + 1
+        return addresses[index % len(addresses)]
+
+    async def _lookup(self, host: str, port: int) -> List[str]:
+        self.lookups += 1
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=_socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self._entries[(host, port)] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+
+class SessionManager:
+    """
+    Runs many `Socket`s, one per account, in a single process.
+
+    Every session gets a copy of the manager's config whose options point at
+    shared resources: one liveness scheduler, so all keep-alives run on one
+    timer wheel; one DNS cache; one TLS context; and one node template cache.
+    Connects are staggered at most one per `connect_interval_ms`, with jitter,
+    and capped at `max_concurrent_connects` in progress. That way a restart
+    doesn't hit the server with every account at once.
+    """
+
+    def __init__(
+        self,
+        config: Optional[SocketConfig] = None,
+        max_concurrent_connects: int = 20,
+        connect_interval_ms: int = 50,
+        socket_factory: Callable[[SocketConfig], Socket] = Socket,
+    ) -> None:
+        self.config = config or DEFAULT_CONNECTION_CONFIG
+        self.connect_interval_ms = connect_interval_ms
+        self.socket_factory = socket_factory
+        self.sessions: Dict[str, Socket] = {}
+
+        self.dns = DnsCache()
+        self.ssl_context = ssl.create_default_context()
+        self.node_templates = BinaryNodeTemplateCache()
+        self.liveness = LivenessScheduler()
+
+        self._connect_slots = asyncio.Semaphore(max_concurrent_connects)
+        self._next_connect_at = 0.0
+        self.connects = 0
+        self.connect_failures = 0
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self.sessions
+
+    def session_config(self, config: Optional[SocketConfig] = None) -> SocketConfig:
+        config = config or self.config
+        return dataclasses.replace(config, options={
+            **config.options,
+            'liveness_scheduler': self.liveness,
+            'resolver': self.dns,
+            'ssl_context': self.ssl_context,
+            'node_templates': self.node_templates,
+        })
+
+    def add_session(self, session_id: str, config: Optional[SocketConfig] = None) -> Socket:
+        """Create the socket for an account; `config` (e.g. carrying its auth state) defaults to the manager's."""
+        if session_id in self.sessions:
+            raise ValueError(f'session "{session_id}" already exists')
+        sock = self.socket_factory(self.session_config(config))
+        self.sessions[session_id] = sock
+        return sock
+
+    async def connect(self, session_id: str) -> Socket:
+        sock = self.sessions[session_id]
+        async with self._connect_slots:
+            await self._wait_for_connect_slot()
+            try:
+                await sock.connect()
+            except Exception:
+                self.connect_failures += 1
+                raise
+            self.connects += 1
+        return sock
+
+    async def connect_all(self) -> Dict[str, Optional[BaseException]]:
+        """Connect every session; maps each session id to the error its connect raised, or None."""
+        session_ids = list(self.sessions)
+        results = await asyncio.gather(*(self.connect(session_id) for session_id in session_ids), return_exceptions=True)
+        return {
+            session_id: result if isinstance(result, BaseException) else None
+            for session_id, result in zip(session_ids, results)
+        }
+
+    async def remove_session(self, session_id: str, error: Optional[Exception] = None) -> None:
+        """End an account's socket and wait until its transport is closed."""
+        sock = self.sessions.pop(session_id, None)
+        if sock is not None:
+            await sock.end(error)
+
+    async def close(self) -> None:
+        await asyncio.gather(*(self.remove_session(session_id) for session_id in list(self.sessions)))
+        self.liveness.wheel.close()
+
+    def metrics(self) -> Dict[str, Any]:
+        sockets = list(self.sessions.values())
+        return {
+            'sessions': len(sockets),
+            'open': sum(1 for sock in sockets if not sock.closed and sock.ws.is_open),
+            'connects': self.connects,
+            'connect_failures': self.connect_failures,
+            'pending_queries': sum(sock.pending_queries.pending_count for sock in sockets),
+            'send_queue_depth': sum(sock.send_queue.depth for sock in sockets),
+            'send_queue_bytes': sum(sock.send_queue.queued_bytes for sock in sockets),
+            'frames_sent': sum(sock.send_queue.frames_sent for sock in sockets),
+            'dns_lookups': self.dns.lookups,
+            'node_templates': len(self.node_templates.templates),
+            'liveness': self.liveness.metrics(),
+        }
+
+    async def _wait_for_connect_slot(self) -> None:
+        now = time.monotonic()
+        interval = self.connect_interval_ms / 1000
+        start_at = max(now, self._next_connect_at)
+        self._next_connect_at = start_at + interval
+        delay = start_at - now + random.uniform(0, interval)
+        if delay > 0:
+            await asyncio.sleep(delay)
@@ -1,7 +1,6 @@
 import asyncio
+from collections.abc import Mapping
 from urllib.parse import urlparse
-from cryptography.hazmat.primitives.asymmetric import ec
-from cryptography.hazmat.primitives import serialization
 import logging
 
 from defaults.defaults import SocketConfig, DEFAULT_CONNECTION_CONFIG, DEF_CALLBACK_PREFIX, DEF_TAG_PREFIX, INITIAL_PREKEY_COUNT, MIN_PREKEY_COUNT, MOBILE_ENDPOINT, MOBILE_NOISE_HEADER, MOBILE_PORT, NOISE_WA_HEADER
@@ -9,12 +8,18 @@ from models.closeing_models import DisconnectReason
 from proto.waproto_pb2 import HandshakeMessage, ClientPayload, IClientPayload, IHandshakeMessage
 from .client.web_socket_client import WebSocketClient
 from .client.mobile_socket_client import MobileSocketClient
-from wabinary.generic import assert_node_error_free, binary_node_to_string, get_binary_node_child, get_all_binary_node_children
+from .pending_queries import PendingQueryRegistry
+from .send_queue import SendQueue
+from .liveness import LivenessScheduler
+from .message_tags import MessageTagAllocator
+from .reconnect import DEFAULT_RECONNECT_POLICY
+from .noise_handler import NoiseHandler
+from wabinary.generic import LazyBinaryNodeFormat, assert_node_error_free, get_binary_node_child, get_all_binary_node_children
 from wabinary.jid import jid_encode, S_WHATSAPP_NET
-from models.other_models import BinaryNode, encode_binary_node
+from models.other_models import BinaryNode, BinaryNodeTemplateCache, encode_binary_node
 from utils.auth_utils import add_transaction_capability
-from utils.crypto_utils import aes_encrypt_ctr, Curve, derive_pairing_code_key
-from utils.generics_utils import bind_wait_for_connection_update, bytes_to_crockford, generate_md_tag_prefix, get_code_from_ws_error, get_error_code_from_stream_error, get_platform_id, promise_timeout, print_qr_if_necessary_listener
+from utils.crypto_utils import aes_encrypt_ctr, Curve, derive_pairing_code_key, generate_x25519_key_pair
+from utils.generics_utils import bind_wait_for_connection_update, bytes_to_crockford, get_code_from_ws_error, get_error_code_from_stream_error, get_platform_id, promise_timeout, print_qr_if_necessary_listener
 from utils.validate_utils import configure_successful_pairing, generate_login_node, generate_mobile_node, generate_registration_node
 from utils.signal_utils import get_next_pre_keys_node
 
@@ -26,12 +31,30 @@ class Socket:
         self.url = self._parse_url(self.config.wa_websocket_url)
         self.ws = self._create_socket()
         self.ev = asyncio.Event()
-        self.ephemeral_key_pair = ec.generate_private_key(ec.SECP256R1())
+        # generated per connection attempt in validate_connection, not for every idle Socket
+        self.ephemeral_key_pair = None
+        self.noise = None
+        self._handshake_waiter = None
         self.creds = self.config.auth.creds if self.config.auth else None
         self.keys = add_transaction_capability(self.config.auth.keys, self.logger, self.config.transaction_opts) if self.config.auth else None
         self.closed = False
-        self.uq_tag_id = generate_md_tag_prefix()
-        self.epoch = 1
+        self.tags = MessageTagAllocator()
+        self.uq_tag_id = self.tags.prefix
+        self.node_templates = self.config.options.get('node_templates') or BinaryNodeTemplateCache()
+        self.pending_queries = PendingQueryRegistry(debug=self.config.options.get('debug_query_ids', False))
+        self.send_queue = SendQueue(
+            self._write_frames,
+            high_watermark=self.config.options.get('send_queue_high_watermark', 1024 * 1024),
+            low_watermark=self.config.options.get('send_queue_low_watermark', 256 * 1024),
+        )
+        self.liveness = self.config.options.get('liveness_scheduler')
+        self.keep_alive = None
+        self.reconnect_policy = self.config.options.get('reconnect_policy') or DEFAULT_RECONNECT_POLICY
+        self.reconnect_task = None
+        self._close_task = None
+        # listeners added through `on`; they are attached to every transport this socket uses
+        self.listeners = {}
+        self._bind_transport()
 
     def _parse_url(self, url):
         if isinstance(url, str):
@@ -43,17 +66,117 @@ class Socket:
             return MobileSocketClient(self.url, self.config)
         return WebSocketClient(self.url, self.config)
 
+    def _bind_transport(self):
+        ws = self.ws
+        ws.reconnect_on_failure = False
+        # incoming frames only arrive through `on_frame`, which is unset when the transport is replaced
+        ws.on_frame = self._on_frame_data
+        # the handlers are told which transport emitted, so a replaced one that emits late is ignored
+        ws.on('close', lambda *args: self._on_transport_close(ws, *args))
+        for event in self.listeners:
+            self._forward_event(ws, event)
+
+    def _release_transport(self, ws):
+        # not every client can remove listeners, but the ones bound above only act for the current transport
+        ws.on_frame = None
+        # its noise session goes with it; until the next handshake finishes, no node frame can be sent
+        self.noise = None
+
+    def _forward_event(self, ws, event):
+        ws.on(event, lambda *args: self._on_transport_event(ws, event, *args))
+
+    def _on_transport_event(self, ws, event, *args):
+        if ws is self.ws:
+            self.emit(event, *args)
+
+    def on(self, event, listener):
+        """
+        Listen for a transport event or a `CB:<tag>` stanza. Unlike listeners
+        added to `ws` directly, these stay attached when a reconnect replaces
+        the transport.
+        """
+        listeners = self.listeners.get(event)
+        if listeners is None:
+            listeners = self.listeners[event] = []
+            self._forward_event(self.ws, event)
+        listeners.append(listener)
+
+    def remove_listener(self, event, listener):
+        listeners = self.listeners.get(event)
+        if listeners and listener in listeners:
+            listeners.remove(listener)
+
+    def emit(self, event, *args):
+        for listener in list(self.listeners.get(event, ())):
+            listener(*args)
+
     async def connect(self):
         await self.ws.connect()
+        if not self.ws.is_open:
+            raise Exception("Connection Failed")
         await self.validate_connection()
 
+    def _on_transport_close(self, ws, *args):
+        # a transport that was already replaced (e.g. a failed reconnect attempt) closing late must not start another reconnect
+        if ws is not self.ws:
+            return
+        if self.closed or self.reconnect_task is not None or not self.config.options.get('auto_reconnect', True):
+            return
+        self._start_reconnect()
+
+    def _start_reconnect(self):
+        # no pings while there is no connection; validate_connection starts them again
+        if self.keep_alive is not None:
+            self.keep_alive.stop()
+            self.keep_alive = None
+        self.reconnect_task = asyncio.ensure_future(self.reconnect())
+
+    async def reconnect(self):
+        """
+        Re-establish a dropped connection on this same Socket, following `reconnect_policy`.
+        The current transport, if still open, is closed first.
+
+        Creds, keys and queries still waiting for a response are kept. Once the
+        new connection has finished its handshake, those queries are re-sent
+        under their original ids, so their callers get a response instead of
+        an error.
+        """
+        try:
+            if self.ws.is_open:
+                await self.ws.close()
+
+            attempt = 0
+            while not self.closed:
+                await self.reconnect_policy.wait(self.url.hostname, attempt)
+                self._release_transport(self.ws)
+                self.ws = self._create_socket()
+                self._bind_transport()
+                try:
+                    await self.connect()
+                    break
+                except Exception as e:
+                    self.logger.warning(f"Reconnect attempt {attempt + 1} failed: {e}")
+                    attempt += 1
+                    # a failed attempt may still hold a half-open connection
+                    if not self.ws.is_closed:
+                        await self.ws.close()
+                    if not self.reconnect_policy.should_retry(attempt):
+                        await self.end(e)
+                        return
+
+            nodes = self.pending_queries.in_flight_nodes()
+            if nodes and not self.closed:
+                self.logger.info(f"Reconnected, re-sending {len(nodes)} pending queries")
+                await self.send_raw_messages([self._encode_node(node) for node in nodes])
+        finally:
+            self.reconnect_task = None
+
     async def validate_connection(self):
+        self.ephemeral_key_pair = generate_x25519_key_pair()
+        self.noise = NoiseHandler(self.ephemeral_key_pair, MOBILE_NOISE_HEADER if self.config.mobile else NOISE_WA_HEADER)
         hello_msg = HandshakeMessage(
             clientHello=HandshakeMessage.ClientHello(
-                ephemeral=self.ephemeral_key_pair.public_key().public_bytes(
-                    encoding=serialization.Encoding.X962,
-                    format=serialization.PublicFormat.UncompressedPoint
-                )
+                ephemeral=self.ephemeral_key_pair.public
             )
         )
 
@@ -66,20 +189,11 @@ class Socket:
 
         self.logger.debug(f"Handshake received from WA: {handshake}")
 
-        # Process handshake and encrypt key
-        # Note: This part would need the noise protocol implementation
-
-        if self.config.mobile:
-            node = generate_mobile_node(self.config)
-        elif not self.creds or not self.creds.me:
-            node = generate_registration_node(self.creds, self.config)
-            self.logger.info("Not logged in, attempting registration...")
-        else:
-            node = generate_login_node(self.creds.me.id, self.config)
-            self.logger.info("Logging in...")
+        noise_key = self.creds.noise_key if self.creds else generate_x25519_key_pair()
+        key_enc = self.noise.process_handshake(handshake.serverHello, noise_key)
 
-        payload_enc = self._encrypt_payload(node)
-        await self.send_raw_message(
+        payload_enc = self._encrypt_payload(self._client_payload())
+        await self._send_handshake_message(
             HandshakeMessage(
                 clientFinish=HandshakeMessage.ClientFinish(
                     static=key_enc,
@@ -88,86 +202,244 @@ class Socket:
             ).SerializeToString()
         )
 
-        # Finish noise protocol initialization
+        # the client finish was the last plaintext frame; everything after it is encrypted
+        self.noise.finish_init()
         self.start_keep_alive_request()
 
+    def _client_payload(self):
+        """The payload of the client finish: a mobile, registration or login `ClientPayload`."""
+        if self.config.mobile:
+            return generate_mobile_node(self.config)
+        if not self.creds or not self.creds.me:
+            self.logger.info("Not logged in, attempting registration...")
+            return generate_registration_node(self.creds, self.config)
+        self.logger.info("Logging in...")
+        return generate_login_node(self.creds.me.id, self.config)
+
     def _encrypt_payload(self, node):
-        # This method would need to be implemented based on the noise protocol
-        pass
+        return self.noise.encrypt(node.SerializeToString())
 
-    async def send_raw_message(self, data):
+    async def await_next_message(self, send_msg=None):
+        """Wait for the next handshake frame, optionally sending `send_msg` first."""
         if not self.ws.is_open:
             raise Exception("Connection Closed")
-        
-        # Encrypt frame using noise protocol
-        # bytes = self.noise.encode_frame(data)
-        
-        await promise_timeout(
-            self.config.connect_timeout_ms,
-            self.ws.send(data)
-        )
+
+        self._handshake_waiter = asyncio.get_running_loop().create_future()
+        try:
+            if send_msg is not None:
+                await self._send_handshake_message(send_msg)
+            return await promise_timeout(self.config.connect_timeout_ms, self._handshake_waiter)
+        finally:
+            self._handshake_waiter = None
+
+    def _on_frame_data(self, frame):
+        """Sink for the transport's reassembled frames: handshake replies go to `await_next_message`, the rest is decrypted and dispatched."""
+        noise = self.noise
+        if noise is None:
+            return
+
+        finished = noise.is_finished
+        try:
+            decoded = noise.decode_frame(frame)
+        except Exception as e:
+            # a frame that fails to decrypt leaves the counters out of step, so the connection is unusable
+            self.logger.error(f"Failed to decode frame: {e}")
+            self._terminate(e)
+            return
+
+        if finished:
+            self.dispatch_frame(decoded)
+        elif self._handshake_waiter is not None and not self._handshake_waiter.done():
+            self._handshake_waiter.set_result(decoded)
+
+    async def _send_handshake_message(self, data):
+        """
+        Send a plaintext handshake frame. It goes straight to the transport:
+        the send queue only carries node frames, which wait for the handshake.
+        """
+        if not self.ws.is_open:
+            raise Exception("Connection Closed")
+
+        if not await promise_timeout(self.config.connect_timeout_ms, self.ws.send(self.noise.encode_frame(data))):
+            raise Exception("Connection Closed")
+
+    def _assert_can_send(self):
+        if not self.ws.is_open:
+            raise Exception("Connection Closed")
+        # before the handshake has finished, a node frame would go out in plaintext
+        if self.noise is None or not self.noise.is_finished:
+            raise Exception("Connection Not Ready")
+
+    async def send_raw_message(self, data):
+        self._assert_can_send()
+        await self.send_queue.send(data)
+
+    async def send_raw_messages(self, frames):
+        """Send several frames, queued together so they share a write where the transport allows."""
+        self._assert_can_send()
+        await self.send_queue.send_many(frames)
+
+    async def drain(self):
+        """Wait until every queued frame has been handed to the transport."""
+        await self.send_queue.drain()
+
+    async def _write_frames(self, frames):
+        # frames are encrypted here, in the single writer, so the noise counters follow the order on the wire
+        noise = self.noise
+        ws = self.ws
+        # frames queued on a transport that has been replaced since, and not yet
+        # handshaken, fail here rather than go out in plaintext
+        if noise is None or not noise.is_finished:
+            raise Exception("Connection Not Ready")
+
+        # stream transports (`send_many`) take a whole batch in one write, encrypted into a single buffer;
+        # the websocket keeps one frame per message
+        send_many = getattr(ws, 'send_many', None)
+        if send_many is not None:
+            sent = await promise_timeout(self.config.connect_timeout_ms, send_many([noise.encode_frames(frames)]))
+        else:
+            frames = [noise.encode_frame(data) for data in frames]
+            sent = True
+            for data in frames:
+                if not await promise_timeout(self.config.connect_timeout_ms, ws.send(data)):
+                    sent = False
+                    break
+
+        if not sent:
+            # the noise counters already moved past these frames, so the connection can't carry any more;
+            # closing it hands over to the reconnect logic
+            if ws.is_open:
+                await ws.close()
+            raise Exception("Connection Closed")
 
     def generate_message_tag(self):
-        return f"{self.uq_tag_id}{self.epoch}"
+        return self.tags.next()
 
-    async def query(self, node, timeout_ms=None):
-        if not node.attrs.get('id'):
-            node.attrs['id'] = self.generate_message_tag()
+    def reserve_message_tags(self, count):
+        """Reserve `count` consecutive tags at once, for pipelined batches."""
+        return self.tags.reserve(count)
 
-        msg_id = node.attrs['id']
-        wait = self.wait_for_message(msg_id, timeout_ms)
+    async def query(self, node, timeout_ms=None, use_template=False):
+        if not node['attrs'].get('id'):
+            node['attrs']['id'] = self.generate_message_tag()
 
-        await self.send_node(node)
+        msg_id = node['attrs']['id']
+        # registered before sending, so a fast response can't arrive ahead of its waiter
+        wait = self.pending_queries.register(msg_id, timeout_ms or self.config.default_query_timeout_ms, node)
+        try:
+            await self.send_node(node, use_template)
+        except BaseException:
+            wait.cancel()
+            raise
 
         result = await wait
-        if hasattr(result, 'tag'):
+        if isinstance(result, Mapping):
             assert_node_error_free(result)
 
         return result
 
+    async def query_many(self, nodes, concurrency=64, timeout_ms=None):
+        """
+        Pipeline a batch of queries and return their results in order.
+
+        Nodes without an id get one from a single tag reservation. Up to
+        `concurrency` queries are in flight at a time, and a new one is sent as
+        soon as any of them is answered, so a slow or lost response only holds
+        its own slot. Frames sent in the same tick share a write. Every query
+        has its own timeout. A query that fails (error stanza, timeout...) puts
+        its exception in the result list instead of failing the whole batch.
+        """
+        nodes = list(nodes)
+        missing = [node for node in nodes if not node['attrs'].get('id')]
+        for node, msg_id in zip(missing, self.reserve_message_tags(len(missing))):
+            node['attrs']['id'] = msg_id
+
+        timeout_ms = timeout_ms or self.config.default_query_timeout_ms
+        slots = asyncio.Semaphore(concurrency)
+
+        async def run(node):
+            async with slots:
+                wait = self.pending_queries.register(node['attrs']['id'], timeout_ms, node)
+                try:
+                    await self.send_raw_message(self._encode_node(node))
+                    result = await wait
+                finally:
+                    wait.cancel()
+
+            if isinstance(result, Mapping):
+                assert_node_error_free(result)
+            return result
+
+        return await asyncio.gather(*map(run, nodes), return_exceptions=True)
+
     async def wait_for_message(self, msg_id, timeout_ms=None):
-        future = asyncio.Future()
-        
-        def on_message(message):
-            if not future.done():
-                future.set_result(message)
-
-        self.ws.on(f"TAG:{msg_id}", on_message)
-        
-        try:
-            return await asyncio.wait_for(future, timeout=timeout_ms/1000 if timeout_ms else None)
-        finally:
-            self.ws.remove_listener(f"TAG:{msg_id}", on_message)
+        return await self.pending_queries.register(msg_id, timeout_ms or self.config.default_query_timeout_ms)
 
-    async def send_node(self, frame):
-        if self.logger.level == logging.DEBUG:
-            self.logger.debug(f"Sending XML: {binary_node_to_string(frame)}")
+    def dispatch_frame(self, frame):
+        """Route a decoded incoming frame: responses resolve their pending query, anything else goes to `CB:<tag>` listeners."""
+        if self.keep_alive is not None:
+            self.keep_alive.received()
+
+        attrs = frame.get('attrs') if isinstance(frame, Mapping) else None
+        msg_id = attrs.get('id') if attrs else None
+        if msg_id and self.pending_queries.resolve(msg_id, frame):
+            return
 
-        buff = encode_binary_node(frame)
-        return await self.send_raw_message(buff)
+        if attrs is not None:
+            self.ws.emit(f"{DEF_CALLBACK_PREFIX}{frame['tag']}", frame)
+
+    async def send_node(self, frame, use_template=False):
+        """Encode and send a node. `use_template` reuses a cached encoding of stanzas that only differ in their id."""
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Sending XML: %s", LazyBinaryNodeFormat(frame, **self.config.options.get('log_node_format', {})))
+
+        return await self.send_raw_message(self._encode_node(frame, use_template))
+
+    def _encode_node(self, node, use_template=False):
+        buff = self.node_templates.encode(node) if use_template else encode_binary_node(node)
+        # every node frame starts with its flags byte (0: not compressed)
+        return b'\x00' + buff
 
     def start_keep_alive_request(self):
-        asyncio.create_task(self._keep_alive_loop())
+        """Watch the connection on the shared liveness scheduler; it is only pinged after an idle interval."""
+        if self.keep_alive is not None:
+            return
+        if self.liveness is None:
+            self.liveness = LivenessScheduler.shared()
+        self.keep_alive = self.liveness.register(
+            self._send_keep_alive,
+            self.config.keep_alive_interval_ms / 1000,
+            self._on_keep_alive_failed,
+        )
 
-    async def _keep_alive_loop(self):
-        while not self.closed:
-            await asyncio.sleep(self.config.keep_alive_interval_ms / 1000)
-            if self.ws.is_open:
-                try:
-                    await self.query({
-                        'tag': 'iq',
-                        'attrs': {
-                            'id': self.generate_message_tag(),
-                            'to': S_WHATSAPP_NET,
-                            'type': 'get',
-                            'xmlns': 'w:p',
-                        },
-                        'content': [{'tag': 'ping', 'attrs': {}}]
-                    })
-                except Exception as e:
-                    self.logger.error(f"Error in sending keep alive: {e}")
-            else:
-                self.logger.warning("Keep alive called when WS not open")
+    async def _send_keep_alive(self):
+        if not self.ws.is_open:
+            self.logger.warning("Keep alive called when WS not open")
+            # nothing was sent, so there is no round trip to record
+            return False
+
+        await self.query({
+            'tag': 'iq',
+            'attrs': {
+                'id': self.generate_message_tag(),
+                'to': S_WHATSAPP_NET,
+                'type': 'get',
+                'xmlns': 'w:p',
+            },
+            'content': [{'tag': 'ping', 'attrs': {}}]
+        }, timeout_ms=self.config.keep_alive_interval_ms, use_template=True)
+
+    def _on_keep_alive_failed(self, error):
+        self.logger.error(f"Error in sending keep alive: {error}")
+        if self.closed or self.reconnect_task is not None:
+            return
+        if not self.config.options.get('auto_reconnect', True):
+            self._terminate(Exception(f"Connection was lost: {error}"))
+            return
+
+        # the peer stopped answering: drop the connection and reconnect; `reconnect` ends the
+        # socket once the policy gives up
+        self._start_reconnect()
 
     async def logout(self, msg=None):
         jid = self.creds.me.id if self.creds and self.creds.me else None
@@ -187,11 +459,18 @@ class Socket:
                         'reason': 'user_initiated'
                     }
                 }]
-            })
+            }, use_template=True)
 
-        self.end(Exception(msg or "Intentional Logout"))
+        await self.end(Exception(msg or "Intentional Logout"))
 
-    def end(self, error=None):
+    async def end(self, error=None):
+        """Close the socket for good: fail pending queries and queued frames, and wait until the transport is closed."""
+        self._terminate(error)
+        if self._close_task is not None:
+            await self._close_task
+
+    def _terminate(self, error=None):
+        """The part of `end` that runs at once, for callbacks that can't await; the transport close runs as `_close_task`."""
         if self.closed:
             return
 
@@ -199,7 +478,17 @@ class Socket:
         self.logger.info("Connection closed" if error is None else f"Connection error: {error}")
 
         if not self.ws.is_closed and not self.ws.is_closing:
-            self.ws.close()
+            self._close_task = asyncio.ensure_future(self.ws.close())
+
+        if self.keep_alive is not None:
+            self.keep_alive.stop()
+            self.keep_alive = None
+
+        if self.reconnect_task is not None and self.reconnect_task is not asyncio.current_task():
+            self.reconnect_task.cancel()
+
+        self.pending_queries.reject_all(error or Exception("Connection Closed"))
+        self.send_queue.close(error)
 
         self.ev.set()
 
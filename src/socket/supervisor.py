@@ -0,0 +1,293 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+from collections.abc import Mapping
+from multiprocessing.connection import Connection
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple
+from models.other_models import decode_binary_node, encode_binary_node
+
+if TYPE_CHECKING:
+    from defaults.defaults import SocketConfig
+
+logger = logging.getLogger(__name__)
+
+# Transport events forwarded from the workers by default.
+DEFAULT_FORWARDED_EVENTS = ('open', 'close', 'error', 'CB:message', 'CB:receipt', 'CB:notification', 'CB:call', 'CB:presence')
+
+# Message kinds on the worker pipes. Binary nodes cross the pipe in their
+# wabinary encoding, which is far smaller than a pickled dict tree.
+CMD_ADD = 'add'
+CMD_REMOVE = 'remove'
+CMD_STOP = 'stop'
+MSG_EVENT = 'event'
+PAYLOAD_NODE = 'node'
+PAYLOAD_VALUE = 'value'
+
+
+def rendezvous_rank(account_id: str, worker: int) -> bytes:
+    return hashlib.blake2b(f'{worker}:{account_id}'.encode(), digest_size=8).digest()
+
+def pick_worker(account_id: str, workers: Iterable[int]) -> int:
+    """
+    Rendezvous (highest random weight) hash of an account over the live
+    workers. Losing a worker only moves that worker's accounts, spread evenly
+    over the others.
+    """
+    return max(workers, key=lambda worker: rendezvous_rank(account_id, worker))
+
+def _encode_payload(value: Any) -> Tuple[str, Any]:
+    if isinstance(value, Mapping) and 'tag' in value:
+        return PAYLOAD_NODE, encode_binary_node(value)
+    if isinstance(value, BaseException):
+        return PAYLOAD_VALUE, repr(value)
+    return PAYLOAD_VALUE, value
+
+def _decode_payload(kind: str, value: Any) -> Any:
+    return decode_binary_node(value) if kind == PAYLOAD_NODE else value
+
+
+def _worker_main(conn: Connection, config_factory: Callable[[str], 'SocketConfig'], socket_factory: Optional[Callable[['SocketConfig'], Any]], manager_factory: Optional[Callable[..., Any]], events: Tuple[str, ...]) -> None:
+    asyncio.run(_run_worker(conn, config_factory, socket_factory, manager_factory, events))
+
+async def _run_worker(conn: Connection, config_factory: Callable[[str], 'SocketConfig'], socket_factory: Optional[Callable[['SocketConfig'], Any]], manager_factory: Optional[Callable[..., Any]], events: Tuple[str, ...]) -> None:
+    if manager_factory is None:
+        # only the workers run sessions, so only they load the socket stack
+        from .session_manager import SessionManager
+        manager_factory = SessionManager
+    loop = asyncio.get_running_loop()
+    stopped = loop.create_future()
+    manager = manager_factory(socket_factory=socket_factory) if socket_factory else manager_factory()
+    # references to the tasks started from callbacks, so they aren't collected while running
+    tasks: set = set()
+
+    def spawn(coro) -> None:
+        task = asyncio.ensure_future(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    def forward(account_id: str, event: str, *args: Any) -> None:
+        try:
+            conn.send((MSG_EVENT, account_id, event, [_encode_payload(arg) for arg in args]))
+        except (BrokenPipeError, OSError):
+            pass
+
+    def add(account_id: str) -> None:
+        sock = manager.add_session(account_id, config_factory(account_id))
+        for event in events:
+            sock.on(event, lambda *args, event=event: forward(account_id, event, *args))
+
+        async def connect() -> None:
+            try:
+                await manager.connect(account_id)
+            except Exception as e:
+                forward(account_id, 'error', e)
+        spawn(connect())
+
+    def on_command() -> None:
+        try:
+            command, *args = conn.recv()
+        except (EOFError, OSError):
+            # the supervisor went away
+            command, args = CMD_STOP, []
+
+        if command == CMD_ADD:
+            add(*args)
+        elif command == CMD_REMOVE:
+            spawn(manager.remove_session(*args))
+        elif command == CMD_STOP and not stopped.done():
+            stopped.set_result(None)
+
+    loop.add_reader(conn.fileno(), on_command)
+    try:
+        await stopped
+    finally:
+        loop.remove_reader(conn.fileno())
+        await manager.close()
+        conn.close()
+
+
+class WorkerHandle:
+    def __init__(self, index: int, process: multiprocessing.Process, conn: Connection) -> None:
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.accounts: set = set()
+        self.alive = True
+
+
+class Supervisor:
+    """
+    Shards accounts across `workers` processes, each running its own event
+    loop with a `SessionManager`.
+
+    Every account is placed by a rendezvous hash over the live workers and
+    stays there. Configured transport events are sent back to the parent and
+    passed to `on_event(account_id, event, *args)`. When a worker process
+    dies, its accounts are redistributed over the surviving workers.
+    With `respawn`, the dead slot is replaced by a fresh process that takes
+    new accounts.
+
+    `config_factory(account_id)` builds each account's config inside the
+    worker, so it (and `socket_factory`) must be picklable, i.e. module
+    level functions or classes. The same goes for `manager_factory`, which
+    replaces the workers' `SessionManager`.
+    """
+
+    def __init__(
+        self,
+        config_factory: Callable[[str], 'SocketConfig'],
+        workers: Optional[int] = None,
+        on_event: Optional[Callable[..., None]] = None,
+        events: Iterable[str] = DEFAULT_FORWARDED_EVENTS,
+        socket_factory: Optional[Callable[['SocketConfig'], Any]] = None,
+        manager_factory: Optional[Callable[..., Any]] = None,
+        respawn: bool = True,
+        mp_context: Optional[multiprocessing.context.BaseContext] = None,
+    ) -> None:
+        self.config_factory = config_factory
+        self.worker_count = workers or os.cpu_count() or 1
+        self.on_event = on_event
+        self.events = tuple(events)
+        self.socket_factory = socket_factory
+        self.manager_factory = manager_factory
+        self.respawn = respawn
+        self.mp_context = mp_context or multiprocessing.get_context('spawn')
+
+        self.workers: Dict[int, WorkerHandle] = {}
+        self.assignments: Dict[str, int] = {}
+        self.restarts = 0
+        self.rebalanced = 0
+        self.events_received = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        for index in range(self.worker_count):
+            self._spawn(index)
+
+    @property
+    def live_workers(self) -> List[int]:
+        return [index for index, worker in self.workers.items() if worker.alive]
+
+    def worker_for(self, account_id: str) -> int:
+        assigned = self.assignments.get(account_id)
+        if assigned is not None:
+            return assigned
+        return pick_worker(account_id, self.live_workers)
+
+    def add_session(self, account_id: str) -> int:
+        """Start an account on its worker and return that worker's index."""
+        if account_id in self.assignments:
+            raise ValueError(f'session "{account_id}" already exists')
+        index = self.worker_for(account_id)
+        self._assign(account_id, index)
+        return index
+
+    def remove_session(self, account_id: str) -> None:
+        index = self.assignments.pop(account_id, None)
+        if index is None:
+            return
+        worker = self.workers[index]
+        worker.accounts.discard(account_id)
+        if worker.alive:
+            worker.conn.send((CMD_REMOVE, account_id))
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        workers = list(self.workers.values())
+        for worker in workers:
+            # a worker that died was detached and its pipe closed by _on_exit
+            if not worker.alive:
+                continue
+            self._detach(worker)
+            try:
+                worker.conn.send((CMD_STOP,))
+            except OSError:
+                pass
+
+        for worker in workers:
+            await self._loop.run_in_executor(None, worker.process.join, timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.alive = False
+            worker.conn.close()
+        self.workers.clear()
+        self.assignments.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            'workers': len(self.live_workers),
+            'sessions': len(self.assignments),
+            'sessions_per_worker': {index: len(worker.accounts) for index, worker in self.workers.items() if worker.alive},
+            'restarts': self.restarts,
+            'rebalanced': self.rebalanced,
+            'events_received': self.events_received,
+        }
+
+    def _spawn(self, index: int) -> WorkerHandle:
+        parent_conn, child_conn = self.mp_context.Pipe()
+        process = self.mp_context.Process(
+            target=_worker_main,
+            args=(child_conn, self.config_factory, self.socket_factory, self.manager_factory, self.events),
+            name=f'wa-worker-{index}',
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+
+        worker = self.workers[index] = WorkerHandle(index, process, parent_conn)
+        self._loop.add_reader(parent_conn.fileno(), self._on_message, worker)
+        self._loop.add_reader(process.sentinel, self._on_exit, worker)
+        return worker
+
+    def _detach(self, worker: WorkerHandle) -> None:
+        for fd in (worker.conn.fileno(), worker.process.sentinel):
+            self._loop.remove_reader(fd)
+
+    def _assign(self, account_id: str, index: int) -> None:
+        worker = self.workers[index]
+        self.assignments[account_id] = index
+        worker.accounts.add(account_id)
+        worker.conn.send((CMD_ADD, account_id))
+
+    def _on_message(self, worker: WorkerHandle) -> None:
+        try:
+            kind, account_id, event, args = worker.conn.recv()
+        except (EOFError, OSError):
+            # the pipe closing means the process is going; _on_exit handles it
+            self._loop.remove_reader(worker.conn.fileno())
+            return
+
+        if kind != MSG_EVENT or self.assignments.get(account_id) != worker.index:
+            return
+        self.events_received += 1
+        if self.on_event is not None:
+            try:
+                self.on_event(account_id, event, *(_decode_payload(*arg) for arg in args))
+            except Exception as e:
+                logger.error(f"Error in supervisor event callback: {e}")
+
+    def _on_exit(self, worker: WorkerHandle) -> None:
+        self._detach(worker)
+        worker.alive = False
+        worker.conn.close()
+        worker.process.join(0)
+        logger.warning(f"Worker {worker.index} exited with code {worker.process.exitcode}, moving {len(worker.accounts)} sessions")
+
+        orphans = list(worker.accounts)
+        worker.accounts.clear()
+        for account_id in orphans:
+            del self.assignments[account_id]
+
+        survivors = self.live_workers
+        if self.respawn:
+            self.restarts += 1
+            self._spawn(worker.index)
+
+        # the replacement only inherits sessions when there is nobody else to take them
+        targets = survivors or self.live_workers
+        if targets:
+            for account_id in orphans:
+                self._assign(account_id, pick_worker(account_id, targets))
+            self.rebalanced += len(orphans)
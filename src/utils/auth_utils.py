@@ -5,7 +5,7 @@ from cachetools import TTLCache
 from loguru import logger
 from defaults.defaults import DEFAULT_CACHE_TTLS
 from models.sock_models import AuthenticationCreds, CacheStore, SignalDataSet, SignalDataTypeMap, SignalKeyStore, SignalKeyStoreWithTransaction, TransactionCapabilityOptions
-from .crypto_utils import Curve, signed_key_pair
+from .crypto_utils import Curve, generate_x25519_key_pair, signed_key_pair
 from .generics_utils import delay, generate_registration_id
 
 T = TypeVar('T')
@@ -139,7 +139,7 @@ def add_transaction_capability(
 def init_auth_creds() -> AuthenticationCreds:
     identity_key = Curve.generate_key_pair()
     return AuthenticationCreds(
-        noise_key=Curve.generate_key_pair(),
+        noise_key=generate_x25519_key_pair(),
         pairing_ephemeral_key_pair=Curve.generate_key_pair(),
         signed_identity_key=identity_key,
         signed_pre_key=signed_key_pair(identity_key, 1),
@@ -102,13 +102,14 @@ async def parse_and_inject_e2e_sessions(node: BinaryNode, repository: SignalRepo
             })
 
 def extract_device_jids(result: BinaryNode, my_jid: str, exclude_zero_devices: bool) -> List[JidWithDevice]:
-    my_user, my_device = jid_decode(my_jid)
+    my_decoded = jid_decode(my_jid)
+    my_user, my_device = my_decoded.user, my_decoded.device
     extracted: List[JidWithDevice] = []
     for node in result.content:
         list_node = get_binary_node_child(node, 'list')
         if list_node and isinstance(list_node.content, list):
             for item in list_node.content:
-                user = jid_decode(item.attrs['jid'])[0]
+                user = jid_decode(item.attrs['jid']).user
                 devices_node = get_binary_node_child(item, 'devices')
                 device_list_node = get_binary_node_child(devices_node, 'device-list')
                 if isinstance(device_list_node.content, list):
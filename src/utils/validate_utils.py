@@ -87,7 +87,8 @@ def generate_mobile_node(config: SocketConfig) -> IClientPayload:
     return IClientPayload.from_object(payload)
 
 def generate_login_node(user_jid: str, config: SocketConfig) -> IClientPayload:
-    user, device = jid_decode(user_jid)
+    decoded = jid_decode(user_jid)
+    user, device = decoded.user, decoded.device
     payload = IClientPayload(
         **get_client_payload(config),
         passive=True,
@@ -0,0 +1,430 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from models.other_models import (
+    STRING_CACHE_SIZE, BinaryNode, BinaryNodeDecoder, BinaryNodeEncoder, decode_binary_node, decode_binary_node_lazy,
+    encode_binary_node, encode_binary_node_into, pack_hex, pack_nibbles, unpack_hex, unpack_nibbles,
+)
+from wabinary.corpus import load_corpus
+from wabinary.generic import (
+    buffer_to_uint, get_binary_node_child, get_binary_node_child_buffer, get_binary_node_child_index,
+    get_binary_node_child_uint, get_binary_node_children,
+)
+from wabinary.jid import JID_DECODE_CACHE_SIZE, jid_decode, jid_decode_many, jid_encode
+
+# Conformance and throughput runner for the wabinary codec.
+#
+#   python -m wabinary.benchmark --output bench.json
+#
+# For every corpus stanza it checks that decoding and re-encoding reproduces
+# the exact bytes, then times encode and decode and measures their memory
+# allocation with tracemalloc. The micro benchmarks below time single codec
+# paths in isolation. The report is JSON so runs can be compared across
+# releases.
+
+def count_nodes(node: BinaryNode) -> int:
+    content = node.get('content')
+    if isinstance(content, list):
+        return 1 + sum(count_nodes(item) for item in content)
+    return 1
+
+def check_conformance(node: BinaryNode) -> Dict[str, Any]:
+    encoded = encode_binary_node(node)
+    try:
+        reencoded = encode_binary_node(decode_binary_node(encoded))
+    except Exception as e:
+        return {'ok': False, 'error': repr(e)}
+    return {'ok': reencoded == encoded}
+
+def time_ops(fn: Callable[[], Any], min_time_s: float) -> Dict[str, float]:
+    """Run `fn` in growing batches until a batch takes at least `min_time_s`."""
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time_s:
+            return {'iterations': iterations, 'seconds': elapsed, 'ops_per_sec': iterations / elapsed}
+        iterations *= 2
+
+def measure_allocations(fn: Callable[[], Any]) -> Dict[str, int]:
+    """Peak bytes allocated by one call of `fn`, and bytes/blocks still held by its result."""
+    # leave out what tracemalloc allocates for its own snapshots
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot().filter_traces(filters)
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        stats = tracemalloc.take_snapshot().filter_traces(filters).compare_to(before, 'filename')
+    finally:
+        tracemalloc.stop()
+    del result
+    return {
+        'peak_bytes': peak,
+        'retained_bytes': sum(stat.size_diff for stat in stats),
+        'retained_blocks': sum(stat.count_diff for stat in stats),
+    }
+
+def bench_stanza(node: BinaryNode, min_time_s: float) -> Dict[str, Any]:
+    encoded = encode_binary_node(node)
+    nodes = count_nodes(node)
+
+    encode = time_ops(lambda: encode_binary_node(node), min_time_s)
+    decode = time_ops(lambda: decode_binary_node(encoded), min_time_s)
+    encode_alloc = measure_allocations(lambda: encode_binary_node(node))
+    decode_alloc = measure_allocations(lambda: decode_binary_node(encoded))
+
+    def summary(timing: Dict[str, float], alloc: Dict[str, int]) -> Dict[str, Any]:
+        return {
+            'ops_per_sec': timing['ops_per_sec'],
+            'nodes_per_sec': timing['ops_per_sec'] * nodes,
+            'bytes_per_sec': timing['ops_per_sec'] * len(encoded),
+            'iterations': timing['iterations'],
+            'peak_bytes_per_node': alloc['peak_bytes'] / nodes,
+            'retained_blocks_per_node': alloc['retained_blocks'] / nodes,
+            'retained_bytes_per_node': alloc['retained_bytes'] / nodes,
+        }
+
+    return {
+        'nodes': nodes,
+        'encoded_bytes': len(encoded),
+        'conformance': check_conformance(node),
+        'encode': summary(encode, encode_alloc),
+        'decode': summary(decode, decode_alloc),
+    }
+
+def _string_values(count: int, start: int = 0) -> List[str]:
+    """Distinct attribute values in the usual mix: message ids, JIDs, device JIDs, timestamps and plain words."""
+    makers = (
+        lambda i: '3EB0%016X' % (i * 0x9E3779B97F4A7C15 % (1 << 64)),
+        lambda i: '%d@s.whatsapp.net' % (491000000000 + i),
+        lambda i: '%d:%d@s.whatsapp.net' % (491000000000 + i, i % 7 + 1),
+        lambda i: str(1700000000 + i),
+        lambda i: 'word-%x' % i,
+    )
+    return [makers[i % len(makers)](i) for i in range(start, start + count)]
+
+def bench_write_string(min_time_s: float, batch: int = 1000) -> Dict[str, Any]:
+    """
+    `BinaryNodeEncoder.write_string` on non-token strings. Cold cycles through
+    more distinct values than the string cache holds, so every write is a
+    miss; warm repeats a set that fits in it.
+    """
+    cold_values = _string_values(4 * STRING_CACHE_SIZE, start=10 ** 6)
+    warm_values = _string_values(batch)
+    position = 0
+
+    def write_cold() -> None:
+        nonlocal position
+        write = BinaryNodeEncoder().write_string
+        for value in cold_values[position:position + batch]:
+            write(value)
+        position = (position + batch) % len(cold_values)
+
+    def write_warm() -> None:
+        write = BinaryNodeEncoder().write_string
+        for value in warm_values:
+            write(value)
+
+    write_warm()
+    return {
+        name: {'strings_per_sec': timing['ops_per_sec'] * batch, 'us_per_string': 1e6 / (timing['ops_per_sec'] * batch)}
+        for name, timing in (('cold', time_ops(write_cold, min_time_s)), ('warm', time_ops(write_warm, min_time_s)))
+    }
+
+def bench_decode_stream(min_time_s: float) -> Dict[str, Any]:
+    """Every corpus stanza written back to back and read with one `BinaryNodeDecoder`, as a stream of frames is."""
+    corpus = list(load_corpus().values())
+    stream = b''.join(encode_binary_node(node) for node in corpus)
+
+    def decode() -> None:
+        read_node = BinaryNodeDecoder(stream).read_node
+        for _ in corpus:
+            read_node()
+
+    timing = time_ops(decode, min_time_s)
+    return {
+        'stanzas_per_sec': timing['ops_per_sec'] * len(corpus),
+        'nodes_per_sec': timing['ops_per_sec'] * sum(map(count_nodes, corpus)),
+        'bytes_per_sec': timing['ops_per_sec'] * len(stream),
+    }
+
+def bench_encode_into(min_time_s: float, names: Tuple[str, ...] = ('iq_ping', 'usync_query', 'pre_key_upload', 'message')) -> Dict[str, Any]:
+    """Outbound iq/message stanzas encoded into a fresh buffer each time, and appended to one reused buffer."""
+    results = {}
+    for name, node in load_corpus(list(names)).items():
+        nodes = count_nodes(node)
+        buffer = bytearray()
+
+        def encode_reused() -> None:
+            buffer.clear()
+            encode_binary_node_into(node, buffer)
+
+        results[name] = {
+            mode: {'nodes_per_sec': timing['ops_per_sec'] * nodes, 'stanzas_per_sec': timing['ops_per_sec']}
+            for mode, timing in (
+                ('fresh', time_ops(lambda: encode_binary_node(node), min_time_s)),
+                ('reused', time_ops(encode_reused, min_time_s)),
+            )
+        }
+    return results
+
+def bench_pack(min_time_s: float) -> Dict[str, Any]:
+    """
+    Nibble packing over the user parts of the group notification's participant
+    JIDs, and hex packing over message ids, each with the matching unpack.
+    """
+    participants = load_corpus(['group_notification'])['group_notification']['content'][0]['content']
+    values = {
+        'nibble': ([jid_decode(node['attrs']['jid']).user for node in participants], pack_nibbles, unpack_nibbles),
+        'hex': (_string_values(1000)[::5], pack_hex, unpack_hex),
+    }
+
+    results = {}
+    for name, (strings, pack, unpack) in values.items():
+        packed = [(pack(s), len(s) % 2 == 1) for s in strings]
+        results[name] = {
+            op: {'strings_per_sec': timing['ops_per_sec'] * len(strings), 'us_per_string': 1e6 / (timing['ops_per_sec'] * len(strings))}
+            for op, timing in (
+                ('pack', time_ops(lambda: [pack(s) for s in strings], min_time_s)),
+                ('unpack', time_ops(lambda: [unpack(data, odd) for data, odd in packed], min_time_s)),
+            )
+        }
+    return results
+
+def _device_list(devices: int) -> BinaryNode:
+    return {
+        'tag': 'device-list',
+        'attrs': {},
+        'content': [
+            {'tag': 'device', 'attrs': {'id': str(i), 'key-index': str(i % 64)}, 'content': i.to_bytes(32, 'big')}
+            for i in range(devices)
+        ] + [{'tag': 'key-index-list', 'attrs': {'ts': '1718000000'}, 'content': bytes(64)}],
+    }
+
+def bench_lazy_decode(min_time_s: float, devices: int = 5000) -> Dict[str, Any]:
+    """
+    A 5,000-child device-list stanza, decoded eagerly and lazily, for three
+    reads: the first device, the key index list after the devices, and every
+    device. Eager decodes the whole tree first; lazy decodes only what a read
+    reaches, and a child lookup stops at its match.
+    """
+    encoded = encode_binary_node(_device_list(devices))
+    reads = {
+        'first_device': lambda node: get_binary_node_child(node, 'device')['attrs'],
+        'key_index': lambda node: get_binary_node_child(node, 'key-index-list')['attrs'],
+        'all_devices': lambda node: [child['attrs'] for child in get_binary_node_children(node, 'device')],
+    }
+
+    results: Dict[str, Any] = {}
+    for read_name, read in reads.items():
+        results[read_name] = {}
+        for name, decode in (('eager', decode_binary_node), ('lazy', decode_binary_node_lazy)):
+            timing = time_ops(lambda: read(decode(encoded)), min_time_s)
+            alloc = measure_allocations(lambda: (lambda node: (read(node), node))(decode(encoded)))
+            results[read_name][name] = {'us_per_stanza': 1e6 / timing['ops_per_sec'], **alloc}
+    return results
+
+def _pre_key_response(users: int) -> BinaryNode:
+    def key(key_id: int, signed: bool = False) -> BinaryNode:
+        content = [
+            {'tag': 'id', 'attrs': {}, 'content': key_id.to_bytes(3, 'big')},
+            {'tag': 'value', 'attrs': {}, 'content': bytes(32)},
+        ]
+        if signed:
+            content.append({'tag': 'signature', 'attrs': {}, 'content': bytes(64)})
+        return {'tag': 'skey' if signed else 'key', 'attrs': {}, 'content': content}
+
+    return {
+        'tag': 'iq',
+        'attrs': {'id': '12345.6789-5', 'from': 's.whatsapp.net', 'type': 'result'},
+        'content': [{'tag': 'list', 'attrs': {}, 'content': [{
+            'tag': 'user',
+            'attrs': {'jid': '%d@s.whatsapp.net' % (491000000000 + i)},
+            'content': [
+                {'tag': 'registration', 'attrs': {}, 'content': i.to_bytes(4, 'big')},
+                {'tag': 'type', 'attrs': {}, 'content': bytes([5])},
+                {'tag': 'identity', 'attrs': {}, 'content': bytes(32)},
+                key(i),
+                key(1, signed=True),
+            ],
+        } for i in range(users)]}],
+    }
+
+def bench_child_index(min_time_s: float, users: int = 1000) -> Dict[str, Any]:
+    """
+    The lookups `parse_and_inject_e2e_sessions` makes on a 1,000-user pre-key
+    response: through the scanning helpers, and through a tag index built once
+    per user node with `get_binary_node_child_index`.
+    """
+    node = decode_binary_node(encode_binary_node(_pre_key_response(users)))
+
+    def read_key(key: Optional[BinaryNode]) -> None:
+        get_binary_node_child_uint(key, 'id', 3)
+        get_binary_node_child_buffer(key, 'value')
+        get_binary_node_child_buffer(key, 'signature')
+
+    def parse_scan() -> None:
+        for user in get_binary_node_children(get_binary_node_child(node, 'list'), 'user'):
+            read_key(get_binary_node_child(user, 'skey'))
+            read_key(get_binary_node_child(user, 'key'))
+            get_binary_node_child_buffer(user, 'identity')
+            get_binary_node_child_uint(user, 'registration', 4)
+
+    def parse_indexed() -> None:
+        for user in get_binary_node_child_index(get_binary_node_child(node, 'list')).get('user', ()):
+            children = get_binary_node_child_index(user)
+            read_key(children['skey'][0])
+            read_key(children['key'][0])
+            children['identity'][0]['content']
+            buffer_to_uint(children['registration'][0]['content'], 4)
+
+    return {
+        name: {'us_per_response': 1e6 / timing['ops_per_sec'], 'users_per_sec': timing['ops_per_sec'] * users}
+        for name, timing in (('scan', time_ops(parse_scan, min_time_s)), ('indexed', time_ops(parse_indexed, min_time_s)))
+    }
+
+def bench_compact_nodes(min_time_s: float, names: Tuple[str, ...] = ('usync_result', 'group_notification')) -> Dict[str, Any]:
+    """Per-node memory held by a decoded tree, and encode/decode speed, for dict and `CompactBinaryNode` trees."""
+    results = {}
+    for name, node in load_corpus(list(names)).items():
+        encoded = encode_binary_node(node)
+        nodes = count_nodes(node)
+        results[name] = {}
+        for mode, compact in (('dict', False), ('compact', True)):
+            tree = decode_binary_node(encoded, compact=compact)
+            alloc = measure_allocations(lambda: decode_binary_node(encoded, compact=compact))
+            decode = time_ops(lambda: decode_binary_node(encoded, compact=compact), min_time_s)
+            encode = time_ops(lambda: encode_binary_node(tree), min_time_s)
+            results[name][mode] = {
+                'retained_bytes_per_node': alloc['retained_bytes'] / nodes,
+                'decode_nodes_per_sec': decode['ops_per_sec'] * nodes,
+                'encode_nodes_per_sec': encode['ops_per_sec'] * nodes,
+            }
+    return results
+
+def _jid_values(count: int, start: int = 0) -> List[str]:
+    """Distinct JIDs in a mixed workload: users, devices, agent and device suffixes, lid users and groups."""
+    makers = (
+        lambda i: '%d@s.whatsapp.net' % (491000000000 + i),
+        lambda i: '%d:%d@s.whatsapp.net' % (491000000000 + i, i % 7 + 1),
+        lambda i: '%d_1:%d@s.whatsapp.net' % (491000000000 + i, i % 7 + 1),
+        lambda i: '%d@lid' % (10 ** 14 + i),
+        lambda i: '%d:%d@lid' % (10 ** 14 + i, i % 7 + 1),
+        lambda i: '120363%012d@g.us' % i,
+    )
+    return [makers[i % len(makers)](i) for i in range(start, start + count)]
+
+def bench_jid_decode(min_time_s: float, batch: int = 1000) -> Dict[str, Any]:
+    """
+    `jid_decode` on a mixed workload. Cold cycles through more distinct JIDs
+    than the decode cache holds, so every call parses; warm repeats a set that
+    fits in it, like group participants and our own device JID.
+    """
+    cold_values = _jid_values(4 * JID_DECODE_CACHE_SIZE, start=10 ** 6)
+    warm_values = _jid_values(batch)
+    position = 0
+
+    def decode_cold() -> None:
+        nonlocal position
+        for value in cold_values[position:position + batch]:
+            jid_decode(value)
+        position = (position + batch) % len(cold_values)
+
+    def decode_warm() -> None:
+        for value in warm_values:
+            jid_decode(value)
+
+    decode_warm()
+    return {
+        name: {'decodes_per_sec': timing['ops_per_sec'] * batch, 'us_per_decode': 1e6 / (timing['ops_per_sec'] * batch)}
+        for name, timing in (('cold', time_ops(decode_cold, min_time_s)), ('warm', time_ops(decode_warm, min_time_s)))
+    }
+
+def bench_jid_decode_many(min_time_s: float, participants: int = 5000) -> Dict[str, Any]:
+    """
+    A 5,000-entry participant list, one in ten repeated and one in five on
+    'c.us', decoded into columns by `jid_decode_many`, against the per-JID
+    loop building a dict for each.
+    """
+    jids = _jid_values(participants)
+    jids = [jid.replace('@s.whatsapp.net', '@c.us') if i % 5 == 0 else jid for i, jid in enumerate(jids)]
+    jids += jids[::10]
+
+    def per_jid() -> List[Dict[str, Any]]:
+        seen = set()
+        records = []
+        for jid in jids:
+            decoded = jid_decode(jid)
+            if not decoded:
+                continue
+            server = 's.whatsapp.net' if decoded.server == 'c.us' else decoded.server
+            key = (decoded.user, decoded.device, server)
+            if key not in seen:
+                seen.add(key)
+                records.append({
+                    'jid': jid_encode(decoded.user, server, decoded.device),
+                    'user': decoded.user,
+                    'device': decoded.device,
+                    'server': server,
+                    'domainType': decoded.domainType,
+                })
+        return records
+
+    return {
+        name: {'jids_per_sec': timing['ops_per_sec'] * len(jids), 'us_per_list': 1e6 / timing['ops_per_sec']}
+        for name, timing in (('batch', time_ops(lambda: jid_decode_many(jids), min_time_s)), ('per_jid', time_ops(per_jid, min_time_s)))
+    }
+
+MICRO_BENCHMARKS: Dict[str, Callable[[float], Dict[str, Any]]] = {
+    'write_string': bench_write_string,
+    'decode_stream': bench_decode_stream,
+    'encode_into': bench_encode_into,
+    'pack': bench_pack,
+    'lazy_decode': bench_lazy_decode,
+    'child_index': bench_child_index,
+    'compact_nodes': bench_compact_nodes,
+    'jid_decode': bench_jid_decode,
+    'jid_decode_many': bench_jid_decode_many,
+}
+
+def run_benchmarks(names: Optional[List[str]] = None, min_time_s: float = 0.2, micro: bool = True) -> Dict[str, Any]:
+    corpus = load_corpus(names)
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'timestamp': int(time.time()),
+        'min_time_s': min_time_s,
+        'stanzas': {name: bench_stanza(node, min_time_s) for name, node in corpus.items()},
+        'micro': {name: bench(min_time_s) for name, bench in MICRO_BENCHMARKS.items()} if micro else {},
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='wabinary codec conformance and throughput benchmark')
+    parser.add_argument('stanzas', nargs='*', help='corpus entries to run (default: all)')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds per timed measurement')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    parser.add_argument('--no-micro', action='store_true', help='only run the corpus stanzas')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.stanzas or None, args.min_time, not args.no_micro)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text)
+    else:
+        print(text)
+
+    # non-zero exit when a stanza fails to round trip, so CI can gate on it
+    return 0 if all(result['conformance']['ok'] for result in report['stanzas'].values()) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -294,19 +294,43 @@ class BinaryNodeCodingOptions:
 ]
 
     @staticmethod
-    def generate_token_map():
+    def generate_token_map(single_byte_tokens, double_byte_tokens):
         token_map = {}
 
         # Add SINGLE_BYTE_TOKENS to TOKEN_MAP
-        for index, token in enumerate(BinaryNodeCodingOptions.SINGLE_BYTE_TOKENS):
+        for index, token in enumerate(single_byte_tokens):
             if token:
                 token_map[token] = {'index': index}
 
         # Add DOUBLE_BYTE_TOKENS to TOKEN_MAP if available
-        for i, dict_tokens in enumerate(BinaryNodeCodingOptions.DOUBLE_BYTE_TOKENS):
+        for i, dict_tokens in enumerate(double_byte_tokens):
             for j, token in enumerate(dict_tokens):
                 token_map[token] = {'dict': i, 'index': j}
 
         return token_map
 
-    TOKEN_MAP = generate_token_map()
+    TOKEN_MAP = generate_token_map(SINGLE_BYTE_TOKENS, DOUBLE_BYTE_TOKENS)
+
+    @staticmethod
+    def generate_token_bytes(token_map, dictionary_0):
+        # Full encoded form of every token, so the encoder can emit it in one write
+        return {
+            token: bytes([dictionary_0 + index['dict'], index['index']]) if 'dict' in index else bytes([index['index']])
+            for token, index in token_map.items()
+        }
+
+    @staticmethod
+    def generate_token_table(single_byte_tokens, double_byte_tokens):
+        # Flat decode table: single byte tokens live at [0, 256), token j of
+        # dictionary i lives at ((i + 1) << 8) | j. Unused slots are None.
+        table = [None] * ((len(double_byte_tokens) + 1) << 8)
+        for index, token in enumerate(single_byte_tokens):
+            if token:
+                table[index] = token
+        for i, dict_tokens in enumerate(double_byte_tokens):
+            for j, token in enumerate(dict_tokens):
+                table[((i + 1) << 8) | j] = token
+        return tuple(table)
+
+    TOKEN_BYTES = generate_token_bytes(TOKEN_MAP, TAGS['DICTIONARY_0'])
+    TOKEN_TABLE = generate_token_table(SINGLE_BYTE_TOKENS, DOUBLE_BYTE_TOKENS)
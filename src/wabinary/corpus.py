@@ -0,0 +1,166 @@
+import random
+from typing import Callable, Dict, List, Optional
+from models.other_models import BinaryNode
+from wabinary.jid import S_WHATSAPP_NET
+
+# Representative stanzas for codec conformance checks and benchmarks. Every
+# builder is seeded, so the same corpus (and the same encoded bytes) comes out
+# of every run.
+
+def _rng(seed: int) -> random.Random:
+    return random.Random(seed)
+
+def _user_jid(rng: random.Random, server: str = 's.whatsapp.net') -> str:
+    return f"{rng.randrange(10 ** 10, 10 ** 13)}@{server}"
+
+def _message_id(rng: random.Random) -> str:
+    return '3EB0' + rng.randbytes(8).hex().upper()
+
+def presence() -> BinaryNode:
+    rng = _rng(1)
+    return {
+        'tag': 'presence',
+        'attrs': {'from': _user_jid(rng), 'type': 'unavailable', 'last': '1718000000'},
+    }
+
+def receipt() -> BinaryNode:
+    rng = _rng(2)
+    return {
+        'tag': 'receipt',
+        'attrs': {
+            'id': _message_id(rng),
+            'from': _user_jid(rng),
+            'participant': f"{rng.randrange(10 ** 10, 10 ** 13)}:{rng.randrange(1, 20)}@s.whatsapp.net",
+            'type': 'read',
+            't': '1718000000',
+        },
+        'content': [{
+            'tag': 'list',
+            'attrs': {},
+            'content': [{'tag': 'item', 'attrs': {'id': _message_id(rng)}} for _ in range(5)],
+        }],
+    }
+
+def iq_ping() -> BinaryNode:
+    return {
+        'tag': 'iq',
+        'attrs': {'id': '12345.6789-1', 'to': S_WHATSAPP_NET, 'type': 'get', 'xmlns': 'w:p'},
+        'content': [{'tag': 'ping', 'attrs': {}}],
+    }
+
+def message() -> BinaryNode:
+    rng = _rng(3)
+    return {
+        'tag': 'message',
+        'attrs': {'id': _message_id(rng), 'to': _user_jid(rng), 'type': 'text'},
+        'content': [
+            {'tag': 'enc', 'attrs': {'v': '2', 'type': 'msg'}, 'content': rng.randbytes(180)},
+            {'tag': 'device-identity', 'attrs': {}, 'content': rng.randbytes(400)},
+        ],
+    }
+
+def usync_query(users: int = 50) -> BinaryNode:
+    rng = _rng(4)
+    return {
+        'tag': 'iq',
+        'attrs': {'id': '12345.6789-2', 'to': S_WHATSAPP_NET, 'type': 'get', 'xmlns': 'usync'},
+        'content': [{
+            'tag': 'usync',
+            'attrs': {'sid': '12345.6789-3', 'mode': 'query', 'last': 'true', 'index': '0', 'context': 'message'},
+            'content': [
+                {'tag': 'query', 'attrs': {}, 'content': [{'tag': 'devices', 'attrs': {'version': '2'}}]},
+                {'tag': 'list', 'attrs': {}, 'content': [{'tag': 'user', 'attrs': {'jid': _user_jid(rng)}} for _ in range(users)]},
+            ],
+        }],
+    }
+
+def usync_result(users: int = 500) -> BinaryNode:
+    rng = _rng(5)
+    return {
+        'tag': 'iq',
+        'attrs': {'id': '12345.6789-2', 'from': S_WHATSAPP_NET, 'type': 'result'},
+        'content': [{
+            'tag': 'usync',
+            'attrs': {'sid': '12345.6789-3', 'mode': 'query', 'last': 'true', 'index': '0', 'context': 'message'},
+            'content': [{
+                'tag': 'list',
+                'attrs': {},
+                'content': [{
+                    'tag': 'user',
+                    'attrs': {'jid': _user_jid(rng)},
+                    'content': [{
+                        'tag': 'devices',
+                        'attrs': {},
+                        'content': [{
+                            'tag': 'device-list',
+                            'attrs': {},
+                            'content': [
+                                {'tag': 'device', 'attrs': {'id': str(device), 'key-index': str(device)}}
+                                for device in range(rng.randrange(1, 5))
+                            ],
+                        }],
+                    }],
+                } for _ in range(users)],
+            }],
+        }],
+    }
+
+def pre_key_upload(keys: int = 30) -> BinaryNode:
+    rng = _rng(6)
+    return {
+        'tag': 'iq',
+        'attrs': {'id': '12345.6789-4', 'xmlns': 'encrypt', 'type': 'set', 'to': S_WHATSAPP_NET},
+        'content': [
+            {'tag': 'registration', 'attrs': {}, 'content': rng.randbytes(4)},
+            {'tag': 'type', 'attrs': {}, 'content': bytes([5])},
+            {'tag': 'identity', 'attrs': {}, 'content': rng.randbytes(32)},
+            {'tag': 'list', 'attrs': {}, 'content': [{
+                'tag': 'key',
+                'attrs': {},
+                'content': [
+                    {'tag': 'id', 'attrs': {}, 'content': i.to_bytes(3, 'big')},
+                    {'tag': 'value', 'attrs': {}, 'content': rng.randbytes(32)},
+                ],
+            } for i in range(1, keys + 1)]},
+            {'tag': 'skey', 'attrs': {}, 'content': [
+                {'tag': 'id', 'attrs': {}, 'content': bytes([0, 0, 1])},
+                {'tag': 'value', 'attrs': {}, 'content': rng.randbytes(32)},
+                {'tag': 'signature', 'attrs': {}, 'content': rng.randbytes(64)},
+            ]},
+        ],
+    }
+
+def group_notification(participants: int = 1000) -> BinaryNode:
+    rng = _rng(7)
+    return {
+        'tag': 'notification',
+        'attrs': {
+            'from': f"{rng.randrange(10 ** 17, 10 ** 18)}@g.us",
+            'type': 'w:gp2',
+            'id': str(rng.randrange(10 ** 9, 10 ** 10)),
+            'participant': _user_jid(rng),
+            't': '1718000000',
+        },
+        'content': [{
+            'tag': 'add',
+            'attrs': {'reason': 'invite'},
+            'content': [
+                {'tag': 'participant', 'attrs': {'jid': _user_jid(rng, 'lid' if i % 3 == 0 else 's.whatsapp.net')}}
+                for i in range(participants)
+            ],
+        }],
+    }
+
+CORPUS: Dict[str, Callable[[], BinaryNode]] = {
+    'presence': presence,
+    'receipt': receipt,
+    'iq_ping': iq_ping,
+    'message': message,
+    'usync_query': usync_query,
+    'usync_result': usync_result,
+    'pre_key_upload': pre_key_upload,
+    'group_notification': group_notification,
+}
+
+def load_corpus(names: Optional[List[str]] = None) -> Dict[str, BinaryNode]:
+    return {name: CORPUS[name]() for name in (names or CORPUS)}
@@ -1,30 +1,50 @@
-from typing import Optional, List, Dict, Union
+import json
+from typing import Any, Iterable, Optional, List, Dict, Union
 from google.protobuf.message import Message
 from proto.waproto_pb2 import WebMessageInfo  # Replace with your actual import
-from models.other_models import BinaryNode  # Replace with your actual import
+from models.other_models import BinaryNode, LazyBinaryNode  # Replace with your actual import
 
 # some extra useful utilities
 
+def _iter_children(node: BinaryNode) -> Iterable[BinaryNode]:
+    # lazy nodes hand out their children one at a time, so a lookup stops decoding at its match
+    if isinstance(node, LazyBinaryNode):
+        return node.iter_children()
+    content = node.get('content')
+    return content if isinstance(content, list) else ()
+
 def get_binary_node_children(node: Optional[BinaryNode], child_tag: str) -> List[BinaryNode]:
-    if node and isinstance(node.get('content'), list):
-        return [item for item in node['content'] if item['tag'] == child_tag]
+    if node:
+        return [item for item in _iter_children(node) if item['tag'] == child_tag]
     return []
 
+def get_binary_node_child_index(node: Optional[BinaryNode]) -> Dict[str, List[BinaryNode]]:
+    """
+    The node's children grouped by tag, in one pass. Nothing is cached: a
+    caller making many lookups on one large node builds this once and keeps
+    it; for a handful of lookups the plain helpers' scan is cheaper.
+    """
+    index: Dict[str, List[BinaryNode]] = {}
+    if node:
+        for item in _iter_children(node):
+            index.setdefault(item['tag'], []).append(item)
+    return index
+
 def get_all_binary_node_children(node: BinaryNode) -> List[BinaryNode]:
     if isinstance(node.get('content'), list):
         return node['content']
     return []
 
 def get_binary_node_child(node: Optional[BinaryNode], child_tag: str) -> Optional[BinaryNode]:
-    if node and isinstance(node.get('content'), list):
-        return next((item for item in node['content'] if item['tag'] == child_tag), None)
+    if node:
+        return next((item for item in _iter_children(node) if item['tag'] == child_tag), None)
     return None
 
-def get_binary_node_child_buffer(node: Optional[BinaryNode], child_tag: str) -> Optional[Union[bytes, bytearray]]:
+def get_binary_node_child_buffer(node: Optional[BinaryNode], child_tag: str) -> Optional[Union[bytes, bytearray, memoryview]]:
     child = get_binary_node_child(node, child_tag)
     if child:
         content = child.get('content')
-        if isinstance(content, (bytes, bytearray)):
+        if isinstance(content, (bytes, bytearray, memoryview)):
             return content
     return None
 
@@ -32,8 +52,8 @@ def get_binary_node_child_string(node: Optional[BinaryNode], child_tag: str) ->
     child = get_binary_node_child(node, child_tag)
     if child:
         content = child.get('content')
-        if isinstance(content, (bytes, bytearray)):
-            return content.decode('utf-8')
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            return str(content, 'utf-8')
         elif isinstance(content, str):
             return content
     return None
@@ -66,13 +86,19 @@ def get_binary_node_messages(node: BinaryNode) -> List[Message]:
                 msgs.append(WebMessageInfo.from_buffer(item['content']))
     return msgs
 
-def buffer_to_uint(buff: Union[bytes, bytearray], length: int) -> int:
+def buffer_to_uint(buff: Union[bytes, bytearray, memoryview], length: int) -> int:
     result = 0
     for i in range(length):
         result = 256 * result + buff[i]
     return result
 
-def binary_node_to_string(node: Optional[Union[BinaryNode, List[BinaryNode]]], indent: int = 0) -> str:
+def _truncated_hex(buff: Union[bytes, bytearray, memoryview], max_bytes: Optional[int]) -> str:
+    if max_bytes is not None and len(buff) > max_bytes:
+        return f"{bytes(buff[:max_bytes]).hex()}...({len(buff)} bytes)"
+    return buff.hex()
+
+def binary_node_to_string(node: Optional[Union[BinaryNode, List[BinaryNode]]], indent: int = 0, max_bytes: Optional[int] = None, max_children: Optional[int] = None) -> str:
+    """Render a node as XML-like text; `max_bytes` and `max_children` truncate binary payloads and child lists."""
     def tabs(n: int) -> str:
         return '\t' * n
 
@@ -82,13 +108,65 @@ def binary_node_to_string(node: Optional[Union[BinaryNode, List[BinaryNode]]], i
     if isinstance(node, str):
         return tabs(indent) + node
 
-    if isinstance(node, (bytes, bytearray)):
-        return tabs(indent) + node.hex()
+    if isinstance(node, (bytes, bytearray, memoryview)):
+        return tabs(indent) + _truncated_hex(node, max_bytes)
 
     if isinstance(node, list):
-        return '\n'.join(tabs(indent + 1) + binary_node_to_string(x, indent + 1) for x in node)
+        shown = node if max_children is None else node[:max_children]
+        lines = [tabs(indent + 1) + binary_node_to_string(x, indent + 1, max_bytes, max_children) for x in shown]
+        if len(shown) < len(node):
+            lines.append(tabs(indent + 2) + f"...({len(node) - len(shown)} more)")
+        return '\n'.join(lines)
 
-    children = binary_node_to_string(node.get('content'), indent + 1)
+    children = binary_node_to_string(node.get('content'), indent + 1, max_bytes, max_children)
     tag = f"<{node['tag']} " + ' '.join(f"{k}='{v}'" for k, v in (node.get('attrs') or {}).items() if v is not None) + '>'
     content = f">\n{children}\n{tabs(indent)}</{node['tag']}>" if children else '/>'
     return tag + content
+
+def binary_node_to_dict(node: Optional[Union[BinaryNode, List[BinaryNode]]], max_bytes: Optional[int] = None, max_children: Optional[int] = None) -> Any:
+    """JSON serialisable form of a node, truncated like `binary_node_to_string`."""
+    if node is None or isinstance(node, str):
+        return node
+
+    if isinstance(node, (bytes, bytearray, memoryview)):
+        return {'bytes': len(node), 'hex': _truncated_hex(node, max_bytes)}
+
+    if isinstance(node, list):
+        shown = node if max_children is None else node[:max_children]
+        result = [binary_node_to_dict(x, max_bytes, max_children) for x in shown]
+        if len(shown) < len(node):
+            result.append({'truncated': len(node) - len(shown)})
+        return result
+
+    result = {
+        'tag': node['tag'],
+        'attrs': {k: v for k, v in (node.get('attrs') or {}).items() if v is not None},
+    }
+    if node.get('content') is not None:
+        result['content'] = binary_node_to_dict(node['content'], max_bytes, max_children)
+    return result
+
+class LazyBinaryNodeFormat:
+    """
+    Defers rendering a node until a log record is actually emitted.
+
+    Pass it as a logging argument (`logger.debug('sent %s', LazyBinaryNodeFormat(node))`)
+    and `binary_node_to_string` only runs if a handler formats the record.
+    Binary payloads and child lists are truncated at `max_bytes`/`max_children`
+    (None for no limit). With `structured` the text form is JSON, and `to_dict`
+    gives the dict for structured log sinks.
+    """
+
+    def __init__(self, node: Optional[Union[BinaryNode, List[BinaryNode]]], max_bytes: Optional[int] = 64, max_children: Optional[int] = 32, structured: bool = False) -> None:
+        self.node = node
+        self.max_bytes = max_bytes
+        self.max_children = max_children
+        self.structured = structured
+
+    def to_dict(self) -> Any:
+        return binary_node_to_dict(self.node, self.max_bytes, self.max_children)
+
+    def __str__(self) -> str:
+        if self.structured:
+            return json.dumps(self.to_dict())
+        return binary_node_to_string(self.node, max_bytes=self.max_bytes, max_children=self.max_children)
@@ -1,71 +1,135 @@
-# from typing import Literal, TypedDict, Optional, Union
+import sys
+from functools import lru_cache
+from typing import Iterable, List, Literal, NamedTuple, TypedDict, Optional, Union
 
-# S_WHATSAPP_NET = "@s.whatsapp.net"
-# OFFICIAL_BIZ_JID = "16505361212@c.us"
-# SERVER_JID = "server@c.us"
-# PSA_WID = "0@c.us"
-# STORIES_JID = "status@broadcast"
+S_WHATSAPP_NET = "@s.whatsapp.net"
+OFFICIAL_BIZ_JID = "16505361212@c.us"
+SERVER_JID = "server@c.us"
+PSA_WID = "0@c.us"
+STORIES_JID = "status@broadcast"
 
-# JidServer = Literal["c.us", "g.us", "broadcast", "s.whatsapp.net", "call", "lid"]
+JidServer = Literal["c.us", "g.us", "broadcast", "s.whatsapp.net", "call", "lid"]
 
+# Number of distinct JIDs `jid_decode` keeps decoded. Group participants and our
+# own device JID repeat constantly, so they are served from this cache.
+JID_DECODE_CACHE_SIZE = 4096
 
-# class JidWithDevice(TypedDict):
-#     user: str
-#     device: Optional[int]
 
+class JidWithDevice(TypedDict):
+    user: str
+    device: Optional[int]
 
-# class FullJid(JidWithDevice):
-#     server: Union[JidServer, str]
-#     domainType: Optional[int]
-    
-    
-# def jid_encode(user: Optional[str | int], server: JidServer, device: Optional[int] = None, agent: Optional[int] = None) -> str:
-#     """
-#     Encodes a user ID, server, and optional device/agent information into a WhatsApp JID (Jabber ID).
 
-#     Args:
-#         user: The user ID (phone number or other identifier).
-#         server: The server type (e.g., "c.us" for individual chats).
-#         device: Optional device ID.
-#         agent: Optional agent ID.
-
-#     Returns:
-#         The encoded JID string.
-#     """
-
-#     jid = f"{user or ''}{f'_{agent}' if agent else ''}{f':{device}' if device else ''}@{server}"
-#     return jid
-
-# def jid_decode(jid: Optional[str]) -> Optional[FullJid]:
-#     """
-#     Decodes a WhatsApp JID (Jabber ID) into its components.
-
-#     Args:
-#         jid: The JID string to decode.
-
-#     Returns:
-#         A FullJid object containing the decoded components, or None if the JID is invalid.
-#     """
-
-#     if not jid or not isinstance(jid, str):
-#         return None
-
-#     sep_idx = jid.find('@')
-#     if sep_idx < 0:
-#         return None
-
-#     server = jid[sep_idx + 1 :]
-#     user_combined = jid[:sep_idx]
-
-#     user_agent, *device_part = user_combined.split(':')  # Use unpacking for device
-#     user, *_ = user_agent.split('_')  # Use unpacking to ignore potential agent part
-
-#     return {
-#         "server": server,
-#         "user": user,
-#         "domainType": 1 if server == "lid" else 0,
-#         "device": int(device_part[0]) if device_part else None
-#     }
-
-from proto.waproto_pb2 import Message
-print(Message)
\ No newline at end of file
+class JidColumns(NamedTuple):
+    """Decoded JIDs as parallel lists, as returned by `jid_decode_many`."""
+    jids: List[str]
+    users: List[str]
+    devices: List[Optional[int]]
+    servers: List[str]
+    domain_types: List[int]
+
+
+class FullJid(NamedTuple):
+    """Decoded JID. Immutable, so cached instances are shared between callers."""
+    user: str
+    server: Union[JidServer, str]
+    device: Optional[int] = None
+    domainType: int = 0
+
+
+def jid_encode(user: Optional[Union[str, int]], server: JidServer, device: Optional[int] = None, agent: Optional[int] = None) -> str:
+    """
+    Encodes a user ID, server, and optional device/agent information into a WhatsApp JID (Jabber ID).
+
+    Args:
+        user: The user ID (phone number or other identifier).
+        server: The server type (e.g., "c.us" for individual chats).
+        device: Optional device ID.
+        agent: Optional agent ID.
+
+    Returns:
+        The encoded JID string.
+    """
+
+    return f"{user or ''}{f'_{agent}' if agent else ''}{f':{device}' if device else ''}@{server}"
+
+
+@lru_cache(maxsize=JID_DECODE_CACHE_SIZE)
+def _jid_decode(jid: str) -> Optional[FullJid]:
+    sep_idx = jid.find('@')
+    # servers come from a handful of values, interning lets every record share one string
+    server = sys.intern(jid[sep_idx + 1:])
+    user_combined = jid[:sep_idx]
+
+    user_agent, _, device = user_combined.partition(':')
+    user = user_agent.partition('_')[0]
+
+    if device:
+        # isdigit() also takes digits like '²' that int() rejects
+        if not (device.isascii() and device.isdecimal()):
+            return None
+        device = int(device)
+    else:
+        device = None
+
+    return FullJid(user, server, device, 1 if server == "lid" else 0)
+
+
+def jid_decode(jid: Optional[str]) -> Optional[FullJid]:
+    """
+    Decodes a WhatsApp JID (Jabber ID) into its components.
+
+    Args:
+        jid: The JID string to decode.
+
+    Returns:
+        A FullJid object containing the decoded components, or None if the JID is invalid.
+    """
+
+    # strings without an '@' are rejected before the cache so they can't evict real JIDs
+    if not jid or not isinstance(jid, str) or '@' not in jid:
+        return None
+    return _jid_decode(jid)
+
+
+def jid_normalized_user(jid: Optional[str]) -> str:
+    """The user part of a JID on its canonical server, without agent or device: 'c.us' becomes 's.whatsapp.net'."""
+    result = jid_decode(jid)
+    if not result:
+        return ''
+    return jid_encode(result.user, 's.whatsapp.net' if result.server == 'c.us' else result.server)
+
+
+def jid_decode_many(jids: Iterable[Optional[str]], dedupe: bool = True) -> JidColumns:
+    """
+    Decodes a batch of JIDs into parallel `users`/`devices`/`servers`/`domain_types` columns.
+
+    'c.us' JIDs are normalised to 's.whatsapp.net', and `jids` holds each entry
+    re-encoded in that normalised form (keeping the device). Invalid JIDs are
+    skipped. With `dedupe`, entries that normalise to the same user, device and
+    server are kept once, in first-seen order.
+    """
+    columns = JidColumns([], [], [], [], [])
+    # bound once, the loop runs for every participant of a large group
+    add_jid, add_user, add_device, add_server, add_domain_type = (column.append for column in columns)
+    seen = set()
+    for jid in jids:
+        decoded = jid_decode(jid)
+        if not decoded:
+            continue
+
+        user, server, device, domain_type = decoded
+        if server == 'c.us':
+            server = 's.whatsapp.net'
+        if dedupe:
+            key = (user, device, server)
+            if key in seen:
+                continue
+            seen.add(key)
+
+        add_jid(jid_encode(user, server, device))
+        add_user(user)
+        add_device(device)
+        add_server(server)
+        add_domain_type(domain_type)
+    return columns
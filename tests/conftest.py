@@ -0,0 +1,10 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Modules under src/ import each other absolutely (`from models.other_models import ...`), so src
+# goes on the path. It is appended: src/socket and src/types would otherwise shadow the
+# stdlib modules of the same name. The socket package is imported as `src.socket`.
+sys.path.insert(0, str(ROOT))
+sys.path.append(str(ROOT / 'src'))
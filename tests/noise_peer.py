@@ -0,0 +1,95 @@
+from typing import List, Optional
+from defaults.defaults import NOISE_WA_HEADER, WA_CERT_DETAILS
+from models.other_models import encode_binary_node
+from proto.waproto_pb2 import CertChain, HandshakeMessage
+from utils.crypto_utils import generate_x25519_key_pair, x25519_shared_key
+from wabinary.jid import S_WHATSAPP_NET
+from src.socket.client.framing import FrameReassembler
+from src.socket.noise_handler import NoiseHandler
+
+# The server side of WA's noise handshake, for the noise and socket tests and
+# the socket benchmarks. Nothing here talks to WA.
+
+
+class NoiseResponder:
+    """
+    Server side of the noise handshake, in place of WA's server. Feed it the
+    client's bytes with `receive`; it returns the encoded frames to send
+    back. After the handshake, each iq gets an empty result.
+    """
+
+    def __init__(self, intro_header: bytes = NOISE_WA_HEADER, issuer_serial: int = WA_CERT_DETAILS['SERIAL']) -> None:
+        self.ephemeral_key_pair = generate_x25519_key_pair()
+        self.static_key_pair = generate_x25519_key_pair()
+        self.noise = NoiseHandler(self.ephemeral_key_pair, intro_header, responder=True)
+        self.frames = FrameReassembler(intro_header)
+        self.issuer_serial = issuer_serial
+        self.client_static: Optional[bytes] = None
+        self.client_payload: Optional[bytes] = None
+
+    def receive(self, data: bytes) -> List[bytes]:
+        out = []
+        for frame in self.frames.feed(data):
+            response = self.handle(frame)
+            if response is not None:
+                out.append(self.noise.encode_frame(response))
+        return out
+
+    def handle(self, frame: memoryview) -> Optional[bytes]:
+        if self.noise.is_finished:
+            node = self.noise.decode_frame(frame)
+            if node['tag'] != 'iq':
+                return None
+            response = {'tag': 'iq', 'attrs': {'id': node['attrs']['id'], 'from': S_WHATSAPP_NET, 'type': 'result'}}
+            return b'\x00' + encode_binary_node(response)
+
+        message = HandshakeMessage()
+        message.ParseFromString(bytes(frame))
+        if message.HasField('clientHello'):
+            return self._server_hello(message.clientHello.ephemeral)
+        self._client_finish(message.clientFinish)
+        return None
+
+    def _server_hello(self, client_ephemeral: bytes) -> bytes:
+        noise = self.noise
+        noise.authenticate(client_ephemeral)
+        noise.authenticate(self.ephemeral_key_pair.public)
+        noise.mix_into_key(x25519_shared_key(self.ephemeral_key_pair.private, client_ephemeral))
+        static = noise.encrypt(self.static_key_pair.public)
+        noise.mix_into_key(x25519_shared_key(self.static_key_pair.private, client_ephemeral))
+
+        details = CertChain.NoiseCertificate.Details(issuerSerial=self.issuer_serial).SerializeToString()
+        cert = CertChain(intermediate=CertChain.NoiseCertificate(details=details)).SerializeToString()
+        hello = HandshakeMessage.ServerHello(ephemeral=self.ephemeral_key_pair.public, static=static, payload=noise.encrypt(cert))
+        return HandshakeMessage(serverHello=hello).SerializeToString()
+
+    def _client_finish(self, finish: HandshakeMessage.ClientFinish) -> None:
+        noise = self.noise
+        self.client_static = noise.decrypt(finish.static)
+        noise.mix_into_key(x25519_shared_key(self.ephemeral_key_pair.private, self.client_static))
+        self.client_payload = noise.decrypt(finish.payload)
+        noise.finish_init()
+
+
+def noise_handshake(client_payload: bytes = b'', responder: Optional[NoiseResponder] = None, noise_key=None) -> tuple:
+    """
+    Run the whole XX handshake between a client `NoiseHandler` and a
+    `NoiseResponder` in memory. Returns both ends, ready for transport frames.
+    """
+    responder = responder or NoiseResponder()
+    noise_key = noise_key or generate_x25519_key_pair()
+    ephemeral_key_pair = generate_x25519_key_pair()
+    client = NoiseHandler(ephemeral_key_pair, NOISE_WA_HEADER)
+    client_frames = FrameReassembler()
+
+    hello = HandshakeMessage(clientHello=HandshakeMessage.ClientHello(ephemeral=ephemeral_key_pair.public))
+    [server_hello] = responder.receive(client.encode_frame(hello.SerializeToString()))
+    [frame] = client_frames.feed(server_hello)
+    handshake = HandshakeMessage()
+    handshake.ParseFromString(client.decode_frame(frame))
+
+    key_enc = client.process_handshake(handshake.serverHello, noise_key)
+    finish = HandshakeMessage.ClientFinish(static=key_enc, payload=client.encrypt(client_payload))
+    responder.receive(client.encode_frame(HandshakeMessage(clientFinish=finish).SerializeToString()))
+    client.finish_init()
+    return client, responder
@@ -0,0 +1,129 @@
+import random
+import pytest
+from models.other_models import BinaryNodeDecoder, decode_binary_node, encode_binary_node, encode_binary_node_into
+from wabinary.corpus import load_corpus
+
+WORDS = ('iq', 'message', 'receipt', 'user', 'list', 'id', 'type', 'to', 'from', 'xmlns', 'custom-tag', 'x')
+
+
+def random_value(rng):
+    kind = rng.randrange(6)
+    if kind == 0:
+        return rng.choice(WORDS)
+    elif kind == 1:
+        return str(rng.randrange(10 ** rng.randrange(1, 20)))
+    elif kind == 2:
+        return '3EB0' + rng.randbytes(rng.randrange(1, 12)).hex().upper()
+    elif kind == 3:
+        # device JIDs only exist on the user servers, the wire format has no server field for them
+        if rng.random() < 0.5:
+            return f"{rng.randrange(10 ** 10, 10 ** 13)}:{rng.randrange(1, 99)}@{rng.choice(('s.whatsapp.net', 'lid'))}"
+        return f"{rng.randrange(10 ** 10, 10 ** 13)}@{rng.choice(('s.whatsapp.net', 'g.us', 'lid'))}"
+    elif kind == 4:
+        return ''.join(rng.choice('abcxyz ÄéΩ') for _ in range(rng.randrange(1, 300)))
+    return ''
+
+
+def random_node(rng, depth=0):
+    node = {
+        'tag': rng.choice(WORDS),
+        'attrs': {rng.choice(WORDS): random_value(rng) for _ in range(rng.randrange(4))},
+    }
+    kind = rng.randrange(4)
+    if kind == 1:
+        node['content'] = rng.randbytes(rng.choice((0, 5, 300, 70000)))
+    elif kind == 2:
+        node['content'] = random_value(rng)
+    elif kind == 3 and depth < 4:
+        node['content'] = [random_node(rng, depth + 1) for _ in range(rng.choice((0, 1, 3, 300 if depth == 0 else 2)))]
+    return node
+
+
+def normalized(node):
+    """
+    `node` with its content compared by value. Byte content decodes to a
+    memoryview, and string content that isn't a token or JID is written as
+    plain bytes, so both are compared as bytes.
+    """
+    content = node.get('content')
+    result = {'tag': node['tag'], 'attrs': dict(node['attrs'])}
+    if isinstance(content, list):
+        result['content'] = [normalized(child) for child in content]
+    elif isinstance(content, (bytes, bytearray, memoryview)):
+        result['content'] = bytes(content)
+    elif isinstance(content, str):
+        result['content'] = content.encode()
+    return result
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_random_nodes_round_trip(seed):
+    node = random_node(random.Random(seed))
+    encoded = encode_binary_node(node)
+    decoded = decode_binary_node(encoded)
+    assert normalized(decoded) == normalized(node)
+    assert encode_binary_node(decoded) == encoded
+
+
+@pytest.mark.parametrize('name, node', load_corpus().items())
+def test_corpus_round_trip(name, node):
+    encoded = encode_binary_node(node)
+    assert normalized(decode_binary_node(encoded)) == normalized(node)
+
+
+def test_byte_content_is_a_view():
+    encoded = encode_binary_node({'tag': 'enc', 'attrs': {}, 'content': b'payload'})
+    content = decode_binary_node(encoded)['content']
+    assert isinstance(content, memoryview)
+    assert content.obj is encoded
+
+
+def test_nodes_read_back_to_back():
+    rng = random.Random(99)
+    nodes = [random_node(rng) for _ in range(10)]
+    buffer = b''.join(encode_binary_node(node) for node in nodes)
+
+    decoder = BinaryNodeDecoder(buffer)
+    assert [normalized(decoder.read_node()) for _ in nodes] == [normalized(node) for node in nodes]
+    assert decoder.offset == len(buffer)
+
+    second = len(encode_binary_node(nodes[0]))
+    assert normalized(decode_binary_node(buffer, offset=second)) == normalized(nodes[1])
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_truncated_input_raises(seed):
+    encoded = encode_binary_node(random_node(random.Random(seed)))
+    for end in random.Random(seed).sample(range(len(encoded)), min(len(encoded), 200)):
+        with pytest.raises(ValueError):
+            decode_binary_node(encoded[:end])
+
+
+def test_corrupted_input_fails_cleanly():
+    rng = random.Random(7)
+    encoded = bytearray(encode_binary_node(load_corpus(['usync_result'])['usync_result']))
+    for _ in range(300):
+        corrupted = bytearray(encoded)
+        for _ in range(rng.randrange(1, 4)):
+            corrupted[rng.randrange(len(corrupted))] = rng.randrange(256)
+        try:
+            decode_binary_node(corrupted)
+        except ValueError:
+            pass
+
+
+def test_encode_into_appends_to_the_buffer():
+    node = load_corpus(['iq_ping'])['iq_ping']
+    encoded = encode_binary_node(node)
+    buffer = bytearray(b'\x00')
+    assert encode_binary_node_into(node, buffer) is buffer
+    encode_binary_node_into(node, buffer)
+    assert buffer == b'\x00' + encoded + encoded
+
+
+def test_encode_calls_share_no_buffer():
+    node = load_corpus(['message'])['message']
+    first = encode_binary_node(node)
+    assert encode_binary_node(node) == first
+    assert encode_binary_node(node, buffer=bytearray(b'\x00')) == b'\x00' + first
+    assert encode_binary_node(node) == first
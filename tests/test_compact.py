@@ -0,0 +1,47 @@
+import pytest
+from models.other_models import CompactBinaryNode, decode_binary_node, encode_binary_node
+from wabinary.corpus import load_corpus
+from wabinary.generic import binary_node_to_dict, get_binary_node_child, get_binary_node_child_buffer, get_binary_node_children
+
+
+@pytest.mark.parametrize('name, node', load_corpus().items())
+def test_compact_decode_matches_dict(name, node):
+    encoded = encode_binary_node(node)
+    compact = decode_binary_node(encoded, compact=True)
+    assert compact == decode_binary_node(encoded)
+    assert encode_binary_node(compact) == encoded
+    assert encode_binary_node(CompactBinaryNode.from_node(node)) == encoded
+
+
+def test_decoded_tree_is_compact():
+    node = decode_binary_node(encode_binary_node(load_corpus(['receipt'])['receipt']), compact=True)
+    assert isinstance(node, CompactBinaryNode)
+    assert all(isinstance(item, CompactBinaryNode) for item in node.content[0].content)
+    assert node.content[0].content[0].content is None
+
+
+def test_mapping_interface():
+    node = CompactBinaryNode('iq', {'id': '1'})
+    assert node.tag == node['tag'] == 'iq'
+    assert list(node) == ['tag', 'attrs'] and len(node) == 2
+    assert 'content' not in node and node.get('content') is None
+    with pytest.raises(KeyError):
+        node['content']
+
+    node['content'] = b'\x01'
+    assert dict(node) == {'tag': 'iq', 'attrs': {'id': '1'}, 'content': b'\x01'}
+    del node['content']
+    assert node == {'tag': 'iq', 'attrs': {'id': '1'}}
+
+    with pytest.raises(KeyError):
+        node['other'] = 1
+    with pytest.raises(AttributeError):
+        node.other = 1
+
+
+def test_generic_helpers():
+    node = load_corpus(['pre_key_upload'])['pre_key_upload']
+    compact = CompactBinaryNode.from_node(node)
+    assert get_binary_node_child_buffer(compact, 'identity') == get_binary_node_child_buffer(node, 'identity')
+    assert len(get_binary_node_children(get_binary_node_child(compact, 'list'), 'key')) == 30
+    assert binary_node_to_dict(compact) == binary_node_to_dict(node)
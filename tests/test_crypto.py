@@ -0,0 +1,80 @@
+import os
+import pytest
+from cryptography.exceptions import InvalidTag
+
+# crypto_utils imports the generated protobuf modules through models and defaults
+crypto = pytest.importorskip('utils.crypto_utils', exc_type=ImportError)
+AesGcmContext = crypto.AesGcmContext
+GCM_TAG_SIZE = crypto.GCM_TAG_SIZE
+
+KEY = bytes(range(32))
+AAD = b'associated data'
+
+
+def iv(counter):
+    return counter.to_bytes(12, 'big')
+
+
+@pytest.fixture(params=[True, False], ids=['encrypt_into', 'fallback'])
+def has_encrypt_into(request, monkeypatch):
+    # cryptography releases without AESGCM.encrypt_into take the copying path
+    monkeypatch.setattr(crypto, '_HAS_ENCRYPT_INTO', request.param and crypto._HAS_ENCRYPT_INTO)
+    return request.param
+
+
+@pytest.mark.parametrize('size', [0, 1, 64, 70_000])
+def test_parity_with_the_per_call_functions(size):
+    context = AesGcmContext(KEY)
+    plaintext = os.urandom(size)
+    ciphertext = context.encrypt(iv(7), plaintext, AAD)
+    assert ciphertext == crypto.aes_encrypt_gcm(plaintext, KEY, iv(7), AAD)
+    assert len(ciphertext) == size + GCM_TAG_SIZE
+    assert context.decrypt(iv(7), ciphertext, AAD) == plaintext
+    assert crypto.aes_decrypt_gcm(ciphertext, KEY, iv(7), AAD) == plaintext
+
+    with pytest.raises(InvalidTag):
+        context.decrypt(iv(8), ciphertext, AAD)
+    with pytest.raises(InvalidTag):
+        context.decrypt(iv(7), ciphertext, b'other data')
+
+
+@pytest.mark.parametrize('spare', [0, 1, 4096], ids=['exact', 'larger', 'much larger'])
+def test_encrypt_into(has_encrypt_into, spare):
+    context = AesGcmContext(KEY)
+    plaintext = os.urandom(3000)
+    out = bytearray(b'\xff' * (len(plaintext) + GCM_TAG_SIZE + spare))
+    assert context.encrypt_into(iv(1), plaintext, AAD, out) == len(plaintext) + GCM_TAG_SIZE
+    assert out[:len(plaintext) + GCM_TAG_SIZE] == context.encrypt(iv(1), plaintext, AAD)
+    # nothing past the ciphertext is touched
+    assert out[len(plaintext) + GCM_TAG_SIZE:] == b'\xff' * spare
+
+    # into a view at an offset, as the noise handler writes frames into a batch
+    batch = bytearray(10 + len(out))
+    context.encrypt_into(iv(1), plaintext, AAD, memoryview(batch)[10:])
+    assert batch[10:10 + len(plaintext) + GCM_TAG_SIZE] == out[:len(plaintext) + GCM_TAG_SIZE]
+
+
+def test_encrypt_into_undersized_buffer(has_encrypt_into):
+    context = AesGcmContext(KEY)
+    with pytest.raises(ValueError):
+        context.encrypt_into(iv(1), bytes(100), AAD, bytearray(100 + GCM_TAG_SIZE - 1))
+
+
+@pytest.mark.parametrize('sizes', [[], [0], [64] * 50, [1, 2048, 0, 70_000, 15]])
+def test_encrypt_many_matches_encrypt(has_encrypt_into, sizes):
+    context = AesGcmContext(KEY)
+    plaintexts = [os.urandom(size) for size in sizes]
+    ivs = [iv(i) for i in range(len(sizes))]
+    expected = b''.join(context.encrypt(nonce, plaintext, AAD) for nonce, plaintext in zip(ivs, plaintexts))
+    assert context.encrypt_many(ivs, plaintexts, AAD) == expected
+
+    # a larger reused buffer: only the written part comes back
+    out = bytearray(len(expected) + 100)
+    assert bytes(context.encrypt_many(ivs, plaintexts, AAD, out)) == expected
+    assert out[:len(expected)] == expected
+
+
+def test_encrypt_many_undersized_buffer():
+    context = AesGcmContext(KEY)
+    with pytest.raises(ValueError, match='too small'):
+        context.encrypt_many([iv(0), iv(1)], [b'a', b'b'], AAD, bytearray(2 * GCM_TAG_SIZE + 1))
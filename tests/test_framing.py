@@ -0,0 +1,101 @@
+import random
+import pytest
+from src.socket.client.framing import FRAME_HEADER_SIZE, MAX_FRAME_SIZE, FrameReassembler, FrameWriter
+
+# intro headers shaped like NOISE_WA_HEADER and MOBILE_NOISE_HEADER; defaults.defaults
+# pulls in the generated protobufs, which the reassembler doesn't need
+NOISE_WA_HEADER = b'WA\x06\x02'
+MOBILE_NOISE_HEADER = b'WA\x05\x02\x01'
+
+
+def random_frames(rng, count):
+    # mostly small frames, with the odd one larger than a single read
+    sizes = [rng.choice((0, 1, 2, 3, 17, 300)) if rng.random() < 0.3 else rng.randint(0, 2048) for _ in range(count)]
+    sizes[rng.randrange(count)] = rng.randint(64 * 1024, 300 * 1024)
+    return [rng.randbytes(size) for size in sizes]
+
+
+def receive(reassembler, chunk, rng):
+    """Pass `chunk` through `feed` or the `get_buffer`/`advance` path, copying each frame straight away."""
+    if rng.random() < 0.5:
+        return [bytes(frame) for frame in reassembler.feed(chunk)]
+    received = []
+    while chunk:
+        buffer = reassembler.get_buffer(-1)
+        n = min(len(buffer), len(chunk))
+        buffer[:n] = chunk[:n]
+        chunk = chunk[n:]
+        received += [bytes(frame) for frame in reassembler.advance(n)]
+    return received
+
+
+@pytest.mark.parametrize('seed', range(60))
+def test_stream_cut_at_random_points(seed):
+    rng = random.Random(seed)
+    frames = random_frames(rng, rng.randint(1, 60))
+    intro = rng.choice((None, NOISE_WA_HEADER, MOBILE_NOISE_HEADER))
+    writer = FrameWriter(intro)
+    stream = b''.join(writer.encode(frame) for frame in frames)
+
+    cuts = sorted(rng.sample(range(1, len(stream)), min(len(stream) - 1, rng.randint(0, 40))))
+    reassembler = FrameReassembler(intro, initial_size=rng.choice((64, 4096, 64 * 1024)))
+    received = []
+    for start, end in zip([0] + cuts, cuts + [len(stream)]):
+        received += receive(reassembler, stream[start:end], rng)
+
+    assert received == frames
+    assert reassembler.pending == 0
+
+
+def test_byte_at_a_time():
+    frames = [b'', b'a', b'bc' * 300]
+    stream = b''.join(map(FrameWriter().encode, frames))
+    reassembler = FrameReassembler(initial_size=16)
+    received = []
+    for i in range(len(stream)):
+        received += [bytes(frame) for frame in reassembler.feed(stream[i:i + 1])]
+    assert received == frames
+
+
+def test_several_frames_in_one_read():
+    writer = FrameWriter()
+    reassembler = FrameReassembler()
+    frames = reassembler.feed(b''.join(writer.encode(bytes([i]) * i) for i in range(5)) + b'\x00\x00')
+    assert all(isinstance(frame, memoryview) for frame in frames)
+    assert [bytes(frame) for frame in frames] == [bytes([i]) * i for i in range(5)]
+    assert reassembler.pending == 2
+
+
+def test_single_message_is_not_copied():
+    message = FrameWriter().encode(b'payload')
+    frame = FrameReassembler().feed(message)[0]
+    assert frame.obj is message and bytes(frame) == b'payload'
+
+
+def test_intro_stripped_once():
+    reassembler = FrameReassembler(NOISE_WA_HEADER)
+    assert reassembler.feed(NOISE_WA_HEADER[:2]) == []
+    frames = reassembler.feed(NOISE_WA_HEADER[2:] + FrameWriter().encode(NOISE_WA_HEADER))
+    assert [bytes(frame) for frame in frames] == [NOISE_WA_HEADER]
+
+
+def test_wrong_intro_rejected():
+    with pytest.raises(ValueError):
+        FrameReassembler(NOISE_WA_HEADER).feed(MOBILE_NOISE_HEADER + FrameWriter().encode(b'x'))
+
+
+def test_buffer_shrinks_after_a_large_frame():
+    reassembler = FrameReassembler(initial_size=64)
+    writer = FrameWriter()
+    large = writer.encode(bytes(100 * 1024))
+    assert reassembler.feed(large[:10]) == []
+    assert len(reassembler.feed(large[10:])[0]) == 100 * 1024
+    assert len(reassembler._buffer) == 64
+
+
+def test_writer_prefixes_length_and_intro_once():
+    writer = FrameWriter(MOBILE_NOISE_HEADER)
+    assert writer.encode(b'abc') == MOBILE_NOISE_HEADER + b'\x00\x00\x03abc'
+    assert writer.encode(b'') == bytes(FRAME_HEADER_SIZE)
+    with pytest.raises(ValueError):
+        writer.encode(bytes(MAX_FRAME_SIZE + 1))
@@ -0,0 +1,97 @@
+import json
+from models.other_models import CompactBinaryNode, decode_binary_node, decode_binary_node_lazy, encode_binary_node
+from wabinary.generic import get_binary_node_child, get_binary_node_child_index, get_binary_node_children
+
+
+def user_list(count=10):
+    return {
+        'tag': 'list',
+        'attrs': {},
+        'content': [
+            {'tag': 'user' if i % 2 else 'device', 'attrs': {'jid': f'{i}@s.whatsapp.net'}}
+            for i in range(count)
+        ],
+    }
+
+
+def test_lookup_matches_scan():
+    node = user_list()
+    assert get_binary_node_child(node, 'user') is node['content'][1]
+    assert get_binary_node_children(node, 'device') == node['content'][0::2]
+    assert get_binary_node_child(node, 'missing') is None
+    assert get_binary_node_children(node, 'missing') == []
+
+
+def test_index_leaves_node_untouched():
+    node = user_list()
+    twin = user_list()
+    before = json.dumps(node)
+    get_binary_node_child(node, 'user')
+    assert node == twin
+    assert list(node) == ['tag', 'attrs', 'content']
+    assert json.dumps(node) == before
+
+
+def test_child_replaced_in_place():
+    node = user_list()
+    old = node['content'][1]
+    get_binary_node_child(node, 'user')
+    node['content'][1] = {'tag': 'lid', 'attrs': {}}
+    assert get_binary_node_child(node, 'user') is node['content'][3]
+    assert old not in get_binary_node_children(node, 'user')
+    assert get_binary_node_child(node, 'lid') is node['content'][1]
+
+
+def test_child_swapped_keeps_length():
+    node = user_list()
+    get_binary_node_children(node, 'user')
+    content = node['content']
+    content[0], content[1] = content[1], content[0]
+    assert get_binary_node_child(node, 'user') is content[0]
+
+
+def test_children_added_and_removed():
+    node = user_list()
+    assert len(get_binary_node_children(node, 'user')) == 5
+    node['content'].append({'tag': 'user', 'attrs': {}})
+    assert len(get_binary_node_children(node, 'user')) == 6
+    del node['content'][1]
+    assert len(get_binary_node_children(node, 'user')) == 5
+    node['content'] = [{'tag': 'user', 'attrs': {}}] * 4
+    assert len(get_binary_node_children(node, 'user')) == 4
+
+
+def test_returned_list_is_a_copy():
+    node = user_list()
+    get_binary_node_children(node, 'user').clear()
+    assert len(get_binary_node_children(node, 'user')) == 5
+
+
+def test_child_index_groups_by_tag():
+    node = user_list()
+    index = get_binary_node_child_index(node)
+    assert index['user'] == node['content'][1::2]
+    assert index['device'] == node['content'][0::2]
+    assert get_binary_node_child_index({'tag': 'x', 'attrs': {}}) == {}
+    assert get_binary_node_child_index(None) == {}
+
+
+def test_equal_replacement_is_returned():
+    node = user_list()
+    get_binary_node_child(node, 'user')
+    replacement = dict(node['content'][1])
+    node['content'][1] = replacement
+    assert get_binary_node_child(node, 'user') is replacement
+
+
+def test_compact_and_lazy_nodes():
+    node = user_list()
+    compact = CompactBinaryNode.from_node(node)
+    assert get_binary_node_child(compact, 'user')['attrs'] == node['content'][1]['attrs']
+    compact.content[1] = CompactBinaryNode('lid')
+    assert get_binary_node_child(compact, 'lid') is compact.content[1]
+    assert get_binary_node_child(compact, 'user')['attrs'] == node['content'][3]['attrs']
+
+    lazy = decode_binary_node_lazy(encode_binary_node(node))
+    assert [child['attrs'] for child in get_binary_node_children(lazy, 'device')] == [child['attrs'] for child in node['content'][0::2]]
+    assert decode_binary_node(encode_binary_node(node)) == node
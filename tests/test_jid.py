@@ -0,0 +1,72 @@
+import pytest
+from models.other_models import decode_binary_node, encode_binary_node
+from wabinary import jid as jid_module
+from wabinary.jid import JID_DECODE_CACHE_SIZE, FullJid, jid_decode, jid_decode_many, jid_encode
+
+
+@pytest.mark.parametrize('jid, expected', [
+    ('123@s.whatsapp.net', FullJid('123', 's.whatsapp.net', None, 0)),
+    ('123:4@s.whatsapp.net', FullJid('123', 's.whatsapp.net', 4, 0)),
+    ('123_1:4@s.whatsapp.net', FullJid('123', 's.whatsapp.net', 4, 0)),
+    ('123_1@s.whatsapp.net', FullJid('123', 's.whatsapp.net', None, 0)),
+    ('98765:12@lid', FullJid('98765', 'lid', 12, 1)),
+    ('98765@lid', FullJid('98765', 'lid', None, 1)),
+    ('1203630-1612@g.us', FullJid('1203630-1612', 'g.us', None, 0)),
+    ('@s.whatsapp.net', FullJid('', 's.whatsapp.net', None, 0)),
+])
+def test_decode(jid, expected):
+    assert jid_decode(jid) == expected
+
+
+@pytest.mark.parametrize('jid', [None, '', 'plain text', '1:x@s.whatsapp.net', '1:²@s.whatsapp.net', '1:٣@s.whatsapp.net', '1:-2@s.whatsapp.net'])
+def test_decode_rejects(jid):
+    assert jid_decode(jid) is None
+
+
+def test_decode_is_cached_and_interned():
+    first = jid_decode('555:1@s.whatsapp.net')
+    assert jid_decode('555:1@s.whatsapp.net') is first
+    assert jid_decode('556@s.whatsapp.net').server is first.server
+
+
+def test_cache_is_bounded_and_skips_non_jids():
+    cache = jid_module._jid_decode
+    assert cache.cache_info().maxsize == JID_DECODE_CACHE_SIZE
+    before = cache.cache_info().currsize
+    for value in ('plain text', 'x' * 10, None, ''):
+        jid_decode(value)
+    assert cache.cache_info().currsize == before
+
+
+def test_encode_round_trip():
+    for jid in ('123@s.whatsapp.net', '123:4@s.whatsapp.net', '98765@lid'):
+        decoded = jid_decode(jid)
+        assert jid_encode(decoded.user, decoded.server, decoded.device) == jid
+
+
+@pytest.mark.parametrize('value', ['1:²@s.whatsapp.net', '1:x@s.whatsapp.net', '1:٣@lid'])
+def test_encoder_writes_unparseable_jids_as_strings(value):
+    node = {'tag': 'message', 'attrs': {'to': value}}
+    assert decode_binary_node(encode_binary_node(node)) == node
+
+
+def test_decode_many_columns():
+    columns = jid_decode_many(['1@s.whatsapp.net', '2:3@s.whatsapp.net', '4@lid', '5@c.us', '6-7@g.us'])
+    assert columns.users == ['1', '2', '4', '5', '6-7']
+    assert columns.devices == [None, 3, None, None, None]
+    assert columns.servers == ['s.whatsapp.net', 's.whatsapp.net', 'lid', 's.whatsapp.net', 'g.us']
+    assert columns.domain_types == [0, 0, 1, 0, 0]
+    assert columns.jids == ['1@s.whatsapp.net', '2:3@s.whatsapp.net', '4@lid', '5@s.whatsapp.net', '6-7@g.us']
+
+
+def test_decode_many_dedupes_after_normalising():
+    jids = ['1@c.us', '1@s.whatsapp.net', '1_2@s.whatsapp.net', '1:2@s.whatsapp.net', '1@lid', '1:2@s.whatsapp.net']
+    assert jid_decode_many(jids).jids == ['1@s.whatsapp.net', '1:2@s.whatsapp.net', '1@lid']
+    assert len(jid_decode_many(jids, dedupe=False).jids) == 6
+
+
+def test_decode_many_skips_invalid():
+    columns = jid_decode_many([None, '', 'plain', '1:x@s.whatsapp.net', '2@s.whatsapp.net'])
+    assert columns.jids == ['2@s.whatsapp.net']
+    assert all(len(column) == 1 for column in columns)
+    assert jid_decode_many(iter([])) == ([], [], [], [], [])
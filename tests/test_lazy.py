@@ -0,0 +1,76 @@
+import random
+import pytest
+from models.other_models import LazyBinaryNode, decode_binary_node, decode_binary_node_lazy, encode_binary_node
+from wabinary.corpus import load_corpus
+from wabinary.generic import get_binary_node_child, get_binary_node_child_buffer, get_binary_node_child_string, get_binary_node_children
+
+
+def device_list(count=50):
+    rng = random.Random(count)
+    return {
+        'tag': 'device-list',
+        'attrs': {'hash': '2:abc'},
+        'content': [
+            {'tag': 'device', 'attrs': {'id': str(i), 'key-index': str(rng.randrange(100))}, 'content': rng.randbytes(8)}
+            for i in range(count)
+        ] + [{'tag': 'name', 'attrs': {}, 'content': 'primary'}, {'tag': 'empty', 'attrs': {}}],
+    }
+
+
+@pytest.mark.parametrize('name, node', load_corpus().items())
+def test_lazy_matches_eager(name, node):
+    encoded = encode_binary_node(node)
+    lazy = decode_binary_node_lazy(encoded)
+    assert lazy == decode_binary_node(encoded)
+    assert lazy.materialize() == decode_binary_node(encoded)
+    assert encode_binary_node(lazy) == encoded
+
+
+def test_children_decoded_on_access():
+    lazy = decode_binary_node_lazy(encode_binary_node(device_list()))
+    children = lazy['content']
+    assert all(isinstance(child, LazyBinaryNode) for child in children)
+    assert children[3]['attrs']['id'] == '3'
+    assert children[2]._attrs is None
+    assert children[4]._tag is None
+
+
+def test_generic_helpers():
+    node = device_list()
+    lazy = decode_binary_node_lazy(encode_binary_node(node))
+    assert bytes(get_binary_node_child_buffer(lazy, 'device')) == node['content'][0]['content']
+    assert get_binary_node_child_string(lazy, 'name') == 'primary'
+    assert len(get_binary_node_children(lazy, 'device')) == 50
+    empty = get_binary_node_child(lazy, 'empty')
+    assert list(empty) == ['tag', 'attrs'] and empty.get('content') is None
+
+
+def test_offset_into_a_larger_buffer():
+    first, second = encode_binary_node(device_list(3)), encode_binary_node(device_list(5))
+    lazy = decode_binary_node_lazy(first + second, offset=len(first))
+    assert lazy == decode_binary_node(second)
+
+
+def test_truncated_buffer_raises_on_access():
+    encoded = encode_binary_node(device_list())
+    lazy = decode_binary_node_lazy(encoded[:len(encoded) // 2])
+    assert lazy.tag == 'device-list'
+    with pytest.raises(ValueError):
+        [child['attrs'] for child in lazy['content']]
+
+
+def test_child_lookup_stops_at_the_match():
+    encoded = encode_binary_node(device_list())
+    # cut inside the last children: a lookup that scanned on would hit the end of the buffer
+    lazy = decode_binary_node_lazy(encoded[:len(encoded) - 30])
+    assert get_binary_node_child(lazy, 'device')['attrs']['id'] == '0'
+    with pytest.raises(ValueError):
+        get_binary_node_child(lazy, 'empty')
+
+
+def test_iter_children_matches_content():
+    lazy = decode_binary_node_lazy(encode_binary_node(device_list()))
+    assert [child.tag for child in lazy.iter_children()] == [child['tag'] for child in device_list()['content']]
+    content = lazy.content
+    assert list(lazy.iter_children()) == content
+    assert list(decode_binary_node_lazy(encode_binary_node({'tag': 'x', 'attrs': {}, 'content': b'1'})).iter_children()) == []
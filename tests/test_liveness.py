@@ -0,0 +1,74 @@
+import asyncio
+from src.socket.liveness import LivenessScheduler, TimerWheel, percentiles
+
+
+def run_session(ping, ticks=6):
+    async def main():
+        scheduler = LivenessScheduler(TimerWheel(resolution=0.005))
+        failures = []
+        keep_alive = scheduler.register(ping, 0.01, failures.append)
+        await asyncio.sleep(ticks * 0.01)
+        keep_alive.stop()
+        return scheduler, keep_alive, failures
+    return asyncio.run(main())
+
+
+def test_answered_pings_are_sampled():
+    async def ping():
+        return None
+
+    scheduler, keep_alive, failures = run_session(ping)
+    assert keep_alive.pings_sent > 0
+    assert len(keep_alive.rtts) == keep_alive.pings_sent
+    assert len(scheduler.rtts) == keep_alive.pings_sent
+    assert not failures
+
+
+def test_unsent_ping_is_not_sampled():
+    calls = []
+
+    async def ping():
+        calls.append(1)
+        return False
+
+    scheduler, keep_alive, failures = run_session(ping)
+    assert calls
+    assert keep_alive.pings_sent == 0
+    assert not keep_alive.rtts and not scheduler.rtts
+    assert not failures
+
+
+def test_failed_ping_stops_the_session():
+    async def ping():
+        raise asyncio.TimeoutError()
+
+    scheduler, keep_alive, failures = run_session(ping)
+    assert len(failures) == 1
+    assert keep_alive.stopped
+    assert len(scheduler) == 0
+
+
+def test_received_frames_defer_the_ping():
+    calls = []
+
+    async def main():
+        scheduler = LivenessScheduler(TimerWheel(resolution=0.005))
+
+        async def ping():
+            calls.append(1)
+
+        keep_alive = scheduler.register(ping, 0.03)
+        for _ in range(10):
+            keep_alive.received()
+            await asyncio.sleep(0.01)
+        keep_alive.stop()
+        return keep_alive
+
+    keep_alive = asyncio.run(main())
+    assert not calls
+    assert keep_alive.pings_skipped > 0
+
+
+def test_percentiles():
+    assert percentiles([]) == {'p50': None, 'p90': None, 'p99': None}
+    assert percentiles(range(1, 101)) == {'p50': 50, 'p90': 90, 'p99': 99}
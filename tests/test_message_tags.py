@@ -0,0 +1,48 @@
+import re
+import threading
+from src.socket.message_tags import MessageTagAllocator, generate_tag_prefix
+
+
+def test_prefix_format():
+    for _ in range(200):
+        match = re.fullmatch(r'(\d+)\.(\d+)-', generate_tag_prefix())
+        assert match and all(int(part) < 1 << 16 for part in match.groups())
+    tags = MessageTagAllocator()
+    assert re.fullmatch(r'\d+\.\d+-1', tags.next())
+    assert MessageTagAllocator('abc.').next() == 'abc.1'
+
+
+def test_reserve_is_contiguous():
+    tags = MessageTagAllocator('p-', start=7)
+    assert tags.next() == 'p-7'
+    assert tags.reserve(3) == ['p-8', 'p-9', 'p-10']
+    assert tags.reserve(0) == []
+    assert tags.next() == 'p-11'
+    assert tags.epoch == 12
+
+
+def test_tags_are_unique_across_threads():
+    tags = MessageTagAllocator('p-')
+    issued = [[] for _ in range(8)]
+
+    def issue(out):
+        for i in range(5000):
+            out.append(tags.next())
+            if i % 1000 == 0:
+                out.extend(tags.reserve(100))
+
+    threads = [threading.Thread(target=issue, args=(out,)) for out in issued]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    every = [tag for out in issued for tag in out]
+    assert len(every) == len(set(every)) == 8 * 5500
+    assert tags.epoch == 8 * 5500 + 1
+
+
+def test_counter_does_not_wrap():
+    # past the 32 bit range the counter keeps going, so no tag is ever issued twice
+    tags = MessageTagAllocator('p-', start=(1 << 32) - 2)
+    assert tags.reserve(4) == [f'p-{(1 << 32) + i}' for i in range(-2, 2)]
+    assert tags.next() == f'p-{(1 << 32) + 2}'
@@ -0,0 +1,113 @@
+import asyncio
+from src.socket.client.framing import FrameWriter
+from src.socket.client.mobile_socket_client import MobileSocketClient
+
+
+async def serve(handler):
+    """Start `handler(reader, writer)` on a local port; returns the server and a connected client."""
+    server = await asyncio.start_server(handler, '127.0.0.1', 0)
+    client = MobileSocketClient(f"tcp://127.0.0.1:{server.sockets[0].getsockname()[1]}")
+    await client.connect()
+    assert client.is_open
+    return server, client
+
+
+async def wait_for(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, 'timed out'
+        await asyncio.sleep(0.005)
+
+
+def test_frames_split_across_reads():
+    frames = [bytes([i]) * size for i, size in enumerate((0, 1, 100, 3000, 70_000, 5))]
+    stream = b''.join(map(FrameWriter().encode, frames))
+
+    async def handler(reader, writer):
+        # in pieces, so headers and bodies are cut between reads
+        for offset in range(0, len(stream), 7777):
+            writer.write(stream[offset:offset + 7777])
+            await writer.drain()
+            await asyncio.sleep(0.001)
+        await reader.read()
+        writer.close()
+
+    async def main():
+        server, client = await serve(handler)
+        received, reads = [], []
+        client.on_frame = lambda frame: received.append(bytes(frame))
+        client.on_data = lambda view: reads.append(len(view))
+        await wait_for(lambda: len(received) == len(frames))
+        assert received == frames
+        assert len(reads) > 1 and sum(reads) == len(stream)
+        assert client.frames.pending == 0
+
+        await client.close()
+        server.close()
+        await server.wait_closed()
+    asyncio.run(main())
+
+
+def test_send_waits_while_writing_is_paused():
+    async def main():
+        reading = asyncio.Event()
+        received = 0
+
+        async def handler(reader, writer):
+            nonlocal received
+            await reading.wait()
+            while data := await reader.read(1024 * 1024):
+                received += len(data)
+            writer.close()
+
+        server, client = await serve(handler)
+        client.transport.set_write_buffer_limits(high=64 * 1024)
+        drains = []
+        client.on('drain', lambda: drains.append(True))
+
+        # more than the kernel buffers hold while the server doesn't read
+        payload = bytes(32 * 1024 * 1024)
+        sending = asyncio.ensure_future(client.send(payload))
+        await wait_for(lambda: client.protocol.paused)
+        await asyncio.sleep(0.05)
+        assert not sending.done()
+
+        reading.set()
+        assert await sending
+        assert not client.protocol.paused
+        await wait_for(lambda: drains)
+
+        await client.close()
+        await wait_for(lambda: received == len(payload))
+        server.close()
+        await server.wait_closed()
+    asyncio.run(main())
+
+
+def test_connection_lost_emits_close_and_fails_sends():
+    async def main():
+        dropped = asyncio.Event()
+
+        async def handler(reader, writer):
+            await dropped.wait()
+            writer.transport.abort()
+
+        server, client = await serve(handler)
+        client.transport.set_write_buffer_limits(high=64 * 1024)
+        closes = []
+        client.on('close', lambda: closes.append(True))
+
+        # a sender waiting in drain() is woken with the failure
+        waiting = asyncio.ensure_future(client.send(bytes(32 * 1024 * 1024)))
+        await wait_for(lambda: client.protocol.paused)
+        dropped.set()
+        assert await waiting is False
+
+        await wait_for(lambda: closes)
+        assert client.is_closed and not client.is_open
+        assert await client.send(b'late') is False
+        assert await client.send_many([b'a', b'b']) is False
+
+        server.close()
+        await server.wait_closed()
+    asyncio.run(main())
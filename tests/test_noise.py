@@ -0,0 +1,92 @@
+import pytest
+from cryptography.exceptions import InvalidTag
+
+# needs the generated protobuf modules the handshake imports
+noise_module = pytest.importorskip('src.socket.noise_handler', exc_type=ImportError)
+from models.other_models import encode_binary_node
+from utils.crypto_utils import generate_x25519_key_pair
+from wabinary.jid import S_WHATSAPP_NET
+from src.socket.client.framing import FrameReassembler
+from tests.noise_peer import NoiseResponder, noise_handshake
+
+ENCRYPT_INTO_MIN_SIZE = noise_module.ENCRYPT_INTO_MIN_SIZE
+generate_iv = noise_module.generate_iv
+
+
+def node_frame(msg_id):
+    return b'\x00' + encode_binary_node({'tag': 'iq', 'attrs': {'id': msg_id, 'to': S_WHATSAPP_NET, 'type': 'get'}})
+
+
+def receive(noise, data):
+    return [noise.decode_frame(frame) for frame in FrameReassembler().feed(data)]
+
+
+def test_handshake_agrees_on_static_key_and_payload():
+    noise_key = generate_x25519_key_pair()
+    client, responder = noise_handshake(b'client payload', noise_key=noise_key)
+    assert responder.client_static == noise_key.public
+    assert responder.client_payload == b'client payload'
+    assert client.is_finished and responder.noise.is_finished
+
+    [reply] = responder.receive(client.encode_frame(node_frame('q-1')))
+    [response] = receive(client, reply)
+    assert response['attrs'] == {'id': 'q-1', 'from': S_WHATSAPP_NET, 'type': 'result'}
+
+
+def test_counters_are_nonces_per_direction():
+    client, responder = noise_handshake()
+    assert generate_iv(5) == bytes(11) + b'\x05'
+    assert (client.write_counter, client.read_counter) == (0, 0)
+
+    replies = [reply for i in range(3) for reply in responder.receive(client.encode_frame(node_frame(f'q-{i}')))]
+    assert (client.write_counter, client.read_counter) == (3, 0)
+    assert (responder.noise.read_counter, responder.noise.write_counter) == (3, 3)
+
+    # replies decrypt with the client's read counter, which the sends above left at 0
+    assert [receive(client, reply)[0]['attrs']['id'] for reply in replies] == ['q-0', 'q-1', 'q-2']
+    assert (client.write_counter, client.read_counter) == (3, 3)
+
+
+def test_frame_out_of_order_is_rejected():
+    client, responder = noise_handshake()
+    first, second = client.encode_frame(node_frame('q-0')), client.encode_frame(node_frame('q-1'))
+    with pytest.raises(InvalidTag):
+        responder.receive(second + first)
+
+
+def test_tampered_frame_is_rejected():
+    client, responder = noise_handshake()
+    frame = bytearray(client.encode_frame(node_frame('q-0')))
+    frame[-1] ^= 1
+    with pytest.raises(InvalidTag):
+        responder.receive(bytes(frame))
+
+
+def test_wrong_issuer_serial_is_rejected():
+    with pytest.raises(ValueError, match='certification match failed'):
+        noise_handshake(responder=NoiseResponder(issuer_serial=1))
+
+
+@pytest.mark.parametrize('sizes', [
+    [],
+    [27, 0, 300],
+    [27, ENCRYPT_INTO_MIN_SIZE, 5, 3 * ENCRYPT_INTO_MIN_SIZE],
+    [ENCRYPT_INTO_MIN_SIZE - 16, ENCRYPT_INTO_MIN_SIZE - 17],
+])
+def test_encode_frames_matches_encode_frame(sizes):
+    client, responder = noise_handshake()
+    frames = [bytes([i]) * size for i, size in enumerate(sizes)]
+    batch = client.encode_frames(frames)
+
+    # after the handshake the associated data is fixed, so rewinding the counter repeats the ciphertexts
+    client.write_counter -= len(frames)
+    assert bytes(batch) == b''.join(map(client.encode_frame, frames))
+    assert client.write_counter == len(frames)
+    assert [responder.noise.decrypt(frame) for frame in responder.frames.feed(batch)] == frames
+
+
+def test_handshake_frames_are_not_encrypted():
+    client = noise_module.NoiseHandler(generate_x25519_key_pair(), b'WA\x06\x02')
+    assert client.encode_frame(b'hello') == b'WA\x06\x02\x00\x00\x05hello'
+    assert client.encode_frames([b'a', b'bc']) == b'\x00\x00\x01a\x00\x00\x02bc'
+    assert client.decode_frame(memoryview(b'reply')) == b'reply'
@@ -0,0 +1,127 @@
+import random
+import pytest
+from models import other_models
+from models.other_models import (
+    BinaryNodeEncoder, classify_packed, decode_binary_node, encode_binary_node, encode_string,
+    pack_hex, pack_nibbles, unpack_hex, unpack_nibbles,
+)
+
+ALPHABET = '0123456789-.ABCDEFabcdefgz@:\0 ²é'
+
+
+def reference_classify(s):
+    packed = pack_nibbles(s)
+    if packed is not None:
+        return 'nibble', packed
+    packed = pack_hex(s)
+    if packed is not None:
+        return 'hex', packed
+    return None, None
+
+
+@pytest.mark.parametrize('s, expected', [
+    ('', 'nibble'),
+    ('1700000000', 'nibble'),
+    ('+49-170.1', None),
+    ('49-170.1', 'nibble'),
+    ('3EB0A1B2C3D4E5F6', 'hex'),
+    ('3eb0a1', 'hex'),
+    ('12\0', 'hex'),
+    ('1-A', None),
+    ('123@s.whatsapp.net', None),
+    ('1²', None),
+    ('é', None),
+])
+def test_classify(s, expected):
+    assert classify_packed(s)[0] == expected
+
+
+def test_classify_matches_separate_packers():
+    rng = random.Random(4)
+    for _ in range(20000):
+        s = ''.join(rng.choice(ALPHABET) for _ in range(rng.randrange(12)))
+        assert classify_packed(s) == reference_classify(s), repr(s)
+
+
+def test_pack_round_trip():
+    rng = random.Random(5)
+    for _ in range(2000):
+        nibbles = ''.join(rng.choice('0123456789-.') for _ in range(rng.randrange(1, 40)))
+        assert unpack_nibbles(pack_nibbles(nibbles), len(nibbles) % 2 == 1) == nibbles
+        hex_ = ''.join(rng.choice('0123456789ABCDEF') for _ in range(rng.randrange(1, 40)))
+        assert unpack_hex(pack_hex(hex_), len(hex_) % 2 == 1) == hex_
+
+
+def reference_pack(s, values):
+    """Character by character packing, two 4-bit values per byte and a 0xF pad."""
+    codes = [values.index(c) if c != '\0' else 15 for c in s]
+    if len(codes) % 2:
+        codes.append(15)
+    return bytes(high << 4 | low for high, low in zip(codes[::2], codes[1::2]))
+
+
+@pytest.mark.parametrize('s', ['4915112345678', '491511234567', '-.'])
+def test_pack_nibbles_matches_reference(s):
+    assert pack_nibbles(s) == reference_pack(s, '0123456789-.')
+
+
+@pytest.mark.parametrize('s', ['3EB0A1B2C3D4E5F6', '3EB0A', 'F\0'])
+def test_pack_hex_matches_reference(s):
+    assert pack_hex(s) == reference_pack(s, '0123456789ABCDEF')
+
+
+@pytest.mark.parametrize('s', ['12g', '+49', '1 2', '١٢', '1²'])
+def test_pack_rejects_other_characters(s):
+    assert pack_nibbles(s) is None
+    assert pack_hex(s) is None
+
+
+def test_unpack_accepts_views():
+    packed = bytearray(pack_nibbles('4915112345678'))
+    assert unpack_nibbles(memoryview(packed), True) == '4915112345678'
+
+
+def test_unpack_rejects_invalid_nibble():
+    with pytest.raises(ValueError):
+        unpack_nibbles(b'\xc1')
+
+
+@pytest.mark.parametrize('value', ['1700000000', '3EB0A1B2C3D4E5F6', '123:4@s.whatsapp.net', 'hello', '', '-.-'])
+def test_packed_attribute_round_trip(value):
+    node = {'tag': 'iq', 'attrs': {'id': value}}
+    assert decode_binary_node(encode_binary_node(node)) == node
+
+
+def test_cached_encoding_matches_uncached():
+    for value in ('1700000000', '3EB0A1B2C3D4E5F6', '123:4@s.whatsapp.net', 'hello', 'x' * 200):
+        encoder = BinaryNodeEncoder()
+        encoder.write_string_uncached(value)
+        assert encode_string(value) == bytes(encoder.buffer)
+
+
+def test_string_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(other_models, 'STRING_CACHE_SIZE', 16)
+    monkeypatch.setattr(other_models, '_string_caches', {})
+    encoder = BinaryNodeEncoder()
+    values = [str(10 ** 9 + i) for i in range(100)] + ['%d@s.whatsapp.net' % i for i in range(100)]
+    for value in values:
+        encoder.write_string(value)
+    assert len(encoder.string_cache) <= 16
+    expected = BinaryNodeEncoder()
+    for value in values:
+        expected.write_string_uncached(value)
+    assert encoder.buffer == expected.buffer
+
+
+def test_string_cache_keeps_recently_used_entries(monkeypatch):
+    monkeypatch.setattr(other_models, 'STRING_CACHE_SIZE', 4)
+    monkeypatch.setattr(other_models, '_string_caches', {})
+    encoder = BinaryNodeEncoder()
+    own_jid = '491234567890@s.whatsapp.net'
+    encoder.write_string(own_jid)
+    # a value used on every stanza stays cached while a stream of one-off ids passes through
+    for i in range(20):
+        encoder.write_string(str(10 ** 9 + i))
+        encoder.write_string(own_jid)
+        assert own_jid in encoder.string_cache
+    assert list(encoder.string_cache) == [str(10 ** 9 + i) for i in range(17, 20)] + [own_jid]
@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+from src.socket.pending_queries import PendingQueryRegistry
+
+
+def run(test):
+    asyncio.run(test(PendingQueryRegistry()))
+
+
+def test_resolve_delivers_the_response():
+    async def test(queries):
+        wait = queries.register('q-1', 5000)
+        assert 'q-1' in queries and len(queries) == 1
+        assert queries.resolve('q-1', {'tag': 'iq'})
+        assert await wait == {'tag': 'iq'}
+        # the entry leaves from the future's done callback; a late duplicate answer matches nothing
+        await asyncio.sleep(0)
+        assert 'q-1' not in queries
+        assert not queries.resolve('q-1', {'tag': 'iq'})
+        assert queries.stats() == {'pending': 0, 'resolved': 1, 'timed_out': 0, 'unmatched': 1}
+    run(test)
+
+
+def test_timeout_reaps_the_entry():
+    async def test(queries):
+        slow = queries.register('q-1', 10)
+        fast = queries.register('q-2', 5000)
+        with pytest.raises(asyncio.TimeoutError, match='q-1'):
+            await slow
+        assert len(queries) == 1 and 'q-2' in queries
+        assert queries.stats()['timed_out'] == 1
+
+        timer = queries._pending['q-2'].timer
+        queries.resolve('q-2', 'ok')
+        assert await fast == 'ok'
+        # answering cancels the timer
+        await asyncio.sleep(0)
+        assert timer.cancelled()
+        assert queries.stats()['timed_out'] == 1
+    run(test)
+
+
+def test_cancelled_wait_leaves_the_table():
+    async def test(queries):
+        wait = queries.register('q-1')
+        wait.cancel()
+        await asyncio.sleep(0)
+        assert len(queries) == 0
+        # the id can be used again
+        queries.register('q-1').cancel()
+    run(test)
+
+
+def test_duplicate_id_is_rejected():
+    async def test(queries):
+        queries.register('q-1', 5000)
+        with pytest.raises(ValueError, match='already in flight'):
+            queries.register('q-1', 5000)
+        assert len(queries) == 1
+
+        debug = PendingQueryRegistry(debug=True)
+        debug.register('q-1')
+        with pytest.raises(ValueError, match='first registered at:(.|\n)*registered again at:'):
+            debug.register('q-1')
+        queries.reject_all(Exception('done'))
+        debug.reject_all(Exception('done'))
+    run(test)
+
+
+def test_reject_all_fails_every_waiter():
+    async def test(queries):
+        waits = [queries.register(f'q-{i}', 5000, node={'tag': 'iq', 'attrs': {'id': f'q-{i}'}}) for i in range(3)]
+        queries.resolve('q-1', 'ok')
+        assert [node['attrs']['id'] for node in queries.in_flight_nodes()] == ['q-0', 'q-2']
+
+        error = Exception('Connection Closed')
+        assert queries.reject_all(error) == 2
+        results = await asyncio.gather(*waits, return_exceptions=True)
+        assert results == [error, 'ok', error]
+        assert len(queries) == 0 and queries.in_flight_nodes() == []
+    run(test)
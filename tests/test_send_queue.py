@@ -0,0 +1,123 @@
+import asyncio
+import pytest
+from src.socket.send_queue import SendQueue
+
+
+class Writer:
+    """Records each write; while `gate` is cleared, writes wait for it."""
+
+    def __init__(self) -> None:
+        self.writes = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def __call__(self, frames):
+        await self.gate.wait()
+        self.writes.append(list(frames))
+
+
+def test_sends_in_one_tick_share_a_write():
+    async def main():
+        writer = Writer()
+        queue = SendQueue(writer)
+        await asyncio.gather(*(queue.send(bytes([i])) for i in range(10)))
+        assert writer.writes == [[bytes([i]) for i in range(10)]]
+
+        await queue.send_many([b'a', b'b'])
+        await queue.send(b'c')
+        assert writer.writes[1:] == [[b'a', b'b'], [b'c']]
+        assert queue.metrics()['flushes'] == 3 and queue.metrics()['frames_sent'] == 13
+    asyncio.run(main())
+
+
+def test_frames_queued_during_a_write_form_the_next_batch():
+    async def main():
+        writer = Writer()
+        writer.gate.clear()
+        queue = SendQueue(writer, max_batch_bytes=4)
+        first = asyncio.ensure_future(queue.send(b'1'))
+        await asyncio.sleep(0.01)
+        later = [asyncio.ensure_future(queue.send(frame)) for frame in (b'22', b'33', b'4')]
+        await asyncio.sleep(0)
+        assert queue.depth == 3
+
+        writer.gate.set()
+        await asyncio.gather(first, *later)
+        # the frames queued behind the write are split at max_batch_bytes
+        assert writer.writes == [[b'1'], [b'22', b'33'], [b'4']]
+    asyncio.run(main())
+
+
+def test_high_watermark_holds_senders_until_the_low_watermark():
+    async def main():
+        writer = Writer()
+        writer.gate.clear()
+        queue = SendQueue(writer, high_watermark=100, low_watermark=40, max_batch_bytes=30)
+        queued = [asyncio.ensure_future(queue.send(bytes(30))) for _ in range(4)]
+        await asyncio.sleep(0)
+        assert queue.queued_bytes == 120
+
+        held = asyncio.ensure_future(queue.send(b'late'))
+        await asyncio.sleep(0.01)
+        assert not held.done() and queue.queued_bytes == 120
+
+        # each write releases 30 bytes; at 60 the sender is still held, at 30 it gets in
+        writer.gate.set()
+        await held
+        assert writer.writes[-1] == [b'late']
+        await asyncio.gather(*queued)
+        assert queue.queued_bytes == 0
+
+    with pytest.raises(ValueError):
+        SendQueue(Writer(), high_watermark=10, low_watermark=20)
+    asyncio.run(main())
+
+
+def test_drain_waits_for_everything_queued():
+    async def main():
+        writer = Writer()
+        writer.gate.clear()
+        queue = SendQueue(writer)
+        await queue.drain()
+        for frame in (b'a', b'b'):
+            queue.enqueue(frame)
+
+        drained = asyncio.ensure_future(queue.drain())
+        await asyncio.sleep(0.01)
+        assert not drained.done()
+        writer.gate.set()
+        await drained
+        assert writer.writes == [[b'a', b'b']] and queue.depth == 0
+    asyncio.run(main())
+
+
+def test_close_fails_pending_senders():
+    async def main():
+        writer = Writer()
+        writer.gate.clear()
+        queue = SendQueue(writer, max_batch_bytes=1)
+        senders = [asyncio.ensure_future(queue.send(frame)) for frame in (b'a', b'b', b'c')]
+        await asyncio.sleep(0.01)
+
+        error = Exception('Connection Closed')
+        queue.close(error)
+        # the batch being written fails as well as the queued ones
+        assert await asyncio.gather(*senders, return_exceptions=True) == [error] * 3
+        assert queue.queued_bytes == 0
+        await queue.drain()
+        with pytest.raises(Exception, match='Connection Closed'):
+            await queue.send(b'd')
+        assert writer.writes == []
+    asyncio.run(main())
+
+
+def test_failed_write_fails_only_its_batch():
+    async def main():
+        async def write(frames):
+            if frames == [b'bad']:
+                raise OSError('write failed')
+
+        queue = SendQueue(write, max_batch_bytes=3)
+        results = await asyncio.gather(queue.send(b'bad'), queue.send(b'ok'), return_exceptions=True)
+        assert isinstance(results[0], OSError) and results[1] is None
+    asyncio.run(main())
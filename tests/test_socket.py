@@ -0,0 +1,368 @@
+import asyncio
+import dataclasses
+import pytest
+
+# needs the generated protobuf modules the socket imports
+socket_module = pytest.importorskip('src.socket.socket', exc_type=ImportError)
+from defaults.defaults import DEFAULT_CONNECTION_CONFIG
+from models.other_models import encode_binary_node
+from proto.waproto_pb2 import ClientPayload
+from wabinary.jid import S_WHATSAPP_NET
+
+from src.socket.client.framing import FrameReassembler
+from src.socket.reconnect import ReconnectPolicy
+from src.socket.session_manager import SessionManager
+from tests.noise_peer import NoiseResponder
+
+Socket = socket_module.Socket
+
+
+class FakeServer(NoiseResponder):
+    """Records the nodes it receives and answers each iq, except those listed in `drop`."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.drop = set()
+        self.received = []
+
+    def handle(self, frame):
+        if self.noise.is_finished:
+            node = self.noise.decode_frame(frame)
+            self.received.append(node)
+            if node['tag'] != 'iq' or node['attrs'].get('id') in self.drop:
+                return None
+            return b'\x00' + encode_binary_node({'tag': 'iq', 'attrs': {'id': node['attrs']['id'], 'from': S_WHATSAPP_NET, 'type': 'result'}})
+        return super().handle(frame)
+
+
+class FakeTransport:
+    """
+    Runs the noise handshake with a `FakeServer` and hands its replies,
+    `rtt_ms` later, to `on_frame` as the real clients do: reassembled,
+    still encrypted frames.
+    """
+
+    def __init__(self, rtt_ms: float = 1) -> None:
+        self._event_listeners = {}
+        self.rtt_ms = rtt_ms
+        self.server = FakeServer()
+        self.frames = FrameReassembler()
+        self.on_frame = None
+        self.writes = 0
+        self.is_open = False
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    @property
+    def drop(self):
+        return self.server.drop
+
+    @property
+    def received(self):
+        return self.server.received
+
+    is_closing = False
+    is_connecting = False
+
+    def on(self, event, listener):
+        self._event_listeners.setdefault(event, []).append(listener)
+
+    def emit(self, event, *args):
+        for listener in list(self._event_listeners.get(event, ())):
+            listener(*args)
+
+    def remove_listener(self, event, listener):
+        self._event_listeners.get(event, []).remove(listener)
+
+    def push(self, node):
+        """Send `node` from the server straight away."""
+        self._deliver(self.server.noise.encode_frame(b'\x00' + encode_binary_node(node)))
+
+    def _deliver(self, data):
+        if self.is_open and self.on_frame is not None:
+            for frame in self.frames.feed(data):
+                self.on_frame(frame)
+
+    def _receive(self, data):
+        for reply in self.server.receive(data):
+            asyncio.get_running_loop().call_later(self.rtt_ms / 1000, self._deliver, reply)
+
+    async def connect(self):
+        self.is_open = True
+
+    async def send(self, data):
+        if not self.is_open:
+            return False
+        self.writes += 1
+        self._receive(data)
+        return True
+
+    async def send_many(self, frames):
+        if not self.is_open:
+            return False
+        self.writes += 1
+        for data in frames:
+            self._receive(data)
+        return True
+
+    async def close(self):
+        if self.is_open:
+            self.is_open = False
+            self.emit('close')
+
+
+class FakeSocket(Socket):
+    connect_failures = 0
+
+    def _create_socket(self):
+        transport = FakeTransport()
+        self.__dict__.setdefault('transports', []).append(transport)
+        return transport
+
+    def _client_payload(self):
+        return ClientPayload(username=1)
+
+    async def connect(self):
+        if self.connect_failures:
+            self.connect_failures -= 1
+            raise Exception("Connection Failed")
+        await super().connect()
+
+
+def fast_policy(max_attempts=3):
+    return ReconnectPolicy(base_delay_ms=0, max_attempts=max_attempts, host_rate=1000, host_burst=1000)
+
+
+def make_socket(**options):
+    return FakeSocket(dataclasses.replace(DEFAULT_CONNECTION_CONFIG, auth=None, options=options))
+
+
+async def connected_socket(**options):
+    sock = make_socket(**options)
+    await sock.connect()
+    return sock
+
+
+def ping(msg_id=None):
+    attrs = {'to': S_WHATSAPP_NET, 'type': 'get', 'xmlns': 'w:p'}
+    if msg_id:
+        attrs['id'] = msg_id
+    return {'tag': 'iq', 'attrs': attrs, 'content': [{'tag': 'ping', 'attrs': {}}]}
+
+
+def test_query_many_returns_results_in_order():
+    async def main():
+        sock = await connected_socket()
+        results = await sock.query_many([ping(f'q-{i}') for i in range(50)], concurrency=8)
+        assert [result['attrs']['id'] for result in results] == [f'q-{i}' for i in range(50)]
+        # the first window goes out in one write
+        assert sock.ws.writes < 50
+    asyncio.run(main())
+
+
+def test_query_many_lost_response_only_holds_its_slot():
+    async def main():
+        sock = await connected_socket()
+        sock.ws.drop.add('q-0')
+        nodes = [ping(f'q-{i}') for i in range(40)]
+        task = asyncio.ensure_future(sock.query_many(nodes, concurrency=4, timeout_ms=2000))
+        # the other 39 queries are answered while q-0 is still waiting
+        for _ in range(200):
+            if len(sock.ws.received) == 40 and len(sock.pending_queries) == 1:
+                break
+            await asyncio.sleep(0.005)
+        assert len(sock.ws.received) == 40
+        assert len(sock.pending_queries) == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert len(sock.pending_queries) == 0
+    asyncio.run(main())
+
+
+def test_query_many_puts_failures_in_the_results():
+    async def main():
+        sock = await connected_socket()
+        sock.ws.drop.add('q-1')
+        results = await sock.query_many([ping(f'q-{i}') for i in range(3)], timeout_ms=50)
+        assert results[0]['attrs']['id'] == 'q-0'
+        assert isinstance(results[1], asyncio.TimeoutError)
+        assert results[2]['attrs']['id'] == 'q-2'
+    asyncio.run(main())
+
+
+def test_failed_write_fails_the_sender():
+    async def main():
+        sock = await connected_socket(auto_reconnect=False)
+        sock.ws.send_many = lambda frames: asyncio.sleep(0, False)
+        frames_sent = sock.send_queue.frames_sent
+        with pytest.raises(Exception, match='Connection Closed'):
+            await sock.query(ping('q-0'), timeout_ms=5000)
+        await asyncio.sleep(0)
+        assert sock.send_queue.frames_sent == frames_sent
+        assert len(sock.pending_queries) == 0
+        # the transport is dropped rather than carrying frames after the lost ones
+        assert not sock.ws.is_open
+    asyncio.run(main())
+
+
+def test_keep_alive_failure_reconnects():
+    async def main():
+        sock = await connected_socket(reconnect_policy=fast_policy())
+        old = sock.ws
+        sock._on_keep_alive_failed(asyncio.TimeoutError())
+        await sock.reconnect_task
+        assert not sock.closed
+        assert not old.is_open
+        assert sock.ws is not old and sock.ws.is_open
+        assert sock.keep_alive is not None
+        # the new connection carries queries
+        assert (await sock.query(ping('q-0')))['attrs']['id'] == 'q-0'
+        await sock.end()
+    asyncio.run(main())
+
+
+def test_keep_alive_failure_ends_once_reconnects_give_up():
+    async def main():
+        sock = await connected_socket(reconnect_policy=fast_policy(max_attempts=2))
+        sock.connect_failures = 2
+        sock._on_keep_alive_failed(asyncio.TimeoutError())
+        await sock.reconnect_task
+        assert sock.closed
+    asyncio.run(main())
+
+
+def test_keep_alive_failure_without_auto_reconnect_ends():
+    async def main():
+        sock = await connected_socket(auto_reconnect=False)
+        sock._on_keep_alive_failed(asyncio.TimeoutError())
+        assert sock.closed
+        assert sock.reconnect_task is None
+    asyncio.run(main())
+
+
+def test_end_closes_the_transport():
+    async def main():
+        sock = await connected_socket()
+        query = asyncio.ensure_future(sock.query(ping('q-0')))
+        await asyncio.sleep(0)
+        await sock.end()
+        assert sock.closed
+        assert not sock.ws.is_open
+        with pytest.raises(Exception, match='Connection Closed'):
+            await query
+    asyncio.run(main())
+
+
+def test_undecodable_frame_ends_the_socket():
+    class BrokenNoise:
+        is_finished = True
+
+        def decode_frame(self, frame):
+            raise ValueError('bad tag')
+
+    async def main():
+        sock = await connected_socket()
+        sock.noise = BrokenNoise()
+        sock._on_frame_data(b'\x00')
+        assert sock.closed
+        await sock._close_task
+        assert not sock.ws.is_open
+    asyncio.run(main())
+
+
+def test_session_manager_closes_transports():
+    async def main():
+        config = dataclasses.replace(DEFAULT_CONNECTION_CONFIG, auth=None)
+        manager = SessionManager(config, connect_interval_ms=0, socket_factory=FakeSocket)
+        socks = [manager.add_session(f'account-{i}') for i in range(3)]
+        assert not any((await manager.connect_all()).values())
+
+        await manager.remove_session('account-0')
+        assert socks[0].closed and not socks[0].ws.is_open
+        await manager.close()
+        assert all(sock.closed and not sock.ws.is_open for sock in socks)
+    asyncio.run(main())
+
+
+def test_listeners_survive_a_reconnect():
+    async def main():
+        sock = await connected_socket(reconnect_policy=fast_policy())
+        messages, closes = [], []
+        sock.on('CB:message', messages.append)
+        sock.on('close', lambda *args: closes.append(args))
+        message = {'tag': 'message', 'attrs': {'from': S_WHATSAPP_NET}}
+
+        sock.ws.push(message)
+        await sock.ws.close()
+        await sock.reconnect_task
+        sock.ws.push(message)
+        assert messages == [message, message]
+        assert len(closes) == 1
+    asyncio.run(main())
+
+
+def test_failed_reconnect_attempts_are_closed_and_ignored():
+    async def main():
+        sock = await connected_socket(reconnect_policy=fast_policy())
+        sock.connect_failures = 2
+        first = sock.ws
+        await first.close()
+        await sock.reconnect_task
+        current = sock.ws
+        assert len(sock.transports) == 4
+        assert current is sock.transports[-1] and current.is_open
+        assert not any(ws.is_open for ws in sock.transports[:-1])
+
+        # late events from replaced transports reach nobody
+        frames = []
+        sock.on('CB:message', frames.append)
+        for ws in sock.transports[:-1]:
+            ws.is_open = True
+            ws.push({'tag': 'message', 'attrs': {}})
+            await ws.close()
+        assert sock.reconnect_task is None
+        assert sock.ws is current
+        assert frames == []
+    asyncio.run(main())
+
+
+def test_node_frames_wait_for_the_handshake():
+    async def main():
+        sock = make_socket()
+        connecting = asyncio.ensure_future(sock.connect())
+        while not sock.ws.writes:
+            await asyncio.sleep(0)
+        # the transport is open, but the client hello is still waiting for its answer
+        assert sock.ws.is_open and not sock.noise.is_finished
+        with pytest.raises(Exception, match='Connection Not Ready'):
+            await sock.query(ping('q-0'))
+        await asyncio.sleep(0)
+        assert len(sock.pending_queries) == 0
+
+        await connecting
+        assert sock.ws.server.client_payload is not None
+        assert (await sock.query(ping('q-1')))['attrs']['id'] == 'q-1'
+        assert [node['attrs']['id'] for node in sock.ws.received] == ['q-1']
+    asyncio.run(main())
+
+
+def test_pending_queries_are_resent_after_the_new_handshake():
+    async def main():
+        sock = await connected_socket(reconnect_policy=fast_policy())
+        first = sock.ws
+        first.drop.add('q-0')
+        query = asyncio.ensure_future(sock.query(ping('q-0'), timeout_ms=5000))
+        while not first.received:
+            await asyncio.sleep(0)
+
+        await first.close()
+        await sock.reconnect_task
+        # the responder parses everything before its handshake ends as handshake messages,
+        # so a query sent early would have broken the handshake
+        assert sock.ws.server.noise.is_finished
+        assert (await query)['attrs']['id'] == 'q-0'
+        assert [node['attrs']['id'] for node in sock.ws.received] == ['q-0']
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+import asyncio
+import os
+from collections import Counter
+from src.socket.supervisor import Supervisor, pick_worker
+
+
+# Workers are spawned processes, so everything they run must be importable at
+# module level. The fake manager stands in for SessionManager: each session
+# reports 'open' with the pid of the worker running it.
+
+class FakeSession:
+    def __init__(self) -> None:
+        self.listeners = {}
+
+    def on(self, event, listener):
+        self.listeners.setdefault(event, []).append(listener)
+
+    def emit(self, event, *args):
+        for listener in self.listeners.get(event, ()):
+            listener(*args)
+
+
+class FakeManager:
+    def __init__(self) -> None:
+        self.sessions = {}
+
+    def add_session(self, account_id, config):
+        session = self.sessions[account_id] = FakeSession()
+        return session
+
+    async def connect(self, account_id):
+        self.sessions[account_id].emit('open', os.getpid())
+
+    async def remove_session(self, account_id):
+        self.sessions.pop(account_id, None)
+
+    async def close(self):
+        self.sessions.clear()
+
+
+def account_config(account_id):
+    return account_id
+
+
+async def wait_for(condition, timeout=30.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, 'timed out'
+        await asyncio.sleep(0.02)
+
+
+def run_supervisor(test, workers=2, respawn=True, accounts=8):
+    async def main():
+        opened = {}
+
+        def on_event(account_id, event, *args):
+            if event == 'open':
+                opened[account_id] = args[0]
+
+        supervisor = Supervisor(account_config, workers=workers, on_event=on_event, events=('open',), manager_factory=FakeManager, respawn=respawn)
+        await supervisor.start()
+        try:
+            for i in range(accounts):
+                supervisor.add_session(f'account-{i}')
+            await wait_for(lambda: len(opened) == accounts)
+            await test(supervisor, opened)
+        finally:
+            processes = [worker.process for worker in supervisor.workers.values()]
+            await supervisor.stop()
+        assert not any(process.is_alive() for process in processes)
+        assert supervisor.metrics()['workers'] == 0
+    asyncio.run(main())
+
+
+def running_on(supervisor, opened):
+    """Each account's worker index, as reported by the process that opened it."""
+    pids = {worker.process.pid: index for index, worker in supervisor.workers.items() if worker.alive}
+    return {account_id: pids.get(pid) for account_id, pid in opened.items()}
+
+
+def test_placement_is_stable_and_even():
+    accounts = [f'{491000000000 + i}@s.whatsapp.net' for i in range(4000)]
+    before = {account: pick_worker(account, range(4)) for account in accounts}
+    assert before == {account: pick_worker(account, [3, 2, 1, 0]) for account in accounts}
+    assert all(800 < count < 1200 for count in Counter(before.values()).values())
+
+    after = {account: pick_worker(account, [0, 1, 3]) for account in accounts}
+    moved = [account for account in accounts if before[account] != after[account]]
+    assert moved and all(before[account] == 2 for account in moved)
+    assert len(moved) == list(before.values()).count(2)
+
+
+def test_accounts_run_on_their_worker():
+    async def test(supervisor, opened):
+        assert running_on(supervisor, opened) == supervisor.assignments
+        assert sum(supervisor.metrics()['sessions_per_worker'].values()) == 8
+
+        supervisor.remove_session('account-0')
+        assert 'account-0' not in supervisor.assignments
+
+    run_supervisor(test)
+
+
+def test_dead_worker_is_replaced_and_its_accounts_move():
+    async def test(supervisor, opened):
+        victim = supervisor.workers[0]
+        orphans = sorted(victim.accounts)
+        assert orphans
+        opened.clear()
+        victim.process.kill()
+
+        await wait_for(lambda: len(opened) == len(orphans))
+        assert supervisor.restarts == 1 and supervisor.rebalanced == len(orphans)
+        assert sorted(opened) == orphans
+        # with a survivor around, the replacement takes no old accounts
+        assert all(supervisor.assignments[account] == 1 for account in orphans)
+        assert running_on(supervisor, opened) == {account: 1 for account in orphans}
+        assert supervisor.workers[0] is not victim and supervisor.workers[0].alive
+
+    run_supervisor(test, accounts=12)
+
+
+def test_stop_after_a_worker_died_without_respawn():
+    async def test(supervisor, opened):
+        victim = supervisor.workers[0]
+        opened.clear()
+        victim.process.kill()
+
+        await wait_for(lambda: not victim.alive)
+        await wait_for(lambda: len(opened) == supervisor.rebalanced)
+        assert supervisor.restarts == 0
+        assert supervisor.live_workers == [1, 2]
+        assert set(supervisor.assignments.values()) <= {1, 2}
+
+    run_supervisor(test, workers=3, respawn=False, accounts=12)
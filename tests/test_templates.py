@@ -0,0 +1,50 @@
+from models.other_models import BinaryNodeTemplateCache, binary_node_structure_key, encode_binary_node
+
+
+def ping(msg_id=None):
+    return {
+        'tag': 'iq',
+        'attrs': {'id': msg_id, 'to': 's.whatsapp.net', 'type': 'get', 'xmlns': 'w:p'},
+        'content': [{'tag': 'ping', 'attrs': {}}],
+    }
+
+
+def test_template_matches_full_encode():
+    cache = BinaryNodeTemplateCache()
+    for i in range(5):
+        node = ping(f'1234.{i}')
+        assert cache.encode(node) == encode_binary_node(node)
+    assert len(cache.templates) == 1
+
+
+def test_slot_presence_is_part_of_the_key():
+    assert binary_node_structure_key(ping(None), ('id',)) != binary_node_structure_key(ping('1'), ('id',))
+    assert binary_node_structure_key(ping('1'), ('id',)) == binary_node_structure_key(ping('2'), ('id',))
+
+
+def test_missing_id_cached_first():
+    cache = BinaryNodeTemplateCache()
+    assert cache.encode(ping(None)) == encode_binary_node(ping(None))
+    assert cache.encode(ping('abc.1')) == encode_binary_node(ping('abc.1'))
+
+
+def test_id_cached_first():
+    cache = BinaryNodeTemplateCache()
+    assert cache.encode(ping('abc.1')) == encode_binary_node(ping('abc.1'))
+    assert cache.encode(ping(None)) == encode_binary_node(ping(None))
+
+
+def test_absent_slot_attribute():
+    cache = BinaryNodeTemplateCache()
+    node = ping('abc.1')
+    bare = {**node, 'attrs': {k: v for k, v in node['attrs'].items() if k != 'id'}}
+    assert cache.encode(node) == encode_binary_node(node)
+    assert cache.encode(bare) == encode_binary_node(bare)
+
+
+def test_cache_is_bounded():
+    cache = BinaryNodeTemplateCache(maxsize=4)
+    for i in range(20):
+        node = {'tag': 'iq', 'attrs': {'id': str(i), 'type': 'get'}, 'content': [{'tag': f'child{i}', 'attrs': {}}]}
+        assert cache.encode(node) == encode_binary_node(node)
+    assert len(cache.templates) == 4